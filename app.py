@@ -1,9 +1,7 @@
-from flask import Flask, jsonify
+from flask import Flask, Response, jsonify, request
 from flask_cors import CORS
 from dotenv import load_dotenv
 import os
-import onnx
-import onnxruntime as ort
 
 load_dotenv()
 
@@ -11,35 +9,76 @@ from routes.inference import interface_bp
 from routes.report import report_bp
 from routes.chatbot import chatbot_bp
 from routes.cha_with_pdf import chat_with_pdf_bp
+from routes.models import models_bp
+from utils.uploads import InMemoryRequest
+from utils.explanations import explanation_store
+from utils.http_clients import upstream_stats
+from utils.instrumentation import init_app as init_instrumentation, recent_traces
+from utils.metrics import render_prometheus
+from utils.warmup import liveness, readiness, start_warmup
 
 app = Flask(__name__)
+# Views opt in to in-memory upload buffering and set their own body limits (see utils.uploads)
+app.request_class = InMemoryRequest
 
 CORS(app)
 
+# Per-route request latency; per-stage timers are recorded by utils.instrumentation.stage
+init_instrumentation(app)
+
 # Register blueprints for other API routes
 app.register_blueprint(interface_bp, url_prefix="/api/interface")
 app.register_blueprint(report_bp, url_prefix="/api/report")
 app.register_blueprint(chatbot_bp, url_prefix="/api")
 app.register_blueprint(chat_with_pdf_bp, url_prefix="/api/chat-pdf")
+app.register_blueprint(models_bp, url_prefix="/api/models")
 
-# Model directory and path
-MODEL_DIR = "models"
-MODEL_PATH = os.path.join(MODEL_DIR, "brain_tumor_classifier.onnx")  # Updated to ONNX model
-
-os.makedirs(MODEL_DIR, exist_ok=True)
+# ONNX sessions are created lazily and shared through utils.model_registry.
+# Heavy subsystems (models, PDF libraries, LLM clients) load on first use or
+# in the background warmup, so workers start serving within a second.
+# With `python app.py`, the spawned PDF pool workers (utils.pdf_raster,
+# utils.pdf_generator) re-import this file as __mp_main__; they must not warm up too.
+if __name__ != "__mp_main__":
+    start_warmup()
 
-# Check if model exists in the local directory
-if not os.path.exists(MODEL_PATH):
-    raise ValueError(f"Model file '{MODEL_PATH}' not found!")
+    # Persisted explanations are already loaded; fill them with `flask warm-explanations` at deploy
+    # time. The background refresh is opt-in: every worker running it would repeat the same LLM calls.
+    if os.getenv("EXPLANATION_WARMUP", "0").lower() in ("1", "true", "yes"):
+        explanation_store.start_background_refresh()
 
-# Load the ONNX model
-onnx_model = onnx.load(MODEL_PATH)
-ort_session = ort.InferenceSession(MODEL_PATH)
+@app.cli.command("warm-explanations")
+def warm_explanations():
+    """Generate every per-label explanation and persist the store to disk."""
+    generated = explanation_store.warmup(force=True)
+    print(f"Generated {generated} explanations into {explanation_store.path}")
 
 # @app.route("/prince", methods=["GET"])
 # def prince():
 #     return jsonify({"message": "hello"}), 200
 
+@app.route("/api/upstreams")
+def upstreams():
+    return jsonify({"success": True, "data": upstream_stats()}), 200
+
+@app.route("/metrics")
+def prometheus_metrics():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/traces")
+def traces():
+    """Sampled per-stage request traces (TRACE_SAMPLE_RATE), newest first."""
+    limit = request.args.get("limit", 50, type=int)
+    return jsonify({"success": True, "data": recent_traces(limit)}), 200
+
+@app.route("/healthz")
+def healthz():
+    return jsonify({"success": True, "data": liveness()}), 200
+
+@app.route("/readyz")
+def readyz():
+    ready, data = readiness()
+    return jsonify({"success": ready, "data": data}), 200 if ready else 503
+
 @app.route("/")
 def home():
     return {"message": "Brain Tumor Backend API is running."}
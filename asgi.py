@@ -0,0 +1,233 @@
+"""ASGI entry point.
+
+    uvicorn asgi:application --workers 4
+
+Routes dominated by slow outbound LLM/inference-API calls are served by native
+async handlers below, so a single process can keep hundreds of them waiting
+without pinning a thread each. Blocking work (embedding, the Pinecone SDK,
+PDF building) is pushed to the default executor. Every other route is passed
+through to the existing Flask app via asgiref's WSGI adapter, which runs it
+in a worker thread, so the WSGI entry point (`app:app` under gunicorn) keeps
+working unchanged.
+
+With ?stream=1 (or Accept: text/event-stream) the chatbot and chat-pdf routes
+answer with server-sent events as the LLM produces tokens.
+"""
+import asyncio
+import inspect
+import json
+import logging
+import re
+import uuid
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import app as flask_app
+from utils.http_clients import close_async_client
+from utils.instrumentation import begin_request, end_request, stage
+from utils.streaming import SSE_HEADERS, asse_stream, wants_stream
+
+logger = logging.getLogger(__name__)
+
+MAX_JSON_BODY_BYTES = 1024 * 1024
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+async def read_json(receive):
+    body = bytearray()
+    more_body = True
+    while more_body:
+        message = await receive()
+        body.extend(message.get("body", b""))
+        more_body = message.get("more_body", False)
+        if len(body) > MAX_JSON_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        raise HTTPError(400, "Invalid JSON body")
+
+
+async def send_response(send, status, body, content_type=b"application/json", headers=()):
+    if not isinstance(body, (bytes, bytearray)):
+        body = json.dumps(body).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", content_type),
+            (b"content-length", str(len(body)).encode()),
+            # Mirrors CORS(app) on the Flask side
+            (b"access-control-allow-origin", b"*"),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": bytes(body)})
+
+
+async def send_stream(send, status, chunks):
+    """Send an SSE body chunk by chunk (no Content-Length, so the server uses chunked encoding)."""
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [
+            (b"content-type", b"text/event-stream"),
+            (b"access-control-allow-origin", b"*"),
+            *[(k.lower().encode(), v.encode()) for k, v in SSE_HEADERS.items()],
+        ],
+    })
+    async for chunk in chunks:
+        await send({"type": "http.response.body", "body": chunk.encode("utf-8"), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+def stream_requested(scope):
+    query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+    headers = dict(scope.get("headers") or [])
+    return wants_stream((query.get("stream") or [None])[0],
+                        headers.get(b"accept", b"").decode("latin-1"))
+
+
+async def chatbot(scope, receive, params):
+    from utils.chatbot_utils import process_text_async, process_text_stream_async
+
+    data = await read_json(receive) or {}
+    text_query = data.get("text", "") if isinstance(data, dict) else ""
+    if not isinstance(text_query, str) or text_query.strip() == "":
+        return 400, {"success": False, "message": "Text query is empty"}
+
+    if stream_requested(scope):
+        return 200, asse_stream(process_text_stream_async(text_query))
+
+    response = await process_text_async(text_query)
+    return 200, {
+        "success": True,
+        "message": "Processed text query successfully",
+        "response": response,
+    }
+
+
+async def chat_pdf_ask(scope, receive, params):
+    from utils.chat_with_pdf_util import answer_query_async, astream_answer
+    from utils.session_store import get_session_store
+
+    session_id = params["session_id"]
+    data = await read_json(receive) or {}
+    text_query = data.get("text", "").strip() if isinstance(data, dict) else ""
+
+    # The sqlite store does disk I/O, so look the session up off the event loop
+    context = await asyncio.get_running_loop().run_in_executor(
+        None, get_session_store().get, session_id) if session_id else None
+    if context is None:
+        return 400, {"success": False, "message": "Invalid or missing session_id"}
+    if not text_query:
+        return 400, {"success": False, "message": "Text query is empty"}
+
+    if stream_requested(scope):
+        return 200, asse_stream(astream_answer(context, text_query))
+
+    answer, omitted_pages = await answer_query_async(context, text_query)
+    return 200, {"success": True, "answer": answer, "omitted_pages": omitted_pages}
+
+
+async def report_generate(scope, receive, params):
+    from utils.pdf_generator import REPORT_IMAGE_QUALITY, generate_report
+    from utils.segment_util import get_segmenter, to_jpeg
+
+    data = await read_json(receive) or {}
+    image_path = data.get("image_path")
+    tumor_type = data.get("tumor_type")
+    confidence = data.get("confidence")
+    if not all([image_path, tumor_type, confidence is not None]):
+        return 400, {"success": False, "message": "Missing data for report"}
+
+    overlay_jpeg, segmentation_error = None, None
+    segmenter = get_segmenter()
+    try:
+        with stage("segmentation", backend=segmenter.name):
+            result = await segmenter.asegment(image_path)
+        overlay_jpeg = to_jpeg(result, quality=REPORT_IMAGE_QUALITY)
+    except Exception as e:
+        # generate_report embeds the error text, like the sync path does
+        segmentation_error = e
+    pdf_bytes = await asyncio.get_running_loop().run_in_executor(
+        None, generate_report, image_path, tumor_type, float(confidence),
+        None, overlay_jpeg, segmentation_error,
+    )
+
+    filename = f"report_{uuid.uuid4().hex}.pdf".encode()
+    return 200, (pdf_bytes, b"application/pdf",
+                 [(b"content-disposition", b"attachment; filename=" + filename)])
+
+
+# (method, path pattern, Flask-style rule used as the metrics route label, handler)
+ROUTES = [
+    ("POST", re.compile(r"^/api/chatbot$"), "/api/chatbot", chatbot),
+    ("POST", re.compile(r"^/api/chat-pdf/ask/(?P<session_id>[^/]+)$"), "/api/chat-pdf/ask/<session_id>",
+     chat_pdf_ask),
+    ("POST", re.compile(r"^/api/report/generate$"), "/api/report/generate", report_generate),
+]
+
+
+class AsyncApp:
+    def __init__(self, wsgi_app, routes):
+        self.fallback = WsgiToAsgi(wsgi_app)
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        if scope["type"] == "http":
+            for method, pattern, rule, handler in self.routes:
+                match = pattern.match(scope["path"])
+                if match and scope["method"] == method:
+                    token = begin_request(rule)
+                    status = 500
+                    try:
+                        status = await self.dispatch(handler, match.groupdict(), scope, receive, send)
+                    finally:
+                        end_request(token, status)
+                    return
+
+        return await self.fallback(scope, receive, send)
+
+    async def dispatch(self, handler, params, scope, receive, send):
+        try:
+            status, body = await handler(scope, receive, params)
+        except HTTPError as e:
+            await send_response(send, e.status, {"success": False, "message": e.message})
+            return e.status
+        except Exception as e:
+            logger.error(f"Unhandled error in {handler.__name__}: {str(e)}", exc_info=True)
+            await send_response(send, 500, {"success": False, "message": str(e)})
+            return 500
+
+        if inspect.isasyncgen(body):
+            await send_stream(send, status, body)
+        elif isinstance(body, tuple):
+            payload, content_type, headers = body
+            await send_response(send, status, payload, content_type, headers)
+        else:
+            await send_response(send, status, body)
+        return status
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await close_async_client()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = AsyncApp(flask_app, ROUTES)
@@ -0,0 +1,114 @@
+"""Batch prediction: N single /predict requests vs one /predict/batch request.
+
+    python -m benchmarks.bench_batch_predict [--model models/brain_tumor_classifier.onnx]
+        [--images 256] [--size 512] [--batch-size 32]
+
+Runs through the Flask test client with stub explanations and the
+prediction cache off. The batch endpoint is measured with multipart files,
+a zip part and a raw tar body; peak traced Python memory is reported for
+each, which should stay flat as --images grows. Without --model a tiny
+ONNX classifier is built, so the numbers are dominated by request handling
+and decoding rather than the model.
+"""
+import argparse
+import io
+import os
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("PREDICTION_CACHE", "0")
+os.environ.setdefault("EXPLANATION_BACKEND", "stub")
+
+from benchmarks.stubs import make_stub_classifier, scan_jpeg
+
+
+def make_client(model_path, batch_size):
+    from flask import Flask
+
+    from utils import batch_predict
+    from utils.model_registry import register_model
+    from utils.uploads import InMemoryRequest
+
+    register_model("classifier", model_path)
+    batch_predict.PREDICT_BATCH_SIZE = batch_size
+    from routes.inference import interface_bp
+
+    app = Flask(__name__)
+    app.request_class = InMemoryRequest
+    app.config["MAX_CONTENT_LENGTH"] = None
+    app.register_blueprint(interface_bp, url_prefix="/api/interface")
+    return app.test_client()
+
+
+def timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--images", type=int, default=256)
+    parser.add_argument("--size", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if model_path is None:
+            model_path = os.path.join(tmp, "classifier.onnx")
+            make_stub_classifier(model_path)
+        client = make_client(model_path, args.batch_size)
+
+        images = [scan_jpeg(seed, args.size) for seed in range(args.images)]
+        zipped, tarred = io.BytesIO(), io.BytesIO()
+        with zipfile.ZipFile(zipped, "w") as archive:
+            for i, image in enumerate(images):
+                archive.writestr(f"study/{i:05d}.jpg", image)
+        with tarfile.open(fileobj=tarred, mode="w") as archive:
+            for i, image in enumerate(images):
+                info = tarfile.TarInfo(f"study/{i:05d}.jpg")
+                info.size = len(image)
+                archive.addfile(info, io.BytesIO(image))
+
+        def single():
+            for i, image in enumerate(images):
+                response = client.post("/api/interface/predict", data={"file": (io.BytesIO(image), f"{i}.jpg")})
+                assert response.status_code == 200, response.get_json()
+            return len(images)
+
+        def batch(**kwargs):
+            response = client.post("/api/interface/predict/batch", **kwargs)
+            assert response.status_code == 200, response.get_data(as_text=True)[:500]
+            assert b'"success": false' not in response.get_data(), response.get_data(as_text=True)[:500]
+            return len(images)
+
+        cases = [
+            ("single /predict", single),
+            ("batch, multipart files", lambda: batch(data={"files": [
+                (io.BytesIO(image), f"{i}.jpg") for i, image in enumerate(images)]})),
+            ("batch, zip part", lambda: batch(data={"files": [(io.BytesIO(zipped.getvalue()), "study.zip")]})),
+            ("batch, raw tar, NDJSON", lambda: batch(data=tarred.getvalue(), content_type="application/x-tar",
+                                                     query_string={"stream": "1"})),
+        ]
+        single()  # warm-up: session, pools, explanation store
+        print(f"{args.images} images of {args.size}x{args.size}, batch size {args.batch_size}")
+        print(f"{'mode':<26} {'images/s':>10} {'seconds':>9} {'peak MB':>9}")
+        for name, fn in cases:
+            count, elapsed, peak = timed(fn)
+            print(f"{name:<26} {count / elapsed:>10.1f} {elapsed:>9.2f} {peak / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Compare single-shot and micro-batched classifier inference under concurrency.
+
+Usage:
+    python -m benchmarks.bench_batching [--model models/brain_tumor_classifier.onnx]
+
+Without --model a synthetic CPU-bound session with a fixed per-call overhead
+is used, so the scheduler itself can be measured on any machine.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.inference_engine import InferenceEngine
+
+
+class _Input:
+    name = "input"
+    shape = ["N", 224, 224, 3]
+
+
+class SyntheticSession:
+    """Stands in for an ORT session: fixed call overhead + per-image matmul.
+
+    Calls are serialised, mimicking a session whose intra-op threads already
+    occupy every core, so concurrent single-shot runs queue behind each other.
+    """
+
+    def __init__(self, call_overhead_ms=4.0):
+        self.call_overhead = call_overhead_ms / 1000.0
+        self.weights = np.random.rand(224 * 3, 4).astype(np.float32)
+        self._lock = threading.Lock()
+
+    def get_inputs(self):
+        return [_Input()]
+
+    def run(self, _outputs, feeds):
+        batch = next(iter(feeds.values()))
+        with self._lock:
+            time.sleep(self.call_overhead)
+            pooled = batch.mean(axis=1).reshape(batch.shape[0], -1)
+            return [pooled @ self.weights]
+
+
+def load_session(model_path):
+    if not model_path:
+        return SyntheticSession()
+    import onnxruntime as ort
+    return ort.InferenceSession(model_path)
+
+
+def run_load(engine, clients, requests_per_client):
+    img = np.random.rand(1, 224, 224, 3).astype(np.float32)
+    latencies = []
+    lock = threading.Lock()
+
+    def client():
+        local = []
+        for _ in range(requests_per_client):
+            start = time.perf_counter()
+            engine.predict(img)
+            local.append(time.perf_counter() - start)
+        with lock:
+            latencies.extend(local)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        for _ in range(clients):
+            pool.submit(client)
+    elapsed = time.perf_counter() - start
+
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+        "images_per_sec": len(latencies) / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=None)
+    parser.add_argument("--requests", type=int, default=50, help="requests per client")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--clients", default="1,8,32")
+    args = parser.parse_args()
+
+    session = load_session(args.model)
+    engines = {
+        "single": InferenceEngine(session, batching=False),
+        "batched": InferenceEngine(
+            session, batching=True,
+            max_batch_size=args.max_batch_size, max_wait_ms=args.max_wait_ms,
+        ),
+    }
+
+    print(f"{'mode':<8} {'clients':>7} {'p50 ms':>9} {'p99 ms':>9} {'img/s':>9}")
+    for clients in [int(c) for c in args.clients.split(",")]:
+        for mode, engine in engines.items():
+            result = run_load(engine, clients, args.requests)
+            print(f"{mode:<8} {clients:>7} {result['p50_ms']:>9.2f} "
+                  f"{result['p99_ms']:>9.2f} {result['images_per_sec']:>9.1f}")
+
+    print("batcher stats:", engines["batched"].stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Encode latency, throughput and cosine drift of the embedding backends.
+
+    python -m scripts.export_embedding_onnx        # once, for the onnx backends
+    python -m benchmarks.bench_embeddings [--backends torch,onnx,onnx-int8]
+
+Drift is the cosine similarity of each backend's embeddings against the
+PyTorch SentenceTransformer (the model the knowledge-base index was built
+with), so values close to 1.0 mean retrieval results are unchanged.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_service import EmbeddingService, create_encoder
+
+QUERIES = [
+    "What are the symptoms of a glioma?",
+    "Is a meningioma cancerous?",
+    "How is a pituitary tumor treated?",
+    "What causes brain tumors?",
+    "Can a brain tumor cause headaches every morning?",
+    "What is the survival rate for glioblastoma?",
+    "How long does recovery from brain surgery take?",
+    "Are brain tumors hereditary?",
+    "What does an MRI show for a brain tumor?",
+    "hello",
+    "What is the difference between benign and malignant tumors?",
+    "Can radiation therapy shrink a meningioma?",
+]
+
+
+def single_latency(encoder, rounds):
+    timings = []
+    for i in range(rounds):
+        start = time.perf_counter()
+        encoder.encode([QUERIES[i % len(QUERIES)]])
+        timings.append(time.perf_counter() - start)
+    ms = np.array(timings) * 1000.0
+    return float(np.percentile(ms, 50)), float(np.percentile(ms, 99))
+
+
+def batched_throughput(encoder, clients, per_client):
+    """Concurrent callers through the micro-batcher, cache disabled."""
+    service = EmbeddingService(encoder, cache_size=0)
+    barrier = threading.Barrier(clients)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(per_client):
+            # Unique texts so every call reaches the encoder
+            service.embed(f"{QUERIES[(offset + i) % len(QUERIES)]} #{offset}-{i}")
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    return clients * per_client / elapsed, service.stats()["batcher"]["avg_batch_size"]
+
+
+def cached_latency(encoder, rounds):
+    service = EmbeddingService(encoder)
+    service.embed(QUERIES[0])
+    start = time.perf_counter()
+    for _ in range(rounds):
+        service.embed("  what are the SYMPTOMS of a glioma? ")
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", default="torch,onnx,onnx-int8")
+    parser.add_argument("--rounds", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=16)
+    parser.add_argument("--per-client", type=int, default=20)
+    args = parser.parse_args()
+
+    process = psutil.Process()
+    reference = None
+    print(f"{'backend':<10} {'p50 ms':>8} {'p99 ms':>8} {'batched/s':>10} {'avg batch':>10} "
+          f"{'cache us':>9} {'RSS +MB':>8} {'min cos':>8} {'mean cos':>9}")
+    for name in args.backends.split(","):
+        rss_before = process.memory_info().rss
+        encoder = create_encoder(name)
+        vectors = encoder.encode(QUERIES)
+        rss_mb = (process.memory_info().rss - rss_before) / 1e6
+
+        if name == "torch":
+            reference = vectors
+        if reference is not None:
+            cosine = np.sum(vectors * reference, axis=1)
+            drift = f"{cosine.min():>8.4f} {cosine.mean():>9.4f}"
+        else:
+            drift = f"{'n/a':>8} {'n/a':>9}"
+
+        p50, p99 = single_latency(encoder, args.rounds)
+        rate, avg_batch = batched_throughput(encoder, args.clients, args.per_client)
+        cache_us = cached_latency(encoder, args.rounds)
+        print(f"{name:<10} {p50:>8.2f} {p99:>8.2f} {rate:>10.1f} {avg_batch:>10.1f} "
+              f"{cache_us:>9.1f} {rss_mb:>8.1f} {drift}")
+
+
+if __name__ == "__main__":
+    main()
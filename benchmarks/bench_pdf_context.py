@@ -0,0 +1,111 @@
+"""Per-question LLM payload: every page as an image vs text-first hybrid context.
+
+    python -m benchmarks.bench_pdf_context [--pages 20] [--pdf report.pdf] [--live]
+
+For each question prints extraction time, selection time, the payload the
+Groq request would carry (text + base64 data URLs) and its token estimate
+after budgeting; the old base64-length estimate for the whole document is
+printed for comparison. --live also sends both variants to Groq and reports
+answer latency (needs GROQ_API_KEY).
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import fitz
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.chat_with_pdf_util import answer_query, estimate_token_size, prepare_context
+from utils.pdf_extract import extract_pdf, extract_pdf_images
+
+QUESTIONS = [
+    "What is the patient's hemoglobin level?",
+    "Summarize the MRI findings.",
+    "hello",
+]
+
+LAB_LINES = [
+    "Hemoglobin 13.2 g/dL (reference 12.0-15.5)",
+    "White blood cell count 7.1 x10^9/L",
+    "Platelets 245 x10^9/L",
+    "Sodium 139 mmol/L, potassium 4.2 mmol/L",
+    "Creatinine 0.9 mg/dL",
+]
+
+
+def make_pdf(path, pages, seed=0):
+    """Mostly text lab pages, every fifth page an MRI figure, every seventh a scan."""
+    rng = np.random.default_rng(seed)
+    document = fitz.open()
+    for i in range(pages):
+        page = document.new_page()
+        picture = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (384, 384), dtype=np.uint8)).save(picture, format="PNG")
+        if i % 7 == 6:
+            page.insert_image(page.rect, stream=picture.getvalue())
+            continue
+        page.insert_text((72, 72), f"Laboratory report - page {i + 1}", fontsize=16)
+        body = "\n\n".join(LAB_LINES[(i + j) % len(LAB_LINES)] + ". " + "Within normal limits. " * 8
+                           for j in range(6))
+        if i % 5 == 4:
+            body = "MRI findings: a 2.1 cm enhancing lesion in the left frontal lobe with mild edema.\n\n" + body
+            page.insert_image(fitz.Rect(320, 420, 540, 640), stream=picture.getvalue())
+        page.insert_textbox(fitz.Rect(72, 100, 540, 410 if i % 5 == 4 else 760), body, fontsize=10)
+    document.save(path)
+
+
+def payload_bytes(context, user_query):
+    text = len(user_query) + sum(len(c["text"]) + 16 for c in context["chunks"])
+    images = sum(len(p["mime"]) + 13 + 4 * ((len(p["data"]) + 2) // 3) for p in context["pages"])
+    return text + images
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--pdf")
+    parser.add_argument("--live", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = args.pdf
+        if path is None:
+            path = os.path.join(tmp, "report.pdf")
+            make_pdf(path, args.pages)
+
+        contexts = {}
+        for name, extract in (("image", extract_pdf_images), ("hybrid", extract_pdf)):
+            start = time.perf_counter()
+            contexts[name] = extract(path, parallel=False)
+            elapsed = time.perf_counter() - start
+            context = contexts[name]
+            print(f"{name:<7} extract {elapsed * 1000:8.1f} ms: {len(context['chunks'])} chunks, "
+                  f"{len(context['pages'])} images")
+        legacy = sum(4 * ((len(p["data"]) + 2) // 3) // 4 for p in contexts["image"]["pages"])
+        print(f"old heuristic for the whole document: {legacy} tokens")
+
+        print(f"\n{'question':<42} {'mode':<7} {'select ms':>9} {'payload KB':>11} {'tokens':>8} {'images':>7}"
+              + (f" {'answer s':>9}" if args.live else ""))
+        for question in QUESTIONS:
+            for name, context in contexts.items():
+                start = time.perf_counter()
+                selected = prepare_context(context, question)
+                select_ms = (time.perf_counter() - start) * 1000
+                line = (f"{question[:42]:<42} {name:<7} {select_ms:>9.2f} "
+                        f"{payload_bytes(selected, question) / 1024:>11.1f} "
+                        f"{estimate_token_size(selected, question):>8} {len(selected['pages']):>7}")
+                if args.live:
+                    start = time.perf_counter()
+                    answer_query(context, question)
+                    line += f" {time.perf_counter() - start:>9.2f}"
+                print(line)
+
+
+if __name__ == "__main__":
+    main()
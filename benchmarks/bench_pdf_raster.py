@@ -0,0 +1,106 @@
+"""PDF rasterization: legacy PIL/PNG/base64 loop vs utils.pdf_raster.
+
+    python -m benchmarks.bench_pdf_raster [--pages 1,20,100] [--pdf some.pdf]
+
+Synthetic documents mix text, vector drawing and an embedded photo-like
+image per page. Reports total time, time to the first page and the encoded
+payload size for each configuration.
+"""
+import argparse
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+import fitz
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_raster import RASTER_WORKERS, get_pool, rasterize_pdf
+
+CONFIGS = [
+    ("serial png", dict(parallel=False, fmt="png")),
+    ("pool png", dict(parallel=True, fmt="png")),
+    ("pool jpeg q80", dict(parallel=True, fmt="jpeg", quality=80)),
+    ("pool webp q80", dict(parallel=True, fmt="webp", quality=80)),
+    ("pool jpeg gray", dict(parallel=True, fmt="jpeg", colorspace="gray", quality=80)),
+    ("pool png 150dpi", dict(parallel=True, fmt="png", dpi=150)),
+]
+
+
+def make_pdf(path, pages, seed=0):
+    rng = np.random.default_rng(seed)
+    photo = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)).save(photo, format="JPEG")
+    document = fitz.open()
+    for i in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Radiology report, page {i + 1}", fontsize=16)
+        page.insert_textbox(fitz.Rect(72, 100, 540, 400), "Findings: no acute abnormality. " * 40,
+                            fontsize=10)
+        page.draw_rect(fitz.Rect(72, 420, 300, 560), color=(0, 0, 1), width=2)
+        page.insert_image(fitz.Rect(320, 420, 540, 640), stream=photo.getvalue())
+    document.save(path)
+
+
+def legacy(path):
+    """The original process_pdf loop."""
+    pdf_document = fitz.open(path)
+    for page_number in range(len(pdf_document)):
+        page = pdf_document.load_page(page_number)
+        pix = page.get_pixmap()
+        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        yield base64.b64encode(buffer.getvalue()).decode("utf-8")
+
+
+def measure(pages_iter, size_of):
+    start = time.perf_counter()
+    first = None
+    total_bytes = 0
+    for page in pages_iter:
+        if first is None:
+            first = time.perf_counter() - start
+        total_bytes += size_of(page)
+    return time.perf_counter() - start, first or 0.0, total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", default="1,20,100")
+    parser.add_argument("--pdf", help="benchmark a real document instead")
+    args = parser.parse_args()
+
+    # Spawn the workers up front so pool start-up is not billed to the first run
+    list(get_pool().map(abs, range(RASTER_WORKERS)))
+    print(f"workers: {RASTER_WORKERS}")
+    print(f"{'pages':>5} {'config':<16} {'total ms':>9} {'first ms':>9} {'payload KB':>11}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        documents = []
+        if args.pdf:
+            documents.append(args.pdf)
+        else:
+            for count in [int(p) for p in args.pages.split(",")]:
+                path = os.path.join(tmp, f"doc_{count}.pdf")
+                make_pdf(path, count)
+                documents.append(path)
+
+        for path in documents:
+            with fitz.open(path) as document:
+                count = document.page_count
+            # Base64 text is what the old code kept per session
+            total, first, size = measure(legacy(path), len)
+            print(f"{count:>5} {'legacy':<16} {total * 1000:>9.1f} {first * 1000:>9.1f} {size / 1024:>11.1f}")
+            for name, options in CONFIGS:
+                total, first, size = measure(rasterize_pdf(path, **options), lambda p: len(p["data"]))
+                print(f"{count:>5} {name:<16} {total * 1000:>9.1f} {first * 1000:>9.1f} {size / 1024:>11.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Classifier variants: latency, throughput and memory of fp32, int8 and fp16.
+
+    python -m benchmarks.bench_quantization [--model models/brain_tumor_classifier.onnx]
+        [--runs 50] [--batch-size 32] [--threads 0]
+
+Benchmarks every variant file next to --model built by
+scripts.quantize_classifier, each in a fresh interpreter so RSS is not
+shared between sessions: session load time, RSS added by the session and
+after running, batch-1 latency (p50/p95) and batch throughput. Without
+--model a small stub conv net is built and quantized first (calibrated on
+synthetic images), which exercises the tooling but says little about the
+real EfficientNetV2-L; run it on the production model for decisions.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.model_registry import CLASSIFIER_VARIANTS, parity_report_path, variant_path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = """
+import json, sys, time
+import numpy as np, psutil
+sys.path.insert(0, {root!r})
+import onnxruntime as ort
+from utils.model_registry import build_session_options
+
+process = psutil.Process()
+rss_start = process.memory_info().rss
+options = build_session_options()
+if {threads}:
+    options.intra_op_num_threads = {threads}
+start = time.perf_counter()
+session = ort.InferenceSession({path!r}, sess_options=options, providers=["CPUExecutionProvider"])
+load_seconds = time.perf_counter() - start
+rss_loaded = process.memory_info().rss
+name = session.get_inputs()[0].name
+rng = np.random.default_rng(0)
+single = rng.uniform(0, 255, (1, 224, 224, 3)).astype(np.float32)
+batch = rng.uniform(0, 255, ({batch_size}, 224, 224, 3)).astype(np.float32)
+for _ in range(3):
+    session.run(None, {{name: single}})
+session.run(None, {{name: batch}})
+latencies = []
+for _ in range({runs}):
+    start = time.perf_counter()
+    session.run(None, {{name: single}})
+    latencies.append(time.perf_counter() - start)
+start = time.perf_counter()
+for _ in range(max(1, {runs} // 10)):
+    session.run(None, {{name: batch}})
+batch_seconds = time.perf_counter() - start
+print(json.dumps({{
+    "load_seconds": load_seconds,
+    "session_rss_mb": (rss_loaded - rss_start) / 2 ** 20,
+    "peak_rss_mb": process.memory_info().rss / 2 ** 20,
+    "p50_ms": float(np.percentile(latencies, 50) * 1000),
+    "p95_ms": float(np.percentile(latencies, 95) * 1000),
+    "images_per_s": max(1, {runs} // 10) * {batch_size} / batch_seconds,
+}}))
+"""
+
+
+def measure(path, args):
+    code = CHILD.format(root=ROOT, path=path, threads=args.threads, batch_size=args.batch_size, runs=args.runs)
+    proc = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=ROOT)
+    if proc.returncode != 0:
+        raise SystemExit(f"Benchmarking {path} failed:\n{proc.stderr[-3000:]}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def build_stub_variants(directory):
+    from PIL import Image
+    import numpy as np
+
+    from benchmarks.stubs import make_stub_cnn_classifier
+    from scripts.quantize_classifier import build_variant
+
+    model = os.path.join(directory, "classifier.onnx")
+    make_stub_cnn_classifier(model)
+    rng = np.random.default_rng(0)
+    calibration = []
+    for i in range(32):
+        path = os.path.join(directory, f"calibration_{i}.jpg")
+        Image.fromarray(rng.integers(0, 255, (256, 256, 3), dtype=np.uint8)).save(path)
+        calibration.append((path, None))
+    for variant in CLASSIFIER_VARIANTS[1:]:
+        build_variant(variant, model, variant_path(model, variant), calibration)
+    return model
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--threads", type=int, default=0, help="intra-op threads (0: ORT_INTRA_OP_THREADS)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model = args.model or build_stub_variants(tmp)
+        rows = []
+        for variant in CLASSIFIER_VARIANTS:
+            path = variant_path(model, variant)
+            if not os.path.exists(path):
+                print(f"{variant}: {path} not found, skipped (build it with scripts.quantize_classifier)")
+                continue
+            result = measure(path, args)
+            parity = None
+            if os.path.exists(parity_report_path(path)) and variant != "fp32":
+                with open(parity_report_path(path)) as f:
+                    report = json.load(f)
+                parity = f"{report['top1_agreement']:.4f} {'pass' if report['passed'] else 'FAIL'}"
+            rows.append((variant, os.path.getsize(path) / 2 ** 20, result, parity))
+
+    print(f"\n{'variant':<14} {'file MB':>8} {'load s':>7} {'session MB':>11} {'peak MB':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'img/s @' + str(args.batch_size):>11} {'parity':>12}")
+    base = rows[0][2]["images_per_s"] if rows and rows[0][0] == "fp32" else None
+    for variant, size_mb, r, parity in rows:
+        speedup = f" ({r['images_per_s'] / base:.2f}x)" if base else ""
+        print(f"{variant:<14} {size_mb:>8.1f} {r['load_seconds']:>7.2f} {r['session_rss_mb']:>11.1f} "
+              f"{r['peak_rss_mb']:>8.1f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['images_per_s']:>11.1f}{speedup} {parity or '-':>12}")
+
+
+if __name__ == "__main__":
+    main()
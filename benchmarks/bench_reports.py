@@ -0,0 +1,88 @@
+"""Report rendering throughput (reports/sec), segmentation excluded.
+
+    python -m benchmarks.bench_reports [--reports 64] [--chunk 8]
+
+"legacy" is the original flow: re-encode the image to a shared temp JPEG,
+embed it by path and write the PDF under reports/ (here a temp dir).
+"in memory" builds each PDF from the overlay JPEG bytes; "batch" renders the
+same jobs through utils.pdf_generator.render_reports on the process pool.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from fpdf import FPDF
+from fpdf.enums import XPos, YPos
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.pdf_generator import REPORT_WORKERS, get_pool, render_report, render_reports
+
+LABELS = ["glioma", "meningioma", "notumor", "pituitary"]
+
+
+def legacy_report(image_path, tumor_type, confidence, output_path, temp_path):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Helvetica", size=16)
+    pdf.cell(200, 10, text="Brain Tumor Classification Report", new_x=XPos.LMARGIN, new_y=YPos.NEXT, align="C")
+    pdf.set_font("Helvetica", size=12)
+    pdf.ln(10)
+    pdf.cell(200, 10, text=f"Tumor Type: {tumor_type}", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.cell(200, 10, text=f"Confidence: {confidence:.2f}%", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(10)
+    pdf.multi_cell(0, 10, text="Tumor detected.\nPlease consult a neurologist.", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    pdf.ln(10)
+    pdf.cell(200, 10, text="Segmented Tumor Image:", new_x=XPos.LMARGIN, new_y=YPos.NEXT)
+    with Image.open(image_path) as img:
+        img.convert("RGB").save(temp_path, format="JPEG")
+    pdf.image(temp_path, x=10, y=pdf.get_y(), w=100)
+    os.remove(temp_path)
+    pdf.output(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reports", type=int, default=64)
+    parser.add_argument("--chunk", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    buffer = io.BytesIO()
+    Image.fromarray(rng.integers(0, 255, (512, 512, 3), dtype=np.uint8)).save(buffer, format="JPEG", quality=90)
+    overlay = buffer.getvalue()
+    jobs = [(LABELS[i % len(LABELS)], 50.0 + i % 50, overlay, None) for i in range(args.reports)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        image_path = os.path.join(tmp, "scan.jpg")
+        with open(image_path, "wb") as f:
+            f.write(overlay)
+
+        def legacy():
+            for i, (label, confidence, _, _) in enumerate(jobs):
+                legacy_report(image_path, label, confidence, os.path.join(tmp, f"report_{i}.pdf"),
+                              os.path.join(tmp, "temp_img_for_report.jpg"))
+
+        # Start the workers before timing
+        list(get_pool().map(abs, range(REPORT_WORKERS)))
+
+        rows = [
+            ("legacy (temp files)", legacy),
+            ("in memory", lambda: [render_report(*job) for job in jobs]),
+            (f"batch, {REPORT_WORKERS} workers", lambda: render_reports(jobs, chunk_size=args.chunk)),
+        ]
+        print(f"{'path':<24} {'reports':>7} {'total s':>8} {'reports/s':>10}")
+        for name, fn in rows:
+            start = time.perf_counter()
+            fn()
+            elapsed = time.perf_counter() - start
+            print(f"{name:<24} {len(jobs):>7} {elapsed:>8.2f} {len(jobs) / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Recall@3 and latency of the retrieval backends.
+
+    python -m benchmarks.bench_retrieval --index-dir data/kb_index [--remote]
+    python -m benchmarks.bench_retrieval --synthetic 200000   # ANN at scale
+
+Queries are stored vectors with added noise; exact local search is the ground
+truth. --remote also queries Pinecone (needs PINECONE_API_KEY and the same
+corpus exported with scripts.export_pinecone_index).
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.retrieval import LocalBackend, PineconeBackend
+
+TOP_K = 3
+
+
+def make_synthetic(directory, n, dim=384, seed=0):
+    rng = np.random.default_rng(seed)
+    # Clustered data so approximate indexes face a realistic neighbourhood structure
+    centers = rng.normal(size=(max(n // 500, 1), dim)).astype(np.float32)
+    vectors = centers[rng.integers(0, len(centers), n)] + 0.3 * rng.normal(size=(n, dim)).astype(np.float32)
+    LocalBackend.write(directory, [f"chunk{i}" for i in range(n)], vectors,
+                       [{"texts": f"synthetic {i}"} for i in range(n)])
+
+
+def make_queries(directory, count, seed=1):
+    embeddings = np.load(os.path.join(directory, "embeddings.npy"), mmap_mode="r")
+    rng = np.random.default_rng(seed)
+    picks = rng.choice(embeddings.shape[0], size=min(count, embeddings.shape[0]), replace=False)
+    return np.asarray(embeddings[picks]) + 0.05 * rng.normal(size=(len(picks), embeddings.shape[1]))
+
+
+def run(backend, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        matches = backend.query(query, top_k=TOP_K)
+        latencies.append(time.perf_counter() - start)
+        results.append({m["id"] for m in matches})
+    return results, np.array(latencies) * 1000.0
+
+
+def report(name, results, latencies, truth):
+    recall = np.mean([len(r & t) / len(t) for r, t in zip(results, truth)])
+    print(f"{name:<14} {recall:>9.3f} {np.percentile(latencies, 50):>9.3f} "
+          f"{np.percentile(latencies, 99):>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index-dir", default=None)
+    parser.add_argument("--synthetic", type=int, default=0, help="build a synthetic corpus of N vectors")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--remote", action="store_true")
+    args = parser.parse_args()
+
+    directory = args.index_dir
+    if args.synthetic:
+        directory = tempfile.mkdtemp(prefix="kb_bench_")
+        make_synthetic(directory, args.synthetic)
+    if not directory:
+        parser.error("pass --index-dir or --synthetic N")
+
+    queries = make_queries(directory, args.queries)
+    exact = LocalBackend(directory, ann="none")
+    truth, latencies = run(exact, queries)
+
+    print(f"{len(exact.ids)} vectors, {len(queries)} queries, top_k={TOP_K}")
+    print(f"{'backend':<14} {'recall@3':>9} {'p50 ms':>9} {'p99 ms':>9}")
+    report("local-exact", truth, latencies, truth)
+
+    LocalBackend.build_ivf(directory)
+    report("local-ivf", *run(LocalBackend(directory, ann="ivf"), queries), truth)
+
+    try:
+        LocalBackend.build_hnsw(directory)
+        report("local-hnsw", *run(LocalBackend(directory, ann="hnsw"), queries), truth)
+    except ImportError:
+        print("local-hnsw     skipped (pip install hnswlib)")
+
+    if args.remote:
+        report("pinecone", *run(PineconeBackend(), queries), truth)
+
+
+if __name__ == "__main__":
+    main()
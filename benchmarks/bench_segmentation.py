@@ -0,0 +1,76 @@
+"""Segmentation latency: remote inference API vs the local ONNX backend.
+
+    python -m benchmarks.bench_segmentation [--model models/brain_tumor_segmentation.onnx]
+        [--stub-latency-ms 400] [--images 16] [--batch 8]
+
+The remote path is measured against a local HTTP stub that answers like the
+Hugging Face endpoint after --stub-latency-ms (so only client overhead and
+the simulated network/inference time are counted). Without --model a tiny
+synthetic U-Net-shaped ONNX model (NCHW 1x3x256x256 -> 1x1x256x256) is built.
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubUpstreams, make_stub_segmenter
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--stub-latency-ms", type=float, default=400.0)
+    parser.add_argument("--images", type=int, default=16)
+    parser.add_argument("--batch", type=int, default=8)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(1)
+    images = []
+    for _ in range(args.images):
+        buffer = io.BytesIO()
+        Image.fromarray(rng.integers(0, 255, (512, 512, 3), dtype=np.uint8)).save(buffer, format="JPEG")
+        images.append(buffer.getvalue())
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if model_path is None:
+            model_path = os.path.join(tmp, "segmenter.onnx")
+            make_stub_segmenter(model_path)
+        stubs = StubUpstreams(huggingface_latency_ms=args.stub_latency_ms, segmentation_reply=images[0]).start()
+        # Configuration is read at import time
+        os.environ["SEGMENTATION_MODEL_PATH"] = model_path
+        os.environ["UPSTREAM_HUGGINGFACE_BASE_URL"] = stubs.base_url
+
+        from utils.segment_util import LocalSegmenter, RemoteSegmenter
+
+        remote, local = RemoteSegmenter(), LocalSegmenter()
+        local.segment(images[0])  # warm-up
+
+        print(f"{'path':<22} {'images':>6} {'total s':>8} {'ms/image':>9}")
+        rows = [
+            ("remote (stub)", lambda: [remote.segment(img) for img in images]),
+            ("local, one by one", lambda: [local.segment(img) for img in images]),
+            (f"local, batch {args.batch}", lambda: [local.segment_batch(images[i:i + args.batch])
+                                                    for i in range(0, len(images), args.batch)]),
+        ]
+        for name, fn in rows:
+            elapsed = timed(fn)
+            print(f"{name:<22} {len(images):>6} {elapsed:>8.2f} {elapsed / len(images) * 1000:>9.1f}")
+        stubs.stop()
+
+
+if __name__ == "__main__":
+    main()
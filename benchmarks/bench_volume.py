@@ -0,0 +1,134 @@
+"""Volume inference throughput on a synthetic 256^3 NIfTI volume.
+
+    python -m benchmarks.bench_volume [--model models/brain_tumor_classifier.onnx]
+        [--size 256] [--batch-sizes 1,8,32,64]
+
+Compares loading the whole volume and classifying slice by slice (what a
+client exporting PNGs effectively gets) with utils.volumes.predict_volume
+(memory-mapped slice reads, batched windowing and resizing, one classifier
+call per batch) at several batch sizes, over every axial slice. Also times
+the /predict/volume endpoint with .nii and .nii.gz uploads at the default
+stride. Peak traced Python memory shows that the volume is never loaded whole.
+Without --model a tiny ONNX classifier is built, so the numbers measure
+the I/O and preprocessing around the model.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("EXPLANATION_BACKEND", "stub")
+os.environ.setdefault("VOLUME_MIN_FOREGROUND", "0")
+
+from benchmarks.stubs import make_stub_classifier
+
+
+def make_volume(directory, size):
+    """An int16 head-like volume: noisy ellipsoid with a brighter blob, as .nii and .nii.gz."""
+    import nibabel as nib
+
+    grid = np.linspace(-1, 1, size, dtype=np.float32)
+    x, y, z = np.meshgrid(grid, grid, grid, indexing="ij", sparse=True)
+    head = (x ** 2 / 0.7 + y ** 2 / 0.8 + z ** 2 / 0.9) < 1
+    blob = ((x - 0.2) ** 2 + (y + 0.1) ** 2 + z ** 2) < 0.02
+    rng = np.random.default_rng(0)
+    volume = (head * rng.integers(300, 600, (size, size, size), dtype=np.int16) + blob * 500).astype(np.int16)
+    image = nib.Nifti1Image(volume, np.diag([1.0, 1.0, 1.0, 1.0]))
+    paths = os.path.join(directory, "volume.nii"), os.path.join(directory, "volume.nii.gz")
+    for path in paths:
+        nib.save(image, path)
+    return paths
+
+
+def timed(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    slices = fn()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return slices, elapsed, peak
+
+
+def whole_volume(path):
+    """Baseline: load everything as float64, then one PIL image and one session call per slice."""
+    import nibabel as nib
+
+    from utils.inference_engine import get_engine
+    from utils.preprocessing import process_image
+
+    data = nib.load(path).get_fdata()
+    low, high = np.percentile(data, [0.5, 99.5])
+    engine = get_engine()
+    for k in range(data.shape[2]):
+        pixels = np.clip((data[:, :, k] - low) / (high - low) * 255, 0, 255).astype(np.uint8)
+        engine.predict_batch(process_image(Image.fromarray(np.rot90(pixels)).convert("RGB")))
+    return data.shape[2]
+
+
+def pipelined(path, batch_size):
+    from utils.volumes import NiftiVolume, predict_volume
+
+    volume = NiftiVolume(path)
+    slices, _, _ = predict_volume(volume, range(volume.depth), batch_size=batch_size)
+    return len(slices)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model")
+    parser.add_argument("--size", type=int, default=256)
+    parser.add_argument("--batch-sizes", default="1,8,32,64")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_path = args.model
+        if model_path is None:
+            model_path = os.path.join(tmp, "classifier.onnx")
+            make_stub_classifier(model_path)
+        from utils.model_registry import register_model
+
+        register_model("classifier", model_path)
+        nii, nii_gz = make_volume(tmp, args.size)
+        print(f"{args.size}^3 int16 volume: {os.path.getsize(nii) / 2 ** 20:.0f} MB .nii, "
+              f"{os.path.getsize(nii_gz) / 2 ** 20:.0f} MB .nii.gz")
+
+        pipelined(nii, 8)  # warm-up: session, pools
+        cases = [("whole volume, per slice", lambda: whole_volume(nii))]
+        cases += [(f"predict_volume, batch {b}", lambda b=b: pipelined(nii, b))
+                  for b in (int(b) for b in args.batch_sizes.split(","))]
+
+        from flask import Flask
+
+        from routes.inference import interface_bp
+        from utils.uploads import InMemoryRequest
+
+        app = Flask(__name__)
+        app.request_class = InMemoryRequest
+        app.register_blueprint(interface_bp, url_prefix="/api/interface")
+        client = app.test_client()
+
+        def endpoint(path):
+            with open(path, "rb") as f:
+                response = client.post("/api/interface/predict/volume", data=f,
+                                       content_type="application/octet-stream")
+            assert response.status_code == 200, response.get_json()
+            return len(response.get_json()["data"]["slices"])
+
+        cases += [("endpoint, .nii", lambda: endpoint(nii)), ("endpoint, .nii.gz", lambda: endpoint(nii_gz))]
+
+        print(f"{'mode':<28} {'slices':>7} {'slices/s':>9} {'seconds':>8} {'peak MB':>8}")
+        for name, fn in cases:
+            slices, elapsed, peak = timed(fn)
+            print(f"{name:<28} {slices:>7} {slices / elapsed:>9.1f} {elapsed:>8.2f} {peak / 2 ** 20:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
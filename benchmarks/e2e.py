@@ -0,0 +1,396 @@
+"""End-to-end offline benchmark: the real server against local upstream stubs.
+
+    python -m benchmarks.e2e [--server flask|gunicorn|uvicorn] [--workers 2] [--threads 8]
+        [--scenarios predict,chatbot,chat_pdf_upload,chat_pdf_ask,report]
+        [--concurrency 1,8,32] [--requests 100] [--groq-latency-ms 300]
+        [--hf-latency-ms 400] [--gemini-latency-ms 800] [--out e2e.json] [--compare old.json]
+
+Starts benchmarks.stubs.StubUpstreams (Groq, Hugging Face) in this process,
+builds a tiny classifier, a tokenizer, a small knowledge-base index, a PDF
+and a scan, and launches the server in a subprocess with every external dependency
+pointed at a stub: Gemini and the embedder use their stub backends, and
+Pinecone is replaced by the local index backend. The explanation store
+starts empty, so Gemini latency is only paid until each label is cached,
+as in production; the prediction and answer caches are off unless --caches.
+
+Each scenario runs at each concurrency level. Throughput, p50/p95/p99
+latency, server CPU (whole process tree) and peak RSS are written to --out
+as JSON. --compare prints the change against an earlier run, so commits
+can be compared on the same machine. A scenario level where every request
+fails prints the first error response and makes the run exit non-zero.
+"""
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+import psutil
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stubs import StubUpstreams, make_pdf, make_stub_classifier, make_stub_tokenizer, scan_jpeg
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS = [
+    "What are the symptoms of a glioma?",
+    "How is a meningioma treated?",
+    "Can pituitary tumors affect vision?",
+    "What does an MRI show for a brain tumor?",
+]
+PDF_QUESTIONS = ["What is the hemoglobin level?", "Summarize the MRI findings.", "Is anything abnormal?"]
+LABELS = ["glioma", "meningioma", "notumor", "pituitary"]
+SCENARIOS = ["predict", "chatbot", "chat_pdf_upload", "chat_pdf_ask", "report"]
+
+
+class Fixtures:
+    """Inputs on disk shared by the server and the load generator."""
+
+    def __init__(self, directory, images=8, pdf_pages=10):
+        self.directory = directory
+        self.model_path = os.path.join(directory, "classifier.onnx")
+        make_stub_classifier(self.model_path)
+        self.images = [scan_jpeg(seed) for seed in range(images)]
+        self.image_path = os.path.join(directory, "scan.jpg")
+        with open(self.image_path, "wb") as f:
+            f.write(self.images[0])
+        self.pdf_path = os.path.join(directory, "report.pdf")
+        make_pdf(self.pdf_path, pdf_pages)
+        with open(self.pdf_path, "rb") as f:
+            self.pdf = f.read()
+        self.tokenizer_path = os.path.join(directory, "tokenizer.json")
+        make_stub_tokenizer(self.tokenizer_path, QUESTIONS + PDF_QUESTIONS)
+        self.index_dir = os.path.join(directory, "kb_index")
+        self._write_index()
+        self.session_id = None
+
+    def _write_index(self, passages=200):
+        from utils.embedding_service import StubEncoder
+        from utils.retrieval import LocalBackend
+
+        texts = [f"Passage {i}: {QUESTIONS[i % len(QUESTIONS)]} Clinical background and treatment notes."
+                 for i in range(passages)]
+        LocalBackend.write(self.index_dir, [f"kb-{i}" for i in range(passages)],
+                           StubEncoder().encode(texts), [{"texts": text} for text in texts])
+
+
+def request_for(scenario, fixtures, i):
+    """(method, path, httpx request kwargs) for the i-th request of a scenario."""
+    if scenario == "predict":
+        image = fixtures.images[i % len(fixtures.images)]
+        return "POST", "/api/interface/predict", {"files": {"file": ("scan.jpg", image, "image/jpeg")}}
+    if scenario == "chatbot":
+        return "POST", "/api/chatbot", {"json": {"text": QUESTIONS[i % len(QUESTIONS)]}}
+    if scenario == "chat_pdf_upload":
+        return "POST", "/api/chat-pdf/upload", {"files": {"file": ("report.pdf", fixtures.pdf, "application/pdf")}}
+    if scenario == "chat_pdf_ask":
+        return ("POST", f"/api/chat-pdf/ask/{fixtures.session_id}",
+                {"json": {"text": PDF_QUESTIONS[i % len(PDF_QUESTIONS)]}})
+    if scenario == "report":
+        return "POST", "/api/report/generate", {"json": {
+            "image_path": fixtures.image_path, "tumor_type": LABELS[i % len(LABELS)], "confidence": 91.5}}
+    raise ValueError(f"Unknown scenario '{scenario}'")
+
+
+def failed(response):
+    if response.status_code >= 400:
+        return True
+    # The JSON endpoints report some failures with a 200 and success: false
+    if response.headers.get("content-type", "").startswith("application/json"):
+        return response.json().get("success") is False
+    return False
+
+
+def server_env(args, fixtures, stubs, port):
+    env = dict(os.environ)
+    env.update({
+        "CLASSIFIER_MODEL_PATH": fixtures.model_path,
+        "UPSTREAM_GROQ_BASE_URL": stubs.base_url,
+        "UPSTREAM_HUGGINGFACE_BASE_URL": stubs.base_url,
+        "GROQ_API_KEY": "stub",
+        "HUGGING_FACE_API_KEY": "stub",
+        "SEGMENTATION_BACKEND": "remote",
+        "RETRIEVAL_BACKEND": "local",
+        "LOCAL_INDEX_DIR": fixtures.index_dir,
+        "EMBEDDING_BACKEND": "stub",
+        "PDF_TOKENIZER": fixtures.tokenizer_path,
+        "EXPLANATION_BACKEND": "stub",
+        "EXPLANATION_STUB_LATENCY_MS": str(args.gemini_latency_ms),
+        "EXPLANATION_STORE_PATH": os.path.join(fixtures.directory, "explanations.sqlite3"),
+        "EXPLANATION_WARMUP": "0",
+        "PDF_SESSION_BACKEND": "memory",
+        "STARTUP_WARMUP": "background",
+        "PORT": str(port),
+    })
+    if not args.caches:
+        env.update({"PREDICTION_CACHE": "0", "ANSWER_CACHE": "0"})
+    return env
+
+
+def server_command(args, port):
+    address = f"127.0.0.1:{port}"
+    if args.server == "gunicorn":
+        return [sys.executable, "-m", "gunicorn", "-w", str(args.workers), "--threads", str(args.threads),
+                "-b", address, "app:app"]
+    if args.server == "uvicorn":
+        return [sys.executable, "-m", "uvicorn", "asgi:application", "--workers", str(args.workers),
+                "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    return [sys.executable, "-c",
+            f"from app import app; app.run(host='127.0.0.1', port={port}, threaded=True)"]
+
+
+def free_port():
+    import socket
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(base_url, proc, timeout):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            if httpx.get(base_url + "/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise TimeoutError(f"Server not ready after {timeout}s")
+
+
+class ResourceSampler:
+    """CPU seconds and peak RSS of the server's whole process tree."""
+
+    def __init__(self, pid, interval=0.05):
+        self.root = psutil.Process(pid)
+        self.interval = interval
+
+    def _tree(self):
+        try:
+            return [self.root] + self.root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def _cpu(self):
+        total = 0.0
+        for proc in self._tree():
+            try:
+                times = proc.cpu_times()
+                total += times.user + times.system
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def _rss(self):
+        total = 0
+        for proc in self._tree():
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+
+    def __enter__(self):
+        self.peak_rss = self._rss()
+        self.cpu_start = self._cpu()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self._rss())
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+        self.cpu_seconds = self._cpu() - self.cpu_start
+        return False
+
+
+async def drive(base_url, scenario, fixtures, concurrency, total, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies, errors, counter = [], 0, iter(range(total))
+    first_error = None
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors, first_error
+            for i in counter:
+                method, path, kwargs = request_for(scenario, fixtures, i)
+                start = time.perf_counter()
+                try:
+                    response = await client.request(method, path, **kwargs)
+                    error = f"HTTP {response.status_code}: {response.text[:500]}" if failed(response) else None
+                except httpx.HTTPError as e:
+                    error = f"{type(e).__name__}: {str(e)}"
+                latencies.append(time.perf_counter() - start)
+                if error is not None:
+                    errors += 1
+                    first_error = first_error or error
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return latencies, errors, first_error, elapsed
+
+
+def run_level(base_url, server_pid, stubs, scenario, fixtures, concurrency, total, timeout):
+    upstream_before = dict(stubs.requests)
+    with ResourceSampler(server_pid) as resources:
+        latencies, errors, first_error, elapsed = asyncio.run(drive(base_url, scenario, fixtures, concurrency, total, timeout))
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": int(errors),
+        "first_error": first_error,
+        "seconds": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(float(lat_ms.mean()), 2),
+        "p50_ms": round(float(np.percentile(lat_ms, 50)), 2),
+        "p95_ms": round(float(np.percentile(lat_ms, 95)), 2),
+        "p99_ms": round(float(np.percentile(lat_ms, 99)), 2),
+        "cpu_seconds": round(resources.cpu_seconds, 3),
+        "cpu_percent": round(resources.cpu_seconds / elapsed * 100, 1),
+        "rss_peak_mb": round(resources.peak_rss / 2 ** 20, 1),
+        "upstream_requests": {k: stubs.requests[k] - upstream_before[k] for k in stubs.requests},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(results, path):
+    with open(path) as f:
+        previous = {(r["scenario"], r["concurrency"]): r for r in json.load(f)["results"]}
+    print(f"\nvs {path}")
+    print(f"{'scenario':<16} {'conc':>5} {'req/s':>9} {'p95 ms':>9} {'cpu %':>8} {'rss MB':>8}")
+    for r in results:
+        old = previous.get((r["scenario"], r["concurrency"]))
+        if old is None:
+            continue
+
+        def delta(key):
+            return f"{(r[key] - old[key]) / old[key] * 100:+.1f}%" if old[key] else "n/a"
+
+        print(f"{r['scenario']:<16} {r['concurrency']:>5} {delta('rps'):>9} {delta('p95_ms'):>9} "
+              f"{delta('cpu_percent'):>8} {delta('rss_peak_mb'):>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--server", choices=["flask", "gunicorn", "uvicorn"], default="flask")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--concurrency", default="1,8,32")
+    parser.add_argument("--requests", type=int, default=100, help="requests per scenario and level")
+    parser.add_argument("--groq-latency-ms", type=float, default=300.0)
+    parser.add_argument("--hf-latency-ms", type=float, default=400.0)
+    parser.add_argument("--gemini-latency-ms", type=float, default=800.0)
+    parser.add_argument("--caches", action="store_true", help="keep the prediction and answer caches on")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    parser.add_argument("--out", default="e2e.json")
+    parser.add_argument("--compare")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    levels = [int(c) for c in args.concurrency.split(",")]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        fixtures = Fixtures(tmp)
+        stubs = StubUpstreams(groq_latency_ms=args.groq_latency_ms,
+                              huggingface_latency_ms=args.hf_latency_ms).start()
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        log_path = os.path.join(tmp, "server.log")
+        with open(log_path, "w") as log:
+            proc = subprocess.Popen(server_command(args, port), cwd=ROOT, env=server_env(args, fixtures, stubs, port),
+                                    stdout=log, stderr=subprocess.STDOUT)
+        try:
+            started = time.perf_counter()
+            wait_ready(base_url, proc, args.startup_timeout)
+            ready_seconds = time.perf_counter() - started
+
+            if "chat_pdf_ask" in scenarios:
+                method, path, kwargs = request_for("chat_pdf_upload", fixtures, 0)
+                response = httpx.request(method, base_url + path, timeout=args.timeout, **kwargs)
+                if failed(response):
+                    raise RuntimeError(f"PDF upload for chat_pdf_ask failed: HTTP {response.status_code}: "
+                                       f"{response.text[:500]}")
+                fixtures.session_id = response.json()["session_id"]
+
+            results = []
+            print(f"{'scenario':<16} {'conc':>5} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 ms':>8} "
+                  f"{'p95 ms':>8} {'p99 ms':>8} {'cpu %':>7} {'rss MB':>7}")
+            for scenario in scenarios:
+                for concurrency in levels:
+                    r = run_level(base_url, proc.pid, stubs, scenario, fixtures, concurrency,
+                                  args.requests, args.timeout)
+                    results.append(r)
+                    print(f"{scenario:<16} {concurrency:>5} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.1f} "
+                          f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} {r['p99_ms']:>8.1f} "
+                          f"{r['cpu_percent']:>7.1f} {r['rss_peak_mb']:>7.1f}")
+                    if r["errors"] == r["requests"]:
+                        print(f"    every request failed; first error: {r['first_error']}")
+        except Exception:
+            with open(log_path) as log:
+                sys.stderr.write(log.read()[-4000:])
+            raise
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            stubs.stop()
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "server": args.server,
+            "workers": args.workers if args.server != "flask" else 1,
+            "threads": args.threads if args.server == "gunicorn" else None,
+            "ready_seconds": round(ready_seconds, 2),
+            "latency_ms": {"groq": args.groq_latency_ms, "huggingface": args.hf_latency_ms,
+                           "gemini": args.gemini_latency_ms},
+            "caches": args.caches,
+        },
+        "results": results,
+    }
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.out}")
+    if args.compare:
+        compare(results, args.compare)
+    broken = sorted({r["scenario"] for r in results if r["errors"] == r["requests"]})
+    if broken:
+        raise SystemExit(f"Every request failed in: {', '.join(broken)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Compare the WSGI and ASGI serving modes under concurrent load.
+
+Start both servers (pointing GROQ etc. at slow upstreams makes the difference
+visible), then run:
+
+    gunicorn -w 2 --threads 8 -b :8000 app:app
+    uvicorn asgi:application --workers 2 --port 8001
+    python -m benchmarks.load_test --target wsgi=http://localhost:8000 \
+        --target asgi=http://localhost:8001 --concurrency 10,100,300
+
+By default the chatbot endpoint is exercised; use --path/--body for others.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+import numpy as np
+
+
+async def run_level(base_url, path, body, concurrency, requests_per_client, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    latencies = []
+    errors = 0
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        async def worker():
+            nonlocal errors
+            for _ in range(requests_per_client):
+                start = time.perf_counter()
+                try:
+                    response = await client.post(path, json=body)
+                    if response.status_code >= 500:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    lat_ms = np.array(latencies) * 1000.0
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": float(np.percentile(lat_ms, 50)),
+        "p99_ms": float(np.percentile(lat_ms, 99)),
+    }
+
+
+async def main_async(args):
+    body = json.loads(args.body)
+    targets = dict(t.split("=", 1) for t in args.target)
+    print(f"{'target':<8} {'conc':>5} {'reqs':>6} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        for name, url in targets.items():
+            r = await run_level(url, args.path, body, concurrency, args.requests, args.timeout)
+            print(f"{name:<8} {concurrency:>5} {r['requests']:>6} {r['errors']:>5} "
+                  f"{r['rps']:>8.1f} {r['p50_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", action="append", required=True, help="name=base_url")
+    parser.add_argument("--path", default="/api/chatbot")
+    parser.add_argument("--body", default='{"text": "What are the symptoms of a glioma?"}')
+    parser.add_argument("--concurrency", default="10,100")
+    parser.add_argument("--requests", type=int, default=5, help="requests per client")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
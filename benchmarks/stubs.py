@@ -0,0 +1,261 @@
+"""Offline stand-ins shared by the benchmarks: tiny ONNX models, synthetic
+inputs and a local HTTP server that answers like Groq and Hugging Face.
+
+Point the app at the server with UPSTREAM_GROQ_BASE_URL and
+UPSTREAM_HUGGINGFACE_BASE_URL; Gemini, Pinecone and the embedder have
+in-process stub backends (EXPLANATION_BACKEND=stub, RETRIEVAL_BACKEND=local,
+EMBEDDING_BACKEND=stub), and PDF_TOKENIZER can point at make_stub_tokenizer's file.
+"""
+import http.server
+import io
+import json
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+STUB_ANSWER = {
+    "message": "The report describes a 2.1 cm lesion in the left frontal lobe.",
+    "description": "Findings are consistent with a low-grade glioma; follow-up imaging is advised.",
+    "lists": ["Lesion size: 2.1 cm", "Location: left frontal lobe", "Mild surrounding edema"],
+}
+
+
+def _save(model, path):
+    import onnx
+
+    model.ir_version = 8  # loadable by older onnxruntime releases
+    onnx.save(model, path)
+
+
+def make_stub_classifier(path):
+    """The classifier's interface (N x 224 x 224 x 3 -> N x 4 softmax) with almost no compute."""
+    from onnx import TensorProto, helper
+
+    weights = np.random.default_rng(0).random((3, 4), dtype=np.float32)
+    graph = helper.make_graph(
+        [
+            helper.make_node("ReduceMean", ["input", "axes"], ["pooled"], keepdims=0),
+            helper.make_node("MatMul", ["pooled", "w"], ["logits"]),
+            helper.make_node("Softmax", ["logits"], ["output"], axis=-1),
+        ],
+        "stub_classifier",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 224, 224, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 4])],
+        [helper.make_tensor("w", TensorProto.FLOAT, [3, 4], weights.ravel()),
+         helper.make_tensor("axes", TensorProto.INT64, [2], [1, 2])],
+    )
+    _save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 18)]), path)
+
+
+def make_stub_cnn_classifier(path, width=32):
+    """A small conv net with the classifier's interface, for quantization runs without the real model.
+
+    NHWC input -> 3 strided Conv/BatchNorm/Relu blocks -> global pool -> Gemm -> softmax.
+    """
+    from onnx import TensorProto, helper
+
+    rng = np.random.default_rng(0)
+    initializers, nodes, channels = [], [], 3
+
+    def tensor(name, values):
+        initializers.append(helper.make_tensor(name, TensorProto.FLOAT, values.shape,
+                                               values.astype(np.float32).ravel()))
+        return name
+
+    nodes.append(helper.make_node("Transpose", ["input"], ["nchw"], perm=[0, 3, 1, 2]))
+    # Inputs arrive as 0..255; scale so activations stay in a realistic range
+    nodes.append(helper.make_node("Mul", ["nchw", tensor("scale", np.array([1 / 255.0]))], ["scaled"]))
+    current = "scaled"
+    for i, out_channels in enumerate([width, width * 2, width * 4]):
+        w = rng.normal(0, np.sqrt(2 / (channels * 9)), (out_channels, channels, 3, 3))
+        nodes.append(helper.make_node("Conv", [current, tensor(f"w{i}", w)], [f"c{i}"],
+                                      pads=[1, 1, 1, 1], strides=[2, 2]))
+        bn = [tensor(f"bn{i}_{k}", v) for k, v in (
+            ("scale", rng.uniform(0.5, 1.5, out_channels)), ("bias", rng.normal(0, 0.1, out_channels)),
+            ("mean", rng.normal(0, 0.1, out_channels)), ("var", rng.uniform(0.5, 1.5, out_channels)))]
+        nodes.append(helper.make_node("BatchNormalization", [f"c{i}"] + bn, [f"b{i}"]))
+        nodes.append(helper.make_node("Relu", [f"b{i}"], [f"r{i}"]))
+        current, channels = f"r{i}", out_channels
+    nodes += [
+        helper.make_node("GlobalAveragePool", [current], ["pooled"]),
+        helper.make_node("Flatten", ["pooled"], ["flat"]),
+        helper.make_node("Gemm", ["flat", tensor("fc_w", rng.normal(0, 1, (channels, 4))),
+                                  tensor("fc_b", np.zeros(4))], ["logits"]),
+        helper.make_node("Softmax", ["logits"], ["output"], axis=-1),
+    ]
+    graph = helper.make_graph(
+        nodes, "stub_cnn_classifier",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 224, 224, 3])],
+        [helper.make_tensor_value_info("output", TensorProto.FLOAT, ["N", 4])],
+        initializers,
+    )
+    _save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 17)]), path)
+
+
+def make_stub_tokenizer(path, texts=()):
+    """A word-level tokenizer.json standing in for the chat model's (PDF_TOKENIZER).
+
+    Splits on whitespace and punctuation like a real pre-tokenizer; words seen
+    in `texts` get their own ids, anything else maps to [UNK] (still one token).
+    """
+    from tokenizers import Tokenizer, models, pre_tokenizers
+
+    words = sorted({word for text in texts for word in text.lower().split()})
+    vocab = {"[UNK]": 0, **{word: i + 1 for i, word in enumerate(words)}}
+    tokenizer = Tokenizer(models.WordLevel(vocab, unk_token="[UNK]"))
+    tokenizer.pre_tokenizer = pre_tokenizers.Whitespace()
+    tokenizer.save(path)
+
+
+def make_stub_segmenter(path, size=256):
+    """A small U-Net-shaped model: NCHW 1x3xSxS -> 1x1xSxS sigmoid mask."""
+    from onnx import TensorProto, helper
+
+    rng = np.random.default_rng(0)
+    weights = [
+        helper.make_tensor("w1", TensorProto.FLOAT, [16, 3, 3, 3], rng.normal(size=16 * 27).astype(np.float32)),
+        helper.make_tensor("w2", TensorProto.FLOAT, [16, 16, 3, 3], rng.normal(size=16 * 144).astype(np.float32)),
+        helper.make_tensor("w3", TensorProto.FLOAT, [1, 16, 1, 1], rng.normal(size=16).astype(np.float32)),
+    ]
+    nodes = [
+        helper.make_node("Conv", ["input", "w1"], ["c1"], pads=[1, 1, 1, 1]),
+        helper.make_node("Relu", ["c1"], ["r1"]),
+        helper.make_node("Conv", ["r1", "w2"], ["c2"], pads=[1, 1, 1, 1]),
+        helper.make_node("Relu", ["c2"], ["r2"]),
+        helper.make_node("Conv", ["r2", "w3"], ["c3"]),
+        helper.make_node("Sigmoid", ["c3"], ["mask"]),
+    ]
+    graph = helper.make_graph(
+        nodes, "stub_segmenter",
+        [helper.make_tensor_value_info("input", TensorProto.FLOAT, ["N", 3, size, size])],
+        [helper.make_tensor_value_info("mask", TensorProto.FLOAT, ["N", 1, size, size])],
+        initializer=weights,
+    )
+    _save(helper.make_model(graph, opset_imports=[helper.make_opsetid("", 13)]), path)
+
+
+def scan_jpeg(seed=0, size=512):
+    buffer = io.BytesIO()
+    pixels = np.random.default_rng(seed).integers(0, 255, (size, size, 3), dtype=np.uint8)
+    Image.fromarray(pixels).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_pdf(path, pages=10):
+    """Text pages of lab values, with an MRI-like figure on every third page."""
+    import fitz
+
+    document = fitz.open()
+    for i in range(pages):
+        page = document.new_page()
+        page.insert_text((72, 72), f"Laboratory report - page {i + 1}", fontsize=16)
+        body = "\n\n".join(f"Hemoglobin {12 + (i + j) % 4}.{j} g/dL. " + "Within normal limits. " * 8
+                           for j in range(6))
+        if i % 3 == 2:
+            body = "MRI findings: a 2.1 cm enhancing lesion in the left frontal lobe.\n\n" + body
+            page.insert_image(fitz.Rect(320, 420, 540, 640), stream=scan_jpeg(i, 256))
+        page.insert_textbox(fitz.Rect(72, 100, 540, 410 if i % 3 == 2 else 760), body, fontsize=10)
+    document.save(path)
+
+
+class StubUpstreams:
+    """Threaded local server answering Groq chat completions (JSON or SSE) and
+    Hugging Face segmentation requests after a configurable delay."""
+
+    def __init__(self, groq_latency_ms=0.0, huggingface_latency_ms=0.0, segmentation_reply=None,
+                 stream_tokens=20):
+        self.latency = {"groq": groq_latency_ms / 1000.0, "huggingface": huggingface_latency_ms / 1000.0}
+        self.segmentation_reply = segmentation_reply or scan_jpeg(1)
+        self.stream_tokens = stream_tokens
+        self.requests = {"groq": 0, "huggingface": 0}
+        self._lock = threading.Lock()
+        self.server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="stub-upstreams", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _count(self, upstream):
+        with self._lock:
+            self.requests[upstream] += 1
+
+    def _handler(self):
+        stub = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if self.path.endswith("/chat/completions"):
+                    stub._count("groq")
+                    time.sleep(stub.latency["groq"])
+                    request = json.loads(body or b"{}")
+                    if request.get("stream"):
+                        return self._stream_completion()
+                    return self._send(200, "application/json", json.dumps(_completion(request)).encode())
+                if self.path.startswith("/models/"):
+                    stub._count("huggingface")
+                    time.sleep(stub.latency["huggingface"])
+                    return self._send(200, "image/jpeg", stub.segmentation_reply)
+                self._send(404, "application/json", b'{"error": "not found"}')
+
+            def _send(self, status, content_type, payload):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def _stream_completion(self):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                text = json.dumps(STUB_ANSWER)
+                step = max(1, len(text) // stub.stream_tokens)
+                for start in range(0, len(text), step):
+                    self._chunk(_sse({"choices": [{"index": 0, "delta": {"content": text[start:start + step]}}]}))
+                self._chunk(b"data: [DONE]\n\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n".encode()
+
+
+def _completion(request):
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": request.get("model", "stub"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(STUB_ANSWER)},
+            "finish_reason": "stop",
+        }],
+        "usage": {"prompt_tokens": 100, "completion_tokens": 60, "total_tokens": 160},
+    }
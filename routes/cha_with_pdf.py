@@ -1,10 +1,18 @@
-from flask import Blueprint, jsonify, request, current_app
-from utils.chat_with_pdf_util import process_pdf, answer_query
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+from utils.chat_with_pdf_util import process_pdf, answer_query, stream_answer, create_llm
+from utils.token_budget import warm_tokenizer
+from utils.session_store import get_session_store
+from utils.streaming import SSE_HEADERS, sse_stream, wants_stream
+from utils.warmup import register_subsystem
+import importlib
 import uuid, os
 import logging
 
 chat_with_pdf_bp = Blueprint('chat_with_pdf', __name__)
-pdf_contexts = {}
+
+register_subsystem("pdf_parser", lambda: importlib.import_module("fitz"))
+register_subsystem("pdf_llm", create_llm)
+register_subsystem("pdf_tokenizer", warm_tokenizer)
 
 @chat_with_pdf_bp.route("/upload", methods=["POST"])
 def upload_pdf():
@@ -21,13 +29,17 @@ def upload_pdf():
         os.makedirs(upload_folder, exist_ok=True)
         filepath = os.path.join(upload_folder, filename)
         file.save(filepath)
-
-        context = process_pdf(filepath)
-        os.remove(filepath)
+        try:
+            context = process_pdf(filepath)
+        finally:
+            os.remove(filepath)
         
         session_id = str(uuid.uuid4())
-        pdf_contexts[session_id] = context
-        current_app.logger.info(f"Session {session_id} created. Total sessions: {len(pdf_contexts)}")
+        try:
+            get_session_store().put(session_id, context)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 413
+        current_app.logger.info(f"Session {session_id} created ({len(context['pages'])} pages)")
 
         return jsonify({
             "success": True,
@@ -47,18 +59,26 @@ def ask_question(session_id):
         text_query = data.get("text", "").strip() if data else ""
         
         current_app.logger.info(f"Ask request - Session ID: {session_id}, Text: {text_query}")
-        current_app.logger.info(f"Existing sessions: {list(pdf_contexts.keys())}")
 
-        if not session_id or session_id not in pdf_contexts:
+        context = get_session_store().get(session_id) if session_id else None
+        if context is None:
             return jsonify({"success": False, "message": "Invalid or missing session_id"}), 400
         if not text_query:
             return jsonify({"success": False, "message": "Text query is empty"}), 400
 
-        context = pdf_contexts[session_id]
-        answer = answer_query(context, text_query)
+        if wants_stream(request.args.get("stream"), request.headers.get("Accept")):
+            return Response(stream_with_context(sse_stream(stream_answer(context, text_query))),
+                            mimetype="text/event-stream", headers=SSE_HEADERS)
+
+        answer, omitted_pages = answer_query(context, text_query)
 
-        return jsonify({"success": True, "answer": answer}), 200
+        # Pages whose images could not be sent (PDF_MAX_IMAGES or the token budget)
+        return jsonify({"success": True, "answer": answer, "omitted_pages": omitted_pages}), 200
 
     except Exception as e:
         current_app.logger.error(f"Ask error: {str(e)}")
-        return jsonify({"success": False, "message": str(e)}), 500
\ No newline at end of file
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@chat_with_pdf_bp.route("/stats", methods=["GET"])
+def session_stats():
+    return jsonify({"success": True, "data": get_session_store().stats()}), 200
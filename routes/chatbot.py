@@ -1,8 +1,28 @@
-from flask import Blueprint, jsonify, request
-from utils.chatbot_utils import process_text
+import hmac
+import os
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from utils.answer_cache import answer_cache
+from utils.chatbot_utils import process_text, process_text_stream
+from utils.embedding_service import get_embedding_service
+from utils.retrieval import get_retriever
+from utils.streaming import SSE_HEADERS, sse_stream, wants_stream
+from utils.warmup import register_subsystem
 
 chatbot_bp = Blueprint('chatbot', __name__)
 
+register_subsystem("embedder", lambda: get_embedding_service().embed("warmup"))
+register_subsystem("retriever", get_retriever)
+
+# Cache administration requires a matching X-Admin-Token header; unset disables it
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def is_admin():
+    if not ADMIN_TOKEN:
+        return False
+    return hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN)
+
 
 @chatbot_bp.route("/chatbot", methods=["POST"])
 def handle_chat():
@@ -16,6 +36,11 @@ def handle_chat():
                     "message": "Text query is empty"
                 }), 400
 
+            # ?stream=1 / Accept: text/event-stream sends tokens as server-sent events
+            if wants_stream(request.args.get("stream"), request.headers.get("Accept")):
+                return Response(stream_with_context(sse_stream(process_text_stream(text_query))),
+                                mimetype="text/event-stream", headers=SSE_HEADERS)
+
             response = process_text(text_query)
             
             return jsonify({
@@ -29,3 +54,20 @@ def handle_chat():
             "success": False, 
             "message": str(e)
         }), 500
+
+
+@chatbot_bp.route("/chatbot/cache", methods=["GET"])
+def answer_cache_stats():
+    if answer_cache is None:
+        return jsonify({"success": False, "message": "Answer cache is disabled"}), 404
+    return jsonify({"success": True, "data": answer_cache.stats()}), 200
+
+
+@chatbot_bp.route("/chatbot/cache/flush", methods=["POST"])
+def flush_answer_cache():
+    if not is_admin():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+    if answer_cache is None:
+        return jsonify({"success": False, "message": "Answer cache is disabled"}), 404
+    removed = answer_cache.clear()
+    return jsonify({"success": True, "message": f"Flushed {removed} cached answers"}), 200
@@ -1,82 +1,101 @@
-from utils.image_processing import process_image
-from flask import Blueprint, request, jsonify
+from utils.preprocessing import TARGET_SIZE, buffer_pool, load_image, process_image
+from utils.uploads import read_upload
+from utils.inference_engine import get_engine
+from utils.model_registry import model_identity
+from utils.prediction_cache import image_cache_key, prediction_cache
+from utils.instrumentation import stage
+from utils.warmup import register_subsystem
+from utils.batch_predict import (
+    ARCHIVE_TYPES, PREDICT_BATCH_MAX_IMAGE_BYTES, BatchInputError, is_archive, iter_archive_body, iter_uploads,
+    predict_entries,
+)
+from utils.volumes import AGGREGATE_METHODS, VolumeError, open_volume, predict_volume, select_slices
+from utils.explanations import (
+    CLASS_LABELS, FALLBACK_MESSAGE, cached_explanation, clean_ai_json_response,  # noqa: F401
+    explanation_jobs, explanation_store, generate_explanation, job_view,
+)
+from flask import Blueprint, Response, request, jsonify, stream_with_context, url_for
 from dotenv import load_dotenv
-import google.generativeai as genai
-import os
-import requests
-import onnxruntime as ort
 import numpy as np
-import uuid
 import logging
-from werkzeug.utils import secure_filename
-from PIL import Image
+from PIL import Image, UnidentifiedImageError
+from werkzeug.exceptions import RequestEntityTooLarge
 import json
-import re
-
-def clean_ai_json_response(response: str):
-    try:
-        # Remove ```json, ```, and any wrapping quotes or escape characters
-        cleaned = re.sub(r'```json|```', '', response).strip()
-        
-        # Unescape any escape sequences like \n, \", etc.
-        cleaned = bytes(cleaned, "utf-8").decode("unicode_escape")
-        
-        # Load and return as JSON
-        return json.loads(cleaned)
-    except Exception as e:
-        print("Error:", e)
-        return None
+import os
+import shutil
+import tempfile
 
 load_dotenv()
 
-genai_api_key = os.getenv("GEMINI_API_KEY")
-if not genai_api_key:
-    raise EnvironmentError("Missing GEMINI_API_KEY in .env file")
-genai.configure(api_key=genai_api_key)
-
 # Flask Blueprint
 interface_bp = Blueprint('interface', __name__)
 
+# The ONNX session (and a download, if the model file is missing) is created on
+# first use or by the startup warmup, not at import
+register_subsystem("classifier", lambda: get_engine().warmup())
+
 # Logger
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Constants
-MODEL_PATH = os.path.join("models", "brain_tumor_classifier.onnx")
-MODEL_URL = "https://huggingface.co/shuvsut/efficientv2Lonnx/resolve/main/brain_tumor_classifier.onnx"
-if not os.path.exists(MODEL_PATH):
-    os.makedirs("models", exist_ok=True)
-    logger.info("Downloading ONNX model from Hugging Face...")
-    response = requests.get(MODEL_URL)
-    if response.status_code == 200:
-        with open(MODEL_PATH, "wb") as f:
-            f.write(response.content)
-        logger.info("Model downloaded successfully.")
-    else:
-        logger.error(f"Failed to download model. HTTP {response.status_code}")
-        raise RuntimeError("Could not download model from Hugging Face.")
-
-UPLOAD_FOLDER = "uploads"
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'webp'}
 MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB
-
-# Load ONNX model
-try:
-    ort_session = ort.InferenceSession(MODEL_PATH)
-    input_details = ort_session.get_inputs()[0]
-    logger.info(f"Loaded ONNX model. Input shape: {input_details.shape}")
-except Exception as e:
-    logger.error(f"Model loading failed: {str(e)}")
-    raise RuntimeError("Model initialization failed")
+SSE_KEEPALIVE_SECONDS = 15
+# Multipart batches are buffered in memory; larger studies should be sent as a raw zip/tar body
+BATCH_MAX_CONTENT_LENGTH = int(os.getenv("PREDICT_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+BATCH_MAX_ARCHIVE_LENGTH = int(os.getenv("PREDICT_BATCH_MAX_ARCHIVE_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Volumes are written to disk (and memory-mapped from there), never held in memory
+VOLUME_MAX_CONTENT_LENGTH = int(os.getenv("VOLUME_MAX_BYTES", str(1024 * 1024 * 1024)))
+VOLUME_SPOOL_BYTES = 4 * 1024 * 1024
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def cache_bypassed():
+    """Clients skip the prediction cache with `X-Bypass-Cache: 1`, `Cache-Control: no-cache` or `?cache=0`."""
+    return (
+        request.headers.get("X-Bypass-Cache", "").lower() in ("1", "true", "yes")
+        or "no-cache" in request.headers.get("Cache-Control", "").lower()
+        or request.args.get("cache", "1").lower() in ("0", "false", "no")
+    )
+
+def wants_ndjson():
+    """`?stream=1` or `Accept: application/x-ndjson` streams one JSON line per result."""
+    return (
+        request.args.get("stream", "").lower() in ("1", "true", "yes")
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+    )
+
+def explain_async():
+    """`?explain=async` or `Prefer: respond-async` returns the label before the explanation."""
+    return (
+        request.args.get("explain", "").lower() == "async"
+        or "respond-async" in request.headers.get("Prefer", "").lower()
+    )
+
+@interface_bp.route("/stats", methods=["GET"])
+def inference_stats():
+    return jsonify({
+        "success": True,
+        "data": {
+            "engine": get_engine().stats(),
+            "prediction_cache": prediction_cache.stats() if prediction_cache else None,
+            "explanation_jobs": explanation_jobs.stats(),
+            "explanation_store": explanation_store.stats(),
+        }
+    })
+
 @interface_bp.route("/predict", methods=["POST"])
 def predict_image():
     try:
-        logger.info(f"Incoming request headers: {request.headers}")
-        logger.info(f"Request files: {request.files}")
+        # Checked before the multipart body is parsed; werkzeug also enforces it
+        # while streaming when the client sends no Content-Length.
+        request.max_content_length = MAX_CONTENT_LENGTH
+        # Small enough to decode from memory without a temporary file
+        request.buffer_in_memory = True
+        if request.content_length is not None and request.content_length > MAX_CONTENT_LENGTH:
+            raise RequestEntityTooLarge()
 
         if 'file' not in request.files:
             logger.error("No 'file' key in request.files")
@@ -92,82 +111,288 @@ def predict_image():
             logger.error(f"Invalid file extension: {file.filename}")
             return jsonify({"success": False, "message": "Invalid file type"}), 400
 
-        filename = secure_filename(f"{uuid.uuid4()}_{file.filename}")
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        filepath = os.path.join(UPLOAD_FOLDER, filename)
-
         try:
-            file.save(filepath)
-            logger.info(f"File saved temporarily to {filepath}")
+            # Decode once in memory, straight into preprocessing
+            with stage("upload_read"):
+                data = read_upload(file, MAX_CONTENT_LENGTH)
+            with stage("decode"):
+                try:
+                    image = load_image(data, draft_size=TARGET_SIZE)
+                except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+                    # Corrupt or truncated uploads and non-images with an image extension
+                    logger.error(f"Could not decode {file.filename}: {str(e)}")
+                    return jsonify({"success": False, "message": "Could not decode image"}), 400
+            file.close()
+
+            engine = get_engine()
+            input_details = engine.input_details
 
-            # Preprocess image
-            img = process_image(filepath)
-            logger.info(f"Processed image shape: {img.shape}")
+            cache_key = None
+            cache_status = "DISABLED"
+            if prediction_cache is not None:
+                cache_key = image_cache_key(image, model_identity())
+                if cache_bypassed():
+                    cache_status = "BYPASS"
+                else:
+                    cached = prediction_cache.get(cache_key)
+                    if cached is not None:
+                        response = jsonify({"success": True, "data": cached})
+                        response.headers["X-Prediction-Cache"] = "HIT"
+                        return response
+                    cache_status = "MISS"
 
-            if list(img.shape[1:]) != list(input_details.shape[1:]):
-                logger.error(f"Shape mismatch. Got {img.shape[1:]}, needs {input_details.shape[1:]}")
-                return jsonify({"success": False, "message": "Image processing error"}), 400
+            with buffer_pool.borrow(1) as img:
+                # Preprocess image into a pooled input tensor
+                with stage("preprocess"):
+                    process_image(image, out=img)
 
-            if img.dtype != np.float32:
-                img = img.astype(np.float32)
+                if list(img.shape[1:]) != list(input_details.shape[1:]):
+                    logger.error(f"Shape mismatch. Got {img.shape[1:]}, needs {input_details.shape[1:]}")
+                    return jsonify({"success": False, "message": "Image processing error"}), 400
+
+                # Run ONNX prediction
+                with stage("onnx_run", model="classifier"):
+                    prediction = engine.predict(img)
 
-            # Run ONNX prediction
-            prediction = ort_session.run(None, {input_details.name: img})[0]
             class_index = np.argmax(prediction[0])
             confidence = float(prediction[0][class_index])
-            label = ['glioma', 'meningioma', 'notumor', 'pituitary'][class_index]
+            label = CLASS_LABELS[class_index]
+
+            if explain_async():
+                message = cached_explanation(label, confidence)
+                data = {"result": label, "confidence": confidence, "message": message}
+                if message is None:
+                    job_id = explanation_jobs.submit(label, confidence)
+                    data["explanation_job"] = job_id
+                    data["explanation_url"] = url_for("interface.get_explanation", job_id=job_id)
+                response = jsonify({"success": True, "data": data})
+                response.headers["X-Prediction-Cache"] = cache_status
+                return response
 
             # Generate message with Gemini
             try:
-                gemini_model = genai.GenerativeModel("gemini-1.5-flash")
-                gemini_response = gemini_model.generate_content([
-                    {
-                   "text": (
-                        f"The MRI scan is classified as '{label}' with a confidence of {confidence:.2f}. "
-                        "Based on this label, return a JSON object in the following format:\n\n"
-                        "{\n"
-                        '  "header": "Short, patient-friendly title",\n'
-                        '  "lists": [\n'
-                        '    "Simple explanation of the tumor",\n'
-                        '    "Key symptoms",\n'
-                        '    "Common causes",\n'
-                        '    "Treatment options",\n'
-                        '    "Important notes for patients"\n'
-                        "  ]\n"
-                        "}\n\n"
-                        "BUT — if the label is 'notumor', return only:\n"
-                        '{\n  "header": "There is no brain tumor detected."\n}\n\n'
-                        "Keep the language simple. Do not include any explanation or text outside the JSON object."
-                    )
-                    },
-                    Image.open(filepath)
-                ])
-                gemini_message = clean_ai_json_response(gemini_response.text)
+                with stage("explanation"):
+                    gemini_message = generate_explanation(label, confidence)
             except Exception as g_error:
                 logger.error(f"Gemini response failed: {str(g_error)}")
-                gemini_message = "Unable to retrieve detailed explanation at the moment."
-            
-            return jsonify({
-                "success": True,
-                "data": {
-                    "result": label,
-                    "confidence": confidence,
-                    "message": gemini_message
-                }
-            })
+                gemini_message = FALLBACK_MESSAGE
 
+            data = {
+                "result": label,
+                "confidence": confidence,
+                "message": gemini_message
+            }
+            # Only complete answers are cached, so a Gemini outage is not replayed
+            if cache_key is not None and isinstance(gemini_message, dict):
+                prediction_cache.set(cache_key, data)
+
+            response = jsonify({"success": True, "data": data})
+            response.headers["X-Prediction-Cache"] = cache_status
+            return response
+
+        except RequestEntityTooLarge:
+            raise
         except Exception as e:
             logger.error(f"Prediction failed: {str(e)}", exc_info=True)
             return jsonify({"success": False, "message": "Processing error"}), 500
 
-        finally:
+    except RequestEntityTooLarge:
+        logger.error(f"Upload rejected: larger than {MAX_CONTENT_LENGTH} bytes")
+        return jsonify({"success": False, "message": "File too large"}), 413
+    except Exception as e:
+        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@interface_bp.route("/predict/batch", methods=["POST"])
+def predict_batch():
+    """Classify many images in one request.
+
+    Accepts multipart `files` parts (images, or zip/tar archives of images)
+    or a raw zip/tar body (`Content-Type: application/zip`, `application/x-tar`,
+    `application/gzip`), which is read as it arrives instead of buffered.
+    `?explain=1` adds explanations (`?explain=async` returns job ids instead);
+    `?stream=1` returns NDJSON, one line per image as each batch completes,
+    then a summary line.
+    """
+    content_type = (request.mimetype or "").lower()
+    if content_type.startswith("multipart/"):
+        request.max_content_length = BATCH_MAX_CONTENT_LENGTH
+        if request.content_length is not None and request.content_length > BATCH_MAX_CONTENT_LENGTH:
+            return jsonify({"success": False, "message": "Request too large"}), 413
+        try:
+            files = [f for f in request.files.getlist("files") + request.files.getlist("file") if f.filename]
+        except RequestEntityTooLarge:
+            return jsonify({"success": False, "message": "Request too large"}), 413
+        if not files:
+            return jsonify({"success": False, "message": "No files in request"}), 400
+        entries = iter_uploads(files, allowed_file, PREDICT_BATCH_MAX_IMAGE_BYTES)
+        logger.info(f"Batch predict: {len(files)} parts ({sum(is_archive(f.filename) for f in files)} archives)")
+    elif content_type not in ARCHIVE_TYPES:
+        return jsonify({"success": False, "message": "Send multipart 'files' or a zip/tar request body"}), 400
+    else:
+        request.max_content_length = BATCH_MAX_ARCHIVE_LENGTH
+        if request.content_length is not None and request.content_length > BATCH_MAX_ARCHIVE_LENGTH:
+            return jsonify({"success": False, "message": "Request too large"}), 413
+        entries = iter_archive_body(request.stream, content_type, allowed_file,
+                                    PREDICT_BATCH_MAX_IMAGE_BYTES)
+
+    explain = {"1": "sync", "true": "sync", "sync": "sync", "async": "async"}.get(
+        request.args.get("explain", "").lower())
+    results = predict_entries(
+        entries, explain=explain,
+        explanation_url=lambda job_id: url_for("interface.get_explanation", job_id=job_id),
+    )
+
+    if wants_ndjson():
+        def lines():
+            summary = {"count": 0, "errors": 0}
             try:
-                if os.path.exists(filepath):
-                    os.remove(filepath)
-                    logger.info(f"Removed temporary file: {filepath}")
+                for result in results:
+                    summary["count"] += 1
+                    summary["errors"] += not result["success"]
+                    yield json.dumps(result) + "\n"
+            except (BatchInputError, RequestEntityTooLarge) as e:
+                yield json.dumps({"success": False, "error": str(e) or "Request too large"}) + "\n"
             except Exception as e:
-                logger.error(f"File cleanup failed: {str(e)}")
+                logger.error(f"Batch predict failed: {str(e)}", exc_info=True)
+                yield json.dumps({"success": False, "error": "Processing error"}) + "\n"
+            yield json.dumps({"summary": summary}) + "\n"
+
+        return Response(stream_with_context(lines()), mimetype="application/x-ndjson",
+                        headers={"X-Accel-Buffering": "no"})
 
+    try:
+        data = list(results)
+    except BatchInputError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except RequestEntityTooLarge:
+        return jsonify({"success": False, "message": "Request too large"}), 413
     except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}", exc_info=True)
-        return jsonify({"success": False, "message": "Internal server error"}), 500
+        logger.error(f"Batch predict failed: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "message": "Processing error"}), 500
+    if not data:
+        return jsonify({"success": False, "message": "No images found in request"}), 400
+    return jsonify({"success": True, "data": {
+        "results": data,
+        "count": len(data),
+        "errors": sum(not result["success"] for result in data),
+    }})
+
+
+def _int_arg(name):
+    value = request.args.get(name)
+    return int(value) if value not in (None, "") else None
+
+@interface_bp.route("/predict/volume", methods=["POST"])
+def predict_volume_route():
+    """Classify the axial slices of a NIfTI volume (.nii / .nii.gz) or a zip/tar DICOM series.
+
+    Send the file as multipart `file` or as the raw request body; the format
+    is detected from its content. Query parameters: `start`, `stop` and
+    `stride` pick slices (the default stride keeps at most VOLUME_MAX_SLICES),
+    `window=center,width` overrides the intensity window, `aggregate=topk|mean`
+    picks the study-level rule and `explain=1` adds an explanation of it.
+    """
+    request.max_content_length = VOLUME_MAX_CONTENT_LENGTH
+    if request.content_length is not None and request.content_length > VOLUME_MAX_CONTENT_LENGTH:
+        return jsonify({"success": False, "message": "Volume too large"}), 413
+
+    try:
+        start, stop, stride = _int_arg("start"), _int_arg("stop"), _int_arg("stride")
+        window = request.args.get("window")
+        window = tuple(float(v) for v in window.split(",")) if window else None
+        if window is not None and (len(window) != 2 or window[1] <= 0):
+            raise ValueError("window must be center,width with a positive width")
+        aggregate_method = request.args.get("aggregate")
+        if aggregate_method is not None and aggregate_method not in AGGREGATE_METHODS:
+            raise ValueError(f"aggregate must be one of {', '.join(AGGREGATE_METHODS)}")
+    except ValueError as e:
+        return jsonify({"success": False, "message": f"Invalid parameter: {str(e)}"}), 400
+
+    workdir = tempfile.mkdtemp(prefix="volume-")
+    volume = None
+    try:
+        path = os.path.join(workdir, "upload")
+        with stage("upload_read"):
+            if (request.mimetype or "").startswith("multipart/"):
+                request.spool_threshold = VOLUME_SPOOL_BYTES
+                file = request.files.get("file")
+                if file is None or file.filename == "":
+                    return jsonify({"success": False, "message": "No file part in request"}), 400
+                file.save(path)
+            else:
+                with open(path, "wb") as f:
+                    shutil.copyfileobj(request.stream, f, 1024 * 1024)
+        if os.path.getsize(path) == 0:
+            return jsonify({"success": False, "message": "Empty upload"}), 400
+
+        volume = open_volume(path, workdir)
+        selected = select_slices(volume.depth, start, stop, stride)
+        if len(selected) == 0:
+            return jsonify({"success": False, "message": "No slices selected"}), 400
+        slices, study, (low, high) = predict_volume(volume, selected, window,
+                                                    aggregate_method=aggregate_method)
+        if study is not None and request.args.get("explain", "").lower() in ("1", "true", "yes"):
+            try:
+                with stage("explanation"):
+                    message = generate_explanation(study["result"], study["confidence"])
+            except Exception as g_error:
+                logger.error(f"Gemini response failed: {str(g_error)}")
+                message = None
+            study["message"] = message if message is not None else FALLBACK_MESSAGE
+
+        logger.info(f"Volume {volume.format} {volume.shape}: {len(selected)} slices, "
+                    f"study {study['result'] if study else 'empty'}")
+        return jsonify({"success": True, "data": {
+            "format": volume.format,
+            "shape": list(volume.shape),
+            "axis": volume.axis,
+            "depth": volume.depth,
+            "window": [low, high],
+            "slices_classified": sum(not s.get("skipped") for s in slices),
+            "study": study,
+            "slices": slices,
+        }})
+    except RequestEntityTooLarge:
+        return jsonify({"success": False, "message": "Volume too large"}), 413
+    except VolumeError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Volume prediction failed: {str(e)}", exc_info=True)
+        return jsonify({"success": False, "message": "Processing error"}), 500
+    finally:
+        if volume is not None:
+            volume.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+@interface_bp.route("/explanations/<job_id>", methods=["GET"])
+def get_explanation(job_id):
+    job = explanation_jobs.get(job_id)
+    if job is None:
+        return jsonify({"success": False, "message": "Unknown or expired job id"}), 404
+    status = 200 if job["status"] != "pending" else 202
+    return jsonify({"success": True, "data": job_view(job)}), status
+
+@interface_bp.route("/explanations/<job_id>/stream", methods=["GET"])
+def stream_explanation(job_id):
+    if explanation_jobs.get(job_id) is None:
+        return jsonify({"success": False, "message": "Unknown or expired job id"}), 404
+
+    def events():
+        while True:
+            job = explanation_jobs.wait(job_id, timeout=SSE_KEEPALIVE_SECONDS)
+            if job is None:
+                yield "event: error\ndata: {\"message\": \"Job expired\"}\n\n"
+                return
+            if job["status"] != "pending":
+                yield f"event: explanation\ndata: {json.dumps(job_view(job))}\n\n"
+                return
+            yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
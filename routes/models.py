@@ -0,0 +1,24 @@
+from flask import Blueprint, jsonify
+from routes.chatbot import is_admin
+from utils.model_registry import model_info, get_session
+
+models_bp = Blueprint('models', __name__)
+
+
+@models_bp.route("", methods=["GET"])
+def list_models():
+    return jsonify({"success": True, "data": model_info()}), 200
+
+
+@models_bp.route("/<name>/load", methods=["POST"])
+def load_model(name):
+    # Loading is expensive (download, graph optimisation); same X-Admin-Token gate as the cache flush
+    if not is_admin():
+        return jsonify({"success": False, "message": "Forbidden"}), 403
+    try:
+        get_session(name)
+        return jsonify({"success": True, "data": model_info()}), 200
+    except KeyError as e:
+        return jsonify({"success": False, "message": str(e)}), 404
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
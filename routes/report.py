@@ -1,10 +1,16 @@
 from flask import Blueprint, request, jsonify, send_file
-from utils.pdf_generator import generate_report
-import os
+from utils.pdf_generator import REPORT_BATCH_MAX, generate_report, generate_reports, zip_reports
+from utils.segment_util import get_segmenter
+from utils.warmup import register_subsystem
+import importlib
+import io
 import uuid
 
 report_bp = Blueprint("report", __name__)
 
+register_subsystem("report_renderer", lambda: importlib.import_module("fpdf"))
+register_subsystem("segmenter", get_segmenter)
+
 @report_bp.route("/generate", methods=["POST"])
 def generate_report_route():
     try:
@@ -16,13 +22,42 @@ def generate_report_route():
         if not all([image_path, tumor_type, confidence is not None]):
             return jsonify({"success": False, "message": "Missing data for report"}), 400
 
-        filename = f"report_{uuid.uuid4().hex}.pdf"
-        output_path = os.path.join("reports", filename)
-        os.makedirs("reports", exist_ok=True)
+        # Built in memory: nothing is left behind on disk
+        pdf_bytes = generate_report(image_path, tumor_type, float(confidence))
+
+        return send_file(io.BytesIO(pdf_bytes), mimetype="application/pdf", as_attachment=True,
+                         download_name=f"report_{uuid.uuid4().hex}.pdf")
+
+    except Exception as e:
+        return jsonify({"success": False, "message": str(e)}), 500
+
+@report_bp.route("/batch", methods=["POST"])
+def generate_report_batch():
+    """Many reports in one request, returned as a zip of PDFs in request order."""
+    try:
+        data = request.json or {}
+        reports = data.get("reports")
+
+        if not isinstance(reports, list) or not reports:
+            return jsonify({"success": False, "message": "No reports requested"}), 400
+        if len(reports) > REPORT_BATCH_MAX:
+            return jsonify({"success": False,
+                            "message": f"At most {REPORT_BATCH_MAX} reports per batch"}), 413
+
+        items = []
+        for i, item in enumerate(reports):
+            item = item if isinstance(item, dict) else {}
+            image_path = item.get("image_path")
+            tumor_type = item.get("tumor_type")
+            confidence = item.get("confidence")
+            if not all([image_path, tumor_type, confidence is not None]):
+                return jsonify({"success": False, "message": f"Missing data for report {i}"}), 400
+            items.append((image_path, tumor_type, float(confidence)))
 
-        generate_report(image_path, tumor_type, float(confidence), output_path)
+        archive = zip_reports(generate_reports(items))
 
-        return send_file(output_path, as_attachment=True)
+        return send_file(io.BytesIO(archive), mimetype="application/zip", as_attachment=True,
+                         download_name=f"reports_{uuid.uuid4().hex}.zip")
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
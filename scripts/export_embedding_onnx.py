@@ -0,0 +1,65 @@
+"""Export all-MiniLM-L6-v2 to ONNX (fp32 + dynamically quantized int8).
+
+    python -m scripts.export_embedding_onnx [--out models/minilm]
+
+Writes model.onnx, model.int8.onnx and tokenizer.json; serve with
+EMBEDDING_BACKEND=onnx or EMBEDDING_BACKEND=onnx-int8. Pooling and
+normalisation are done in utils.embedding_service, so only the transformer
+(token embeddings) is exported.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.embedding_service import EMBEDDING_MODEL_NAME, EMBEDDING_ONNX_DIR
+
+OPSET = 17
+
+
+def export(out_dir):
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    model = SentenceTransformer(EMBEDDING_MODEL_NAME, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+
+    sample = tokenizer(["What are the symptoms of a glioma?"], return_tensors="pt")
+    names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in names}
+    dynamic_axes["token_embeddings"] = {0: "batch", 1: "sequence"}
+
+    fp32_path = os.path.join(out_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=names,
+            output_names=["token_embeddings"],
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET,
+        )
+
+    int8_path = os.path.join(out_dir, "model.int8.onnx")
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+
+    # The fast tokenizer's tokenizer.json is all the runtime needs (no transformers import)
+    tokenizer.backend_tokenizer.save(os.path.join(out_dir, "tokenizer.json"))
+
+    for path in (fp32_path, int8_path):
+        print(f"{path}: {os.path.getsize(path) / 1e6:.1f} MB")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--out", default=EMBEDDING_ONNX_DIR)
+    export(parser.parse_args().out)
+
+
+if __name__ == "__main__":
+    main()
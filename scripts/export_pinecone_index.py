@@ -0,0 +1,57 @@
+"""Snapshot the Pinecone knowledge-base index into a local index directory.
+
+    python -m scripts.export_pinecone_index [--out data/kb_index] [--ann ivf|hnsw]
+
+Then serve the chatbot from it with RETRIEVAL_BACKEND=local.
+"""
+import argparse
+import os
+import sys
+
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.retrieval import LOCAL_INDEX_DIR, PINECONE_INDEX_NAME, LocalBackend
+
+FETCH_BATCH = 100
+
+
+def export(index_name, out_dir, ann):
+    from pinecone import Pinecone
+
+    load_dotenv()
+    index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(index_name)
+
+    ids, embeddings, metadatas = [], [], []
+    # list() pages through every id of a serverless index
+    for id_batch in index.list():
+        for start in range(0, len(id_batch), FETCH_BATCH):
+            fetched = index.fetch(ids=id_batch[start:start + FETCH_BATCH])
+            for vector_id, vector in fetched.vectors.items():
+                ids.append(vector_id)
+                embeddings.append(vector.values)
+                metadatas.append(dict(vector.metadata or {}))
+
+    if not ids:
+        raise SystemExit(f"Index '{index_name}' returned no vectors")
+
+    LocalBackend.write(out_dir, ids, embeddings, metadatas)
+    if ann == "ivf":
+        LocalBackend.build_ivf(out_dir)
+    elif ann == "hnsw":
+        LocalBackend.build_hnsw(out_dir)
+    print(f"Exported {len(ids)} vectors ({len(embeddings[0])} dims) from '{index_name}' to {out_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--index", default=PINECONE_INDEX_NAME)
+    parser.add_argument("--out", default=LOCAL_INDEX_DIR)
+    parser.add_argument("--ann", choices=["none", "ivf", "hnsw"], default="none")
+    args = parser.parse_args()
+    export(args.index, args.out, args.ann)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Startup profile: per-module import time and process RSS for `import app`.
+
+    python -m scripts.profile_startup [--target app] [--top 15] [--warm]
+        [--json startup.json] [--max-import-seconds 2] [--max-rss-mb 300]
+
+The target is imported in a fresh interpreter under `python -X importtime`
+with STARTUP_WARMUP=off, so only import-time work is measured. --warm then
+also warms every registered subsystem (utils.warmup) and reports each one's
+time and the RSS afterwards. The --max-* limits exit non-zero, for CI.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Separates the target's imports from those made while warming
+MARKER = "-- target imported --"
+
+CHILD = """
+import json, sys, time
+import psutil
+start = time.perf_counter()
+import {target}
+result = {{"import_seconds": time.perf_counter() - start, "rss_bytes": psutil.Process().memory_info().rss}}
+sys.stderr.write("{marker}\\n")
+if {warm}:
+    from utils import warmup
+    warmup.warm_all()
+    result["subsystems"] = warmup.readiness()[1]["subsystems"]
+    result["warm_rss_bytes"] = psutil.Process().memory_info().rss
+sys.stdout.write("\\n" + json.dumps(result))
+"""
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us, depth)] from `-X importtime` output, up to MARKER."""
+    modules = []
+    for line in stderr.splitlines():
+        if line == MARKER:
+            break
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        modules.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return modules
+
+
+def profile(target, warm):
+    # --warm reports on every registered subsystem, not just the startup default
+    env = dict(os.environ, STARTUP_WARMUP="off", WARMUP_SUBSYSTEMS="all")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", CHILD.format(target=target, warm=bool(warm), marker=MARKER)],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise SystemExit(f"Importing {target} failed:\n{proc.stderr[-4000:]}")
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    modules = parse_importtime(proc.stderr)
+
+    packages = defaultdict(int)
+    for name, self_us, _, _ in modules:
+        packages[name.split(".")[0]] += self_us
+    result["packages"] = dict(sorted(packages.items(), key=lambda item: -item[1]))
+    result["modules"] = [
+        {"module": name, "self_us": self_us, "cumulative_us": cumulative_us}
+        for name, self_us, cumulative_us, _ in sorted(modules, key=lambda m: -m[2])
+    ]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--target", default="app")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--warm", action="store_true")
+    parser.add_argument("--json")
+    parser.add_argument("--max-import-seconds", type=float)
+    parser.add_argument("--max-rss-mb", type=float)
+    args = parser.parse_args()
+
+    result = profile(args.target, args.warm)
+    rss_mb = result["rss_bytes"] / 2 ** 20
+
+    print(f"import {args.target}: {result['import_seconds']:.2f}s, RSS {rss_mb:.0f} MB")
+    print(f"\n{'package':<32} {'self ms':>9}")
+    for name, self_us in list(result["packages"].items())[:args.top]:
+        print(f"{name:<32} {self_us / 1000:>9.1f}")
+    print(f"\n{'module':<48} {'cumulative ms':>14}")
+    for module in result["modules"][:args.top]:
+        print(f"{module['module']:<48} {module['cumulative_us'] / 1000:>14.1f}")
+    if args.warm:
+        print(f"\n{'subsystem':<20} {'state':<8} {'seconds':>8}")
+        for name, view in result["subsystems"].items():
+            seconds = f"{view['seconds']:.2f}" if view["seconds"] is not None else "-"
+            print(f"{name:<20} {view['state']:<8} {seconds:>8}")
+        print(f"RSS after warmup: {result['warm_rss_bytes'] / 2 ** 20:.0f} MB")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+    failures = []
+    if args.max_import_seconds is not None and result["import_seconds"] > args.max_import_seconds:
+        failures.append(f"import took {result['import_seconds']:.2f}s > {args.max_import_seconds}s")
+    if args.max_rss_mb is not None and rss_mb > args.max_rss_mb:
+        failures.append(f"RSS {rss_mb:.0f} MB > {args.max_rss_mb} MB")
+    if failures:
+        raise SystemExit("Startup budget exceeded: " + "; ".join(failures))
+
+
+if __name__ == "__main__":
+    main()
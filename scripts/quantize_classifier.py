@@ -0,0 +1,261 @@
+"""Build reduced-precision classifier variants and gate them on parity with fp32.
+
+    python -m scripts.quantize_classifier --eval-dir data/Testing
+        [--calibration-dir data/Training] [--variants int8-dynamic,int8-static,fp16]
+        [--calibration-size 300] [--calibration-method minmax|entropy|percentile]
+        [--min-agreement 0.98] [--max-accuracy-drop 1.0] [--max-class-drop 3.0] [--skip-build]
+
+Writes models/brain_tumor_classifier.<variant>.onnx next to the fp32 model
+(CLASSIFIER_MODEL_PATH) and a <variant>.parity.json report for each one.
+Serve a variant with CLASSIFIER_VARIANT=<variant>; utils.model_registry
+only does so when its report has passed and the SHA-256 of both the
+variant and the fp32 file still match the ones recorded in it.
+
+Image folders use the training layout, one sub-folder per class (glioma,
+meningioma, notumor, pituitary); any other layout is treated as unlabelled,
+and parity is then measured against the fp32 predictions only. Static INT8
+calibrates its activation ranges on --calibration-dir, which should not be
+the evaluation set. Every image goes through the serving preprocessing.
+The exit status is non-zero when any variant fails the gate, for CI.
+
+On CPU, int8-static (QDQ, calibrated) is the variant expected to be
+faster. int8-dynamic turns convolutions into ConvInteger with per-batch
+activation scaling, which is usually slower than fp32 for a conv net, and
+fp16 mostly halves the file and weight memory; ORT's CPU provider lacks
+fp16 kernels for many ops. Measure with benchmarks.bench_quantization.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.explanations import CLASS_LABELS
+from utils.model_registry import CLASSIFIER_PATH, CLASSIFIER_VARIANTS, file_sha256, parity_report_path, variant_path
+from utils.preprocessing import process_images
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp")
+BATCH_SIZE = 16
+# Folder names used by the public brain tumor MRI datasets
+LABEL_ALIASES = {"no_tumor": "notumor", "glioma_tumor": "glioma", "meningioma_tumor": "meningioma",
+                 "pituitary_tumor": "pituitary"}
+
+
+def list_images(directory, limit=None, seed=0):
+    """[(path, label or None)], labels taken from class sub-folders."""
+    images = []
+    for root, _, files in os.walk(directory):
+        folder = os.path.basename(root).lower()
+        label = LABEL_ALIASES.get(folder, folder)
+        label = label if label in CLASS_LABELS else None
+        images += [(os.path.join(root, name), label) for name in sorted(files)
+                   if name.lower().endswith(IMAGE_EXTENSIONS)]
+    if not images:
+        raise SystemExit(f"No images found in {directory}")
+    if limit is not None and len(images) > limit:
+        # A class-mixed sample rather than the first folders alphabetically
+        images = random.Random(seed).sample(images, limit)
+    return images
+
+
+def batches(images, batch_size=BATCH_SIZE):
+    for start in range(0, len(images), batch_size):
+        chunk = images[start:start + batch_size]
+        yield process_images([path for path, _ in chunk])
+
+
+def calibration_reader(images, input_name):
+    from onnxruntime.quantization import CalibrationDataReader
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self._batches = batches(images)
+
+        def get_next(self):
+            batch = next(self._batches, None)
+            return None if batch is None else {input_name: batch.copy()}
+
+    return Reader()
+
+
+def build_variant(variant, source, target, calibration=None, method="minmax"):
+    if variant == "int8-dynamic":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # Weights only; activations are quantized per batch at run time
+        quantize_dynamic(source, target, weight_type=QuantType.QInt8, per_channel=True)
+    elif variant == "int8-static":
+        import onnx
+        from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+        from onnxruntime.quantization.shape_inference import quant_pre_process
+
+        if not calibration:
+            raise SystemExit("int8-static needs --calibration-dir")
+        prepared = target + ".pre.onnx"
+        # Shape inference and folding first, so BatchNorm/activations fuse before ranges are collected
+        quant_pre_process(source, prepared)
+        input_name = onnx.load(prepared, load_external_data=False).graph.input[0].name
+        try:
+            quantize_static(
+                prepared, target, calibration_reader(calibration, input_name),
+                quant_format=QuantFormat.QDQ, per_channel=True,
+                activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8,
+                calibrate_method={"minmax": CalibrationMethod.MinMax, "entropy": CalibrationMethod.Entropy,
+                                  "percentile": CalibrationMethod.Percentile}[method],
+            )
+        finally:
+            os.remove(prepared)
+    elif variant == "fp16":
+        import onnx
+        from onnxruntime.transformers.float16 import convert_float_to_float16
+
+        # Inputs and outputs stay float32, so callers and preprocessing are unchanged
+        model = convert_float_to_float16(onnx.load(source), keep_io_types=True)
+        onnx.save(model, target)
+    else:
+        raise ValueError(f"Unknown variant '{variant}'")
+
+
+def predict_all(path, images):
+    import onnxruntime as ort
+
+    from utils.model_registry import build_session_options
+
+    session = ort.InferenceSession(path, sess_options=build_session_options(),
+                                   providers=["CPUExecutionProvider"])
+    input_name = session.get_inputs()[0].name
+    outputs, seconds = [], 0.0
+    for batch in batches(images):
+        # Only the session is timed; preprocessing is the same for every variant
+        start = time.perf_counter()
+        outputs.append(session.run(None, {input_name: batch})[0].astype(np.float32))
+        seconds += time.perf_counter() - start
+    return np.concatenate(outputs), seconds
+
+
+def parity(reference, candidate, labels, args):
+    """Agreement with fp32 (and accuracy, when labelled), overall and per class."""
+    ref_top, cand_top = reference.argmax(axis=1), candidate.argmax(axis=1)
+    diff = np.abs(reference - candidate)
+    report = {
+        "images": len(reference),
+        "top1_agreement": float((ref_top == cand_top).mean()),
+        "max_abs_prob_diff": float(diff.max()),
+        "mean_abs_prob_diff": float(diff.mean()),
+        "classes": {},
+    }
+    failures = []
+    if report["top1_agreement"] < args.min_agreement:
+        failures.append(f"top-1 agreement {report['top1_agreement']:.4f} < {args.min_agreement}")
+
+    labelled = labels is not None
+    truth = labels if labelled else ref_top
+    if labelled:
+        report["fp32_accuracy"] = float((ref_top == truth).mean())
+        report["accuracy"] = float((cand_top == truth).mean())
+        drop = (report["fp32_accuracy"] - report["accuracy"]) * 100
+        if drop > args.max_accuracy_drop:
+            failures.append(f"accuracy drop {drop:.2f} pts > {args.max_accuracy_drop}")
+
+    for index, label in enumerate(CLASS_LABELS):
+        mask = truth == index
+        if not mask.any():
+            continue
+        entry = {"images": int(mask.sum()), "top1_agreement": float((ref_top[mask] == cand_top[mask]).mean())}
+        if labelled:
+            entry["fp32_recall"] = float((ref_top[mask] == index).mean())
+            entry["recall"] = float((cand_top[mask] == index).mean())
+            drop = (entry["fp32_recall"] - entry["recall"]) * 100
+            if drop > args.max_class_drop:
+                failures.append(f"{label} recall drop {drop:.2f} pts > {args.max_class_drop}")
+        report["classes"][label] = entry
+
+    report["labelled"] = labelled
+    report["failures"] = failures
+    report["passed"] = not failures
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default=CLASSIFIER_PATH)
+    parser.add_argument("--eval-dir", required=True)
+    parser.add_argument("--calibration-dir")
+    parser.add_argument("--variants", default=",".join(CLASSIFIER_VARIANTS[1:]))
+    parser.add_argument("--calibration-size", type=int, default=300)
+    parser.add_argument("--calibration-method", choices=["minmax", "entropy", "percentile"], default="minmax")
+    parser.add_argument("--eval-size", type=int)
+    parser.add_argument("--min-agreement", type=float, default=0.98)
+    parser.add_argument("--max-accuracy-drop", type=float, default=1.0, help="percentage points")
+    parser.add_argument("--max-class-drop", type=float, default=3.0, help="percentage points of recall")
+    parser.add_argument("--skip-build", action="store_true", help="re-run parity on existing variant files")
+    args = parser.parse_args()
+
+    variants = [v.strip() for v in args.variants.split(",") if v.strip()]
+    unknown = set(variants) - set(CLASSIFIER_VARIANTS[1:])
+    if unknown:
+        raise SystemExit(f"Unknown variants: {', '.join(sorted(unknown))}")
+    if args.calibration_dir and os.path.abspath(args.calibration_dir) == os.path.abspath(args.eval_dir):
+        print("warning: calibrating on the evaluation set overstates int8-static parity")
+
+    calibration = None
+    if "int8-static" in variants and not args.skip_build:
+        calibration = list_images(args.calibration_dir, args.calibration_size) if args.calibration_dir else None
+    evaluation = list_images(args.eval_dir, args.eval_size)
+    labels = [label for _, label in evaluation]
+    labels = np.array([CLASS_LABELS.index(label) for label in labels]) if all(labels) else None
+
+    reference_sha256 = file_sha256(args.model)
+    reference, fp32_seconds = predict_all(args.model, evaluation)
+    print(f"fp32: {len(evaluation)} images in {fp32_seconds:.1f}s"
+          + (f", accuracy {(reference.argmax(axis=1) == labels).mean():.4f}" if labels is not None else ""))
+
+    failed = False
+    for variant in variants:
+        target = variant_path(args.model, variant)
+        if not args.skip_build:
+            start = time.perf_counter()
+            build_variant(variant, args.model, target, calibration, args.calibration_method)
+            print(f"\nbuilt {target} ({os.path.getsize(target) / 1e6:.1f} MB) in {time.perf_counter() - start:.1f}s")
+        candidate, seconds = predict_all(target, evaluation)
+        report = parity(reference, candidate, labels, args)
+        report.update({
+            "variant": variant,
+            "model": target,
+            "reference": args.model,
+            "file_bytes": os.path.getsize(target),
+            "fp32_file_bytes": os.path.getsize(args.model),
+            # The registry only serves the variant while both files still match these
+            "sha256": file_sha256(target),
+            "fp32_sha256": reference_sha256,
+            "eval_seconds": round(seconds, 3),
+            "fp32_eval_seconds": round(fp32_seconds, 3),
+            "eval_dir": args.eval_dir,
+            "calibration": {"dir": args.calibration_dir, "images": len(calibration),
+                            "method": args.calibration_method} if calibration else None,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        })
+        with open(parity_report_path(target), "w") as f:
+            json.dump(report, f, indent=2)
+
+        print(f"{variant}: agreement {report['top1_agreement']:.4f}, max |dp| {report['max_abs_prob_diff']:.4f}"
+              + (f", accuracy {report['accuracy']:.4f}" if "accuracy" in report else "")
+              + f", {fp32_seconds / seconds:.2f}x fp32 speed -> {'PASS' if report['passed'] else 'FAIL'}")
+        for label, entry in report["classes"].items():
+            recall = f"  recall {entry['fp32_recall']:.3f} -> {entry['recall']:.3f}" if "recall" in entry else ""
+            print(f"    {label:<12} n={entry['images']:<5} agreement {entry['top1_agreement']:.4f}{recall}")
+        for failure in report["failures"]:
+            print(f"    FAIL: {failure}")
+        failed = failed or not report["passed"]
+
+    if failed:
+        raise SystemExit("One or more variants failed the parity gate")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE", "1").lower() in ("1", "true", "yes")
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+# Cosine similarity between query embeddings above which two questions count as the same
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+
+
+class SemanticAnswerCache:
+    """Chatbot answers keyed on the query embedding and the retrieved context ids.
+
+    Embeddings live in a preallocated matrix (one row per slot), so a lookup
+    is a single matrix-vector product. A hit needs cosine >= `threshold` *and*
+    the same retrieved passages, so a similar question that pulls different
+    context still goes to the LLM. Eviction is LRU by size plus a TTL.
+    """
+
+    def __init__(self, dim=384, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL,
+                 threshold=ANSWER_CACHE_THRESHOLD):
+        self.dim = dim
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0}
+        self._reset()
+
+    def _reset(self):
+        self._vectors = np.zeros((self.max_entries, self.dim), dtype=np.float32)
+        self._valid = np.zeros(self.max_entries, dtype=bool)
+        self._entries = [None] * self.max_entries
+        self._lru = OrderedDict()
+        self._free = list(range(self.max_entries - 1, -1, -1))
+
+    def _release(self, slot):
+        self._valid[slot] = False
+        self._entries[slot] = None
+        self._lru.pop(slot, None)
+        self._free.append(slot)
+
+    def get(self, embedding, context_ids):
+        """The cached answer for a near-identical question with the same context, else None."""
+        query = np.asarray(embedding, dtype=np.float32)
+        context_ids = tuple(context_ids)
+        now = time.time()
+        with self._lock:
+            if self._lru:
+                scores = self._vectors @ query
+                scores[~self._valid] = -np.inf
+                candidates = np.flatnonzero(scores >= self.threshold)
+                for slot in candidates[np.argsort(-scores[candidates])]:
+                    expires_at, ids, answer = self._entries[slot]
+                    if expires_at < now:
+                        self._release(slot)
+                        self._counters["expirations"] += 1
+                        continue
+                    if ids == context_ids:
+                        self._lru.move_to_end(slot)
+                        self._counters["hits"] += 1
+                        metrics.counter("chatbot_answer_cache_total", result="hit").inc()
+                        return answer
+            self._counters["misses"] += 1
+        metrics.counter("chatbot_answer_cache_total", result="miss").inc()
+        return None
+
+    def set(self, embedding, context_ids, answer):
+        with self._lock:
+            if not self._free:
+                slot, _ = self._lru.popitem(last=False)
+                self._release(slot)
+                self._counters["evictions"] += 1
+            slot = self._free.pop()
+            self._vectors[slot] = np.asarray(embedding, dtype=np.float32)
+            self._valid[slot] = True
+            self._entries[slot] = (time.time() + self.ttl, tuple(context_ids), answer)
+            self._lru[slot] = None
+            self._counters["sets"] += 1
+
+    def clear(self):
+        with self._lock:
+            removed = len(self._lru)
+            self._reset()
+        logger.info(f"Answer cache flushed ({removed} entries)")
+        return removed
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                "entries": len(self._lru),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                "hit_rate": (self._counters["hits"] / lookups) if lookups else 0.0,
+                **self._counters,
+            }
+
+
+answer_cache = SemanticAnswerCache() if ANSWER_CACHE_ENABLED else None
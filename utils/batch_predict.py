@@ -0,0 +1,251 @@
+import logging
+import os
+import posixpath
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import wait
+
+import numpy as np
+
+from utils.explanations import CLASS_LABELS, FALLBACK_MESSAGE, cached_explanation, explanation_jobs, generate_explanation
+from utils.inference_engine import get_engine
+from utils.instrumentation import stage
+from utils.preprocessing import buffer_pool, preprocess_async
+
+logger = logging.getLogger(__name__)
+
+# Images per classifier call; two batches (one decoding, one running) are held at a time
+PREDICT_BATCH_SIZE = int(os.getenv("PREDICT_BATCH_SIZE", "32"))
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "2000"))
+# Per image (archive member or part); sized for MRI slices, it bounds the raw bytes held
+# to 2 * PREDICT_BATCH_SIZE * this (256 MB by default) however the archive compresses
+PREDICT_BATCH_MAX_IMAGE_BYTES = int(os.getenv("PREDICT_BATCH_MAX_IMAGE_BYTES", str(4 * 1024 * 1024)))
+# Raw zip bodies are spooled to disk past this size (zip needs its central directory)
+PREDICT_BATCH_SPOOL_BYTES = int(os.getenv("PREDICT_BATCH_SPOOL_BYTES", str(32 * 1024 * 1024)))
+
+ZIP_TYPES = {"application/zip", "application/x-zip-compressed"}
+TAR_TYPES = {"application/x-tar", "application/gzip", "application/x-gzip", "application/x-gtar",
+             "application/x-bzip2", "application/x-xz"}
+ARCHIVE_TYPES = ZIP_TYPES | TAR_TYPES
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+READ_CHUNK_SIZE = 1024 * 1024
+
+
+class BatchInputError(ValueError):
+    """The batch as a whole is unusable (bad archive, too many files)."""
+
+
+class Item:
+    __slots__ = ("index", "name", "data", "error")
+
+    def __init__(self, index, name, data=None, error=None):
+        self.index = index
+        self.name = name
+        self.data = data
+        self.error = error
+
+
+def is_archive(filename):
+    name = filename.lower()
+    return name.endswith(".zip") or name.endswith(TAR_SUFFIXES)
+
+
+def _skipped(name):
+    # Directory entries and OS metadata (__MACOSX/, .DS_Store, ._resource forks)
+    base = posixpath.basename(name)
+    return not base or base.startswith(".") or name.startswith("__MACOSX/")
+
+
+def _zip_members(fileobj, max_bytes):
+    try:
+        archive = zipfile.ZipFile(fileobj)
+    except zipfile.BadZipFile as e:
+        raise BatchInputError(f"Invalid zip archive: {str(e)}")
+    with archive:
+        for info in archive.infolist():
+            if info.is_dir() or _skipped(info.filename):
+                continue
+            if info.file_size > max_bytes:
+                yield info.filename, None, "File too large"
+                continue
+            with archive.open(info) as member:
+                # Bounded read: the declared size is not trusted
+                data = member.read(max_bytes + 1)
+            yield (info.filename, None, "File too large") if len(data) > max_bytes else (info.filename, data, None)
+
+
+def _tar_members(fileobj, max_bytes):
+    try:
+        # Stream mode: members are read in order without seeking or buffering the archive
+        with tarfile.open(fileobj=fileobj, mode="r|*") as archive:
+            for member in archive:
+                if not member.isfile() or _skipped(member.name):
+                    continue
+                if member.size > max_bytes:
+                    yield member.name, None, "File too large"
+                    continue
+                yield member.name, archive.extractfile(member).read(), None
+    except tarfile.TarError as e:
+        raise BatchInputError(f"Invalid tar archive: {str(e)}")
+
+
+def iter_uploads(files, accept, max_bytes):
+    """(name, bytes, error) for each multipart part, expanding zip/tar parts into their members.
+
+    Members that `accept` rejects are skipped; explicitly uploaded parts get an error entry instead.
+    """
+    for file in files:
+        if is_archive(file.filename):
+            members = _zip_members if file.filename.lower().endswith(".zip") else _tar_members
+            for name, data, error in members(file.stream, max_bytes):
+                if error is not None or accept(name):
+                    yield posixpath.join(file.filename, name), data, error
+        elif not accept(file.filename):
+            yield file.filename, None, "Invalid file type"
+        else:
+            data = file.stream.read(max_bytes + 1)
+            yield (file.filename, None, "File too large") if len(data) > max_bytes else (file.filename, data, None)
+
+
+def iter_archive_body(stream, content_type, accept, max_bytes):
+    """(name, bytes, error) for each image in a raw zip/tar request body, read incrementally."""
+    if content_type in TAR_TYPES:
+        for name, data, error in _tar_members(stream, max_bytes):
+            if error is not None or accept(name):
+                yield name, data, error
+        return
+    if content_type not in ZIP_TYPES:
+        raise BatchInputError(f"Unsupported archive type '{content_type}'")
+    with tempfile.SpooledTemporaryFile(max_size=PREDICT_BATCH_SPOOL_BYTES) as spool:
+        shutil.copyfileobj(stream, spool, READ_CHUNK_SIZE)
+        spool.seek(0)
+        for name, data, error in _zip_members(spool, max_bytes):
+            if error is not None or accept(name):
+                yield name, data, error
+
+
+def _chunks(entries, size, max_files):
+    chunk = []
+    for index, (name, data, error) in enumerate(entries):
+        if index >= max_files:
+            raise BatchInputError(f"Too many files (max {max_files})")
+        chunk.append(Item(index, name, data, error))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _PendingBatch:
+    """A chunk whose images are being decoded into a pooled buffer."""
+
+    def __init__(self, chunk, batch_size):
+        self.chunk = chunk
+        self.images = [item for item in chunk if item.error is None]
+        self.buffer = buffer_pool.acquire(batch_size)
+        self.futures = preprocess_async([item.data for item in self.images], self.buffer)
+
+    def collect(self):
+        """Wait for decoding; returns the items that decoded, in buffer row order."""
+        rows, ok = [], []
+        for row, (item, future) in enumerate(zip(self.images, self.futures)):
+            try:
+                future.result()
+            except Exception as e:
+                item.error = f"Could not decode image: {str(e)}"
+            else:
+                rows.append(row)
+                ok.append(item)
+            item.data = None
+        return rows, ok
+
+    def release(self):
+        if self.buffer is not None:
+            buffer_pool.release(self.buffer)
+            self.buffer = None
+
+    def discard(self):
+        for future in self.futures:
+            future.cancel()
+        # Running decodes still write into the buffer; it is only reusable once they stop
+        wait(self.futures)
+        self.release()
+
+
+def _explain(label, confidence, mode, explanation_url):
+    if mode == "async":
+        message = cached_explanation(label, confidence)
+        if message is not None:
+            return {"message": message}
+        job_id = explanation_jobs.submit(label, confidence)
+        return {"explanation_job": job_id, "explanation_url": explanation_url(job_id)}
+    try:
+        with stage("explanation"):
+            message = generate_explanation(label, confidence)
+    except Exception as e:
+        logger.error(f"Explanation failed: {str(e)}")
+        message = None
+    return {"message": message if message is not None else FALLBACK_MESSAGE}
+
+
+def predict_entries(entries, batch_size=None, max_files=None, explain=None, explanation_url=None):
+    """Classify (name, bytes, error) entries, yielding one result dict per entry, in input order.
+
+    Entries are consumed a batch at a time: while one batch runs through the
+    classifier the next is already being decoded on the preprocessing pool,
+    so at most two batches of raw bytes and input tensors are held however
+    many entries there are. `explain` is None, "sync" or "async".
+    """
+    batch_size = batch_size or PREDICT_BATCH_SIZE
+    max_files = max_files or PREDICT_BATCH_MAX_FILES
+    engine = get_engine()
+    in_flight = []
+    try:
+        for chunk in _chunks(entries, batch_size, max_files):
+            in_flight.append(_PendingBatch(chunk, batch_size))
+            if len(in_flight) == 2:
+                yield from _finish(engine, in_flight[0], explain, explanation_url)
+                in_flight.pop(0)
+        while in_flight:
+            yield from _finish(engine, in_flight[0], explain, explanation_url)
+            in_flight.pop(0)
+    finally:
+        # Client went away or the input failed mid-stream
+        for pending in in_flight:
+            pending.discard()
+
+
+def _finish(engine, pending, explain, explanation_url):
+    try:
+        with stage("preprocess"):
+            rows, ok = pending.collect()
+        predictions = None
+        if ok:
+            try:
+                with stage("onnx_run", model="classifier"):
+                    # A contiguous slice avoids copying the batch when every image decoded
+                    batch = pending.buffer[:len(rows)] if len(rows) == rows[-1] + 1 else pending.buffer[rows]
+                    predictions = engine.predict_batch(batch)
+            except Exception as e:
+                logger.error(f"Batch inference failed for {len(ok)} images: {str(e)}")
+                for item in ok:
+                    item.error = "Processing error"
+    finally:
+        pending.release()
+
+    outputs = iter(predictions) if predictions is not None else None
+    for item in pending.chunk:
+        if item.error is not None:
+            yield {"index": item.index, "file": item.name, "success": False, "error": item.error}
+            continue
+        probabilities = next(outputs)
+        class_index = int(np.argmax(probabilities))
+        confidence = float(probabilities[class_index])
+        result = {"index": item.index, "file": item.name, "success": True,
+                  "result": CLASS_LABELS[class_index], "confidence": confidence}
+        if explain:
+            result.update(_explain(result["result"], confidence, explain, explanation_url))
+        yield result
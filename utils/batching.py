@@ -0,0 +1,127 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Groups concurrent submissions into a single call of `batch_fn`.
+
+    `batch_fn` receives a list of items and must return a list of results in the
+    same order; an exception instance in that list fails only its own caller.
+    A batch is flushed once it holds `max_batch_size` items or the
+    oldest item has waited `max_wait_ms`, whichever comes first.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=8, max_wait_ms=5.0, name="batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._max_queue_depth = 0
+        self._batch_sizes = [0] * (max_batch_size + 1)
+
+    def submit(self, item):
+        """Queue one item and return a Future resolved with its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future))
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            if depth > self._max_queue_depth:
+                self._max_queue_depth = depth
+        return future
+
+    def run(self, item, timeout=None):
+        return self.submit(item).result(timeout=timeout)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "errors": self._errors,
+                "avg_batch_size": (self._items / self._batches) if self._batches else 0.0,
+                "batch_size_counts": {
+                    str(size): count for size, count in enumerate(self._batch_sizes) if count
+                },
+            }
+
+    def _ensure_worker(self):
+        if self._thread is not None:
+            return
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._loop, name=f"{self.name}-worker", daemon=True
+                )
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Still drain whatever is already waiting, without blocking.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            batch = [(item, fut) for item, fut in batch if fut.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                logger.error(f"{self.name}: batch of {len(items)} failed: {str(e)}")
+                with self._stats_lock:
+                    self._errors += 1
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+
+            with self._stats_lock:
+                self._batches += 1
+                self._items += len(items)
+                self._batch_sizes[len(items)] += 1
+            for (_, fut), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    fut.set_exception(result)
+                else:
+                    fut.set_result(result)
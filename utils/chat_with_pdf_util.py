@@ -1,52 +1,73 @@
-import io
+import asyncio
 import base64
-import fitz
-from PIL import Image
-from langchain_groq import ChatGroq
-from langchain_core.messages import HumanMessage, SystemMessage
+import contextvars
 import json
+import threading
+
+from utils.http_clients import get_upstream
+from utils.instrumentation import stage
+from utils.pdf_extract import PDF_EXTRACT_MODE, extract_pdf, extract_pdf_images, select_context
+from utils.streaming import AnswerAssembler, FirstTokenTimer
+from utils.token_budget import context_tokens, fit_to_budget
+from utils.warmup import mark_ready
 
 MAX_TOKENS_LIMIT = 131072  
 
 def estimate_tokens_from_words(word_count):
     return int(word_count * 1.333)
 
-def estimate_token_size(context_images, user_query):
-    text_tokens = estimate_tokens_from_words(len(user_query.split()))  
-    image_tokens = sum([len(img_b64) // 4 for img_b64 in context_images])  
+def estimate_token_size(context, user_query):
+    """Tokens of the request built from `context`, from the per-page costs cached at upload."""
+    return context_tokens(context, user_query)
 
-    return text_tokens + image_tokens
+def prepare_context(context, user_query):
+    """Relevant chunks and images for this question, greedily fitted to MAX_TOKENS_LIMIT."""
+    with stage("context_select"):
+        return fit_to_budget(select_context(context, user_query), user_query, MAX_TOKENS_LIMIT)
 
 def process_pdf(filepath):
-    pdf_document = fitz.open(filepath)
-    base64_images = []
-
-    for page_number in range(len(pdf_document)):
-        page = pdf_document.load_page(page_number)
-        pix = page.get_pixmap()
-        img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
-
-        buffer = io.BytesIO()
-        img.save(buffer, format="PNG")
-        base64_str = base64.b64encode(buffer.getvalue()).decode("utf-8")
-        base64_images.append(base64_str)
-
-    return base64_images
-
-def answer_query(context_images, user_query):
-
-    token_count = estimate_token_size(context_images, user_query)
-
-    if token_count > MAX_TOKENS_LIMIT:
-        return "The PDF is too large to process within the token limit."
-
-    llm = ChatGroq(
-        model="meta-llama/llama-4-scout-17b-16e-instruct",
-        temperature=0,
-        max_tokens=None,
-        timeout=None,
-        max_retries=2,
-    )
+    """Build the session context: text chunks plus figure/scan images (PDF_EXTRACT_MODE=hybrid)
+    or every page as an image. Images are raw bytes; base64 happens only when sent."""
+    with stage("pdf_render", mode=PDF_EXTRACT_MODE):
+        context = extract_pdf_images(filepath) if PDF_EXTRACT_MODE == "image" else extract_pdf(filepath)
+    mark_ready("pdf_parser")
+    return context
+
+_llm = None
+_llm_async_client = None
+_llm_lock = threading.Lock()
+
+def create_llm():
+    """One ChatGroq client per process, on the pooled keep-alive Groq connections.
+
+    Rebuilt when the upstream's async client has been replaced (it is closed
+    on ASGI shutdown and recreated on next use), so the LLM never holds a closed one.
+    """
+    global _llm, _llm_async_client
+    groq = get_upstream("groq")
+    async_client = groq.async_client
+    if _llm is None or _llm_async_client is not async_client:
+        with _llm_lock:
+            if _llm is None or _llm_async_client is not async_client:
+                # langchain is only imported once chat-with-PDF is first used
+                from langchain_groq import ChatGroq
+
+                _llm = ChatGroq(
+                    model="meta-llama/llama-4-scout-17b-16e-instruct",
+                    temperature=0,
+                    max_tokens=None,
+                    timeout=None,
+                    max_retries=2,
+                    base_url=groq.base_url,
+                    http_client=groq.client,
+                    http_async_client=async_client,
+                )
+                _llm_async_client = async_client
+                mark_ready("pdf_llm")
+    return _llm
+
+def build_messages(context, user_query):
+    from langchain_core.messages import HumanMessage, SystemMessage
 
     system_msg = SystemMessage(
         content=(
@@ -68,22 +89,105 @@ def answer_query(context_images, user_query):
         )
     )
 
-
-
-
     content = [{"type": "text", "text": user_query}]
 
-    for img_b64 in context_images:
+    if context.get("chunks"):
+        excerpts = "\n\n".join(f"[Page {c['page'] + 1}]\n{c['text']}" for c in context["chunks"])
+        content.append({"type": "text", "text": f"Relevant excerpts from the document:\n\n{excerpts}"})
+
+    for page in context["pages"]:
+        img_b64 = base64.b64encode(page["data"]).decode("utf-8")
         content.append({
             "type": "image_url",
             "image_url": {
-                "url": f"data:image/png;base64,{img_b64}"
+                "url": f"data:{page['mime']};base64,{img_b64}"
             }
         })
 
-    message = HumanMessage(content=content)
+    return [system_msg, HumanMessage(content=content)]
+
+TOO_LARGE_ANSWER = "The PDF is too large to process within the token limit."
+
+def _prepare_messages(context, user_query):
+    """(chat messages, or None when they cannot fit the token limit; 1-based numbers of
+    the pages whose images were left out to fit the budget or PDF_MAX_IMAGES)."""
+    # Only the chunks and images relevant to this question are sent, within the budget
+    context = prepare_context(context, user_query)
+    omitted = [page + 1 for page in context["omitted_pages"]]
+    if estimate_token_size(context, user_query) > MAX_TOKENS_LIMIT:
+        return None, omitted
+    return build_messages(context, user_query), omitted
+
+async def _prepare_messages_async(context, user_query):
+    # Chunk scoring, token counting and base64 encoding are CPU work: keep them off the
+    # event loop, in the caller's context so their stage timings land on its trace
+    run = contextvars.copy_context().run
+    return await asyncio.get_running_loop().run_in_executor(None, run, _prepare_messages, context, user_query)
+
+def answer_query(context, user_query):
+    """(parsed answer, omitted page numbers)."""
+    messages, omitted = _prepare_messages(context, user_query)
+
+    if messages is None:
+        return TOO_LARGE_ANSWER, omitted
 
-    response = llm.invoke([system_msg, message])
+    llm = create_llm()
+    response = llm.invoke(messages)
     parsed_answer = json.loads(response.content)
 
-    return parsed_answer
+    return parsed_answer, omitted
+
+async def answer_query_async(context, user_query):
+    """`answer_query` for the ASGI server: awaits ChatGroq instead of blocking a thread."""
+    messages, omitted = await _prepare_messages_async(context, user_query)
+
+    if messages is None:
+        return TOO_LARGE_ANSWER, omitted
+
+    llm = create_llm()
+    response = await llm.ainvoke(messages)
+    return json.loads(response.content), omitted
+
+def _answer_events(assembler, text):
+    for kind, field, value in assembler.feed(text):
+        yield kind, {"field": field, "text": value}
+
+def _final_event(assembler, omitted):
+    try:
+        return "done", {"success": True, "answer": assembler.finish(), "omitted_pages": omitted}
+    except ValueError as e:
+        print(f"Streamed answer failed validation: {str(e)}")
+        return "error", {"success": False, "message": "Error processing AI response."}
+
+def stream_answer(context, user_query):
+    """Streaming `answer_query`: ("delta"/"item", ...) events as the answer JSON is
+    generated, then ("done", ...) with the validated answer or ("error", ...)."""
+    messages, omitted = _prepare_messages(context, user_query)
+    timer = FirstTokenTimer("groq", "chat_pdf")
+
+    if messages is None:
+        yield "done", {"success": True, "answer": TOO_LARGE_ANSWER, "omitted_pages": omitted}
+        return
+
+    assembler = AnswerAssembler()
+    for chunk in create_llm().stream(messages):
+        if chunk.content:
+            timer.token()
+            yield from _answer_events(assembler, chunk.content)
+    yield _final_event(assembler, omitted)
+
+async def astream_answer(context, user_query):
+    messages, omitted = await _prepare_messages_async(context, user_query)
+    timer = FirstTokenTimer("groq", "chat_pdf")
+
+    if messages is None:
+        yield "done", {"success": True, "answer": TOO_LARGE_ANSWER, "omitted_pages": omitted}
+        return
+
+    assembler = AnswerAssembler()
+    async for chunk in create_llm().astream(messages):
+        if chunk.content:
+            timer.token()
+            for event in _answer_events(assembler, chunk.content):
+                yield event
+    yield _final_event(assembler, omitted)
@@ -1,8 +1,13 @@
 import os
+import asyncio
 from dotenv import load_dotenv
-from sentence_transformers import SentenceTransformer
-from pinecone import Pinecone
-import requests
+
+from utils.answer_cache import answer_cache
+from utils.embedding_service import get_embedding_service
+from utils.http_clients import UpstreamError, get_upstream
+from utils.instrumentation import stage
+from utils.retrieval import RETRIEVAL_BACKEND, get_retriever
+from utils.streaming import FirstTokenTimer, aiter_completion_tokens, iter_completion_tokens
 
 load_dotenv()
 
@@ -10,58 +15,66 @@ load_dotenv()
 PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
-if not all([PINECONE_API_KEY, GROQ_API_KEY]):
+if not GROQ_API_KEY or (RETRIEVAL_BACKEND == "pinecone" and not PINECONE_API_KEY):
     raise EnvironmentError("Missing required environment variables")
 
-# Initialize models and services
-pc = Pinecone(api_key=PINECONE_API_KEY)
-index = pc.Index("brain-tumor")
-embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+GROQ_CHAT_PATH = "/openai/v1/chat/completions"
+GROQ_TIMEOUT_SECONDS = 15
 
-def process_text(user_query):
-    """Process user query through vector search and LLM response generation."""
+class ChatbotError(Exception):
+    """Carries the user-facing message for a failed pipeline stage."""
+
+
+def retrieve_context(user_query):
+    """Embed the query and fetch the matching knowledge-base passages.
+
+    Returns (query embedding, ids of the matched passages, joined context).
+    """
+    # Generate embedding
     try:
-        print("Processing user query:", user_query)
-        
-        # Validate input
-        if not isinstance(user_query, str) or not user_query.strip():
-            return "Invalid query: Please provide a non-empty text input"
+        # Cached per normalised query and batched across concurrent requests
+        with stage("embed"):
+            embedded_query = get_embedding_service().embed(user_query)
+    except Exception as e:
+        print(f"Embedding generation failed: {str(e)}")
+        raise ChatbotError("Error processing your query. Please try again.")
 
-        # Generate embedding
-        try:
-            embedded_query = embedding_model.encode(user_query).tolist()
-        except Exception as e:
-            print(f"Embedding generation failed: {str(e)}")
-            return "Error processing your query. Please try again."
+    # Vector search (Pinecone or the local index, see utils.retrieval)
+    try:
+        with stage("vector_search", backend=RETRIEVAL_BACKEND):
+            matches = get_retriever().query(embedded_query, top_k=3)
+    except Exception as e:
+        print(f"Vector search failed: {str(e)}")
+        raise ChatbotError("Error accessing medical knowledge base. Please try again later.")
 
-        # Pinecone vector search
-        try:
-            results = index.query(
-                vector=embedded_query,
-                top_k=3,
-                include_metadata=True
-            )
-            # print("Pinecone results:", results)
-        except Exception as e:
-            print(f"Pinecone query failed: {str(e)}")
-            return "Error accessing medical knowledge base. Please try again later."
+    # Process results
+    if not matches:
+        raise ChatbotError("No relevant information found in our knowledge base.")
 
-        # Process results
-        if not results or 'matches' not in results or not results['matches']:
-            return "No relevant information found in our knowledge base."
+    context_parts = [match['metadata']['texts'] for match in matches]
+    context = "\n\n".join(context_parts)
 
-        context_parts = [match['metadata']['texts'] for match in results["matches"]]
-        context = "\n\n".join(context_parts)
+    print("Generated context:", context[:500] + "...")  # Truncate for logging
+    return embedded_query, [match['id'] for match in matches], context
 
-        print("context" , context)
-        print("Generated context:", context[:500] + "...")  # Truncate for logging
 
-        # Groq API call
-        headers = {
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        groq_payload = {
+def cached_answer(embedded_query, context_ids):
+    if answer_cache is None:
+        return None
+    return answer_cache.get(embedded_query, context_ids)
+
+
+def store_answer(embedded_query, context_ids, answer):
+    if answer_cache is not None:
+        answer_cache.set(embedded_query, context_ids, answer)
+
+
+def build_groq_request(user_query, context):
+    headers = {
+        "Authorization": f"Bearer {GROQ_API_KEY}",
+        "Content-Type": "application/json"
+    }
+    groq_payload = {
                         "messages": [
                             {
                                 "role": "system",
@@ -75,22 +88,52 @@ def process_text(user_query):
                         "model": "meta-llama/llama-4-scout-17b-16e-instruct",
                         "temperature": 0.3
                     }
+    return headers, groq_payload
+
+
+def parse_groq_response(response_data):
+    if not response_data.get('choices'):
+        return "Received unexpected response format from AI service"
+    return response_data['choices'][0]['message']['content']
+
+
+def process_text(user_query):
+    """Process user query through vector search and LLM response generation."""
+    try:
+        print("Processing user query:", user_query)
+
+        # Validate input
+        if not isinstance(user_query, str) or not user_query.strip():
+            return "Invalid query: Please provide a non-empty text input"
+
+        try:
+            embedded_query, context_ids, context = retrieve_context(user_query)
+        except ChatbotError as e:
+            return str(e)
+
+        answer = cached_answer(embedded_query, context_ids)
+        if answer is not None:
+            return answer
+
+        # Groq API call
+        headers, groq_payload = build_groq_request(user_query, context)
         try:
-            response = requests.post(
-                "https://api.groq.com/openai/v1/chat/completions",
+            response = get_upstream("groq").request(
+                "POST",
+                GROQ_CHAT_PATH,
                 headers=headers,
                 json=groq_payload,
-                timeout=15  
+                timeout=GROQ_TIMEOUT_SECONDS
             )
-            response.raise_for_status() 
-            
+
             response_data = response.json()
-            if not response_data.get('choices'):
-                return "Received unexpected response format from AI service"
-            
-            return response_data['choices'][0]['message']['content']
+            answer = parse_groq_response(response_data)
+            # Only well-formed completions are worth replaying
+            if response_data.get('choices'):
+                store_answer(embedded_query, context_ids, answer)
+            return answer
 
-        except requests.exceptions.RequestException as e:
+        except UpstreamError as e:
             print(f"Groq API request failed: {str(e)}")
             return "Error connecting to AI service. Please try again later."
         except KeyError as e:
@@ -99,4 +142,161 @@ def process_text(user_query):
 
     except Exception as e:
         print(f"Unexpected error in process_text: {str(e)}")
-        return "An unexpected error occurred. Please try again later."
\ No newline at end of file
+        return "An unexpected error occurred. Please try again later."
+
+
+async def process_text_async(user_query):
+    """Async variant of `process_text` for the ASGI server.
+
+    Embedding and vector search run in the default executor; the Groq
+    call goes through the pooled async Groq client, so no thread waits on it.
+    """
+    try:
+        if not isinstance(user_query, str) or not user_query.strip():
+            return "Invalid query: Please provide a non-empty text input"
+
+        loop = asyncio.get_running_loop()
+        try:
+            embedded_query, context_ids, context = await loop.run_in_executor(None, retrieve_context, user_query)
+        except ChatbotError as e:
+            return str(e)
+
+        answer = cached_answer(embedded_query, context_ids)
+        if answer is not None:
+            return answer
+
+        headers, groq_payload = build_groq_request(user_query, context)
+        try:
+            response = await get_upstream("groq").arequest(
+                "POST",
+                GROQ_CHAT_PATH,
+                headers=headers,
+                json=groq_payload,
+                timeout=GROQ_TIMEOUT_SECONDS
+            )
+
+            response_data = response.json()
+            answer = parse_groq_response(response_data)
+            # Only well-formed completions are worth replaying
+            if response_data.get('choices'):
+                store_answer(embedded_query, context_ids, answer)
+            return answer
+
+        except UpstreamError as e:
+            print(f"Groq API request failed: {str(e)}")
+            return "Error connecting to AI service. Please try again later."
+        except KeyError as e:
+            print(f"Unexpected response format: {str(e)}")
+            return "Error processing AI response."
+
+    except Exception as e:
+        print(f"Unexpected error in process_text_async: {str(e)}")
+        return "An unexpected error occurred. Please try again later."
+
+
+def _error_event(message):
+    return "error", {"success": False, "message": message}
+
+
+def _done_event(answer, cached=False):
+    return "done", {"success": True, "message": "Processed text query successfully",
+                    "response": answer, "cached": cached}
+
+
+def process_text_stream(user_query):
+    """Streaming `process_text`: yields ("token", ...) events as Groq produces them,
+    then one ("done", ...) or ("error", ...) event."""
+    timer = FirstTokenTimer("groq", "chatbot")
+    if not isinstance(user_query, str) or not user_query.strip():
+        yield _error_event("Invalid query: Please provide a non-empty text input")
+        return
+
+    try:
+        embedded_query, context_ids, context = retrieve_context(user_query)
+    except ChatbotError as e:
+        yield _error_event(str(e))
+        return
+
+    answer = cached_answer(embedded_query, context_ids)
+    if answer is not None:
+        yield "token", {"text": answer}
+        yield _done_event(answer, cached=True)
+        return
+
+    headers, groq_payload = build_groq_request(user_query, context)
+    groq_payload["stream"] = True
+    parts = []
+    try:
+        with get_upstream("groq").stream(
+            "POST",
+            GROQ_CHAT_PATH,
+            headers=headers,
+            json=groq_payload,
+            timeout=GROQ_TIMEOUT_SECONDS
+        ) as response:
+            for text in iter_completion_tokens(response):
+                timer.token()
+                parts.append(text)
+                yield "token", {"text": text}
+    except UpstreamError as e:
+        print(f"Groq API request failed: {str(e)}")
+        yield _error_event("Error connecting to AI service. Please try again later.")
+        return
+    except Exception as e:
+        print(f"Unexpected error in process_text_stream: {str(e)}")
+        yield _error_event("An unexpected error occurred. Please try again later.")
+        return
+
+    answer = "".join(parts)
+    if answer:
+        store_answer(embedded_query, context_ids, answer)
+    yield _done_event(answer)
+
+
+async def process_text_stream_async(user_query):
+    timer = FirstTokenTimer("groq", "chatbot")
+    if not isinstance(user_query, str) or not user_query.strip():
+        yield _error_event("Invalid query: Please provide a non-empty text input")
+        return
+
+    loop = asyncio.get_running_loop()
+    try:
+        embedded_query, context_ids, context = await loop.run_in_executor(None, retrieve_context, user_query)
+    except ChatbotError as e:
+        yield _error_event(str(e))
+        return
+
+    answer = cached_answer(embedded_query, context_ids)
+    if answer is not None:
+        yield "token", {"text": answer}
+        yield _done_event(answer, cached=True)
+        return
+
+    headers, groq_payload = build_groq_request(user_query, context)
+    groq_payload["stream"] = True
+    parts = []
+    try:
+        async with get_upstream("groq").astream(
+            "POST",
+            GROQ_CHAT_PATH,
+            headers=headers,
+            json=groq_payload,
+            timeout=GROQ_TIMEOUT_SECONDS
+        ) as response:
+            async for text in aiter_completion_tokens(response):
+                timer.token()
+                parts.append(text)
+                yield "token", {"text": text}
+    except UpstreamError as e:
+        print(f"Groq API request failed: {str(e)}")
+        yield _error_event("Error connecting to AI service. Please try again later.")
+        return
+    except Exception as e:
+        print(f"Unexpected error in process_text_stream_async: {str(e)}")
+        yield _error_event("An unexpected error occurred. Please try again later.")
+        return
+
+    answer = "".join(parts)
+    if answer:
+        store_answer(embedded_query, context_ids, answer)
+    yield _done_event(answer)
@@ -0,0 +1,168 @@
+import logging
+import os
+import re
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+import numpy as np
+
+from utils.batching import MicroBatcher
+from utils.model_registry import get_session, register_model
+from utils.warmup import mark_ready
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# "torch" (SentenceTransformer, default), "onnx" or "onnx-int8" (see scripts.export_embedding_onnx),
+# or "stub" for offline runs and benchmarks
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch").lower()
+EMBEDDING_STUB_LATENCY_MS = float(os.getenv("EMBEDDING_STUB_LATENCY_MS", "0"))
+EMBEDDING_DIM = 384
+EMBEDDING_ONNX_DIR = os.getenv("EMBEDDING_ONNX_DIR", os.path.join("models", "minilm"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "4096"))
+EMBEDDING_MAX_BATCH = int(os.getenv("EMBEDDING_MAX_BATCH", "32"))
+EMBEDDING_MAX_WAIT_MS = float(os.getenv("EMBEDDING_MAX_WAIT_MS", "3"))
+MAX_SEQ_LENGTH = 256
+
+register_model("embedder", os.path.join(EMBEDDING_ONNX_DIR, "model.onnx"))
+register_model("embedder-int8", os.path.join(EMBEDDING_ONNX_DIR, "model.int8.onnx"))
+
+
+def normalize_query(text):
+    """Cache key for a query: case-folded, whitespace-collapsed."""
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+class TorchEncoder:
+    name = "torch"
+
+    def __init__(self):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(EMBEDDING_MODEL_NAME)
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32)
+
+
+class OnnxEncoder:
+    """all-MiniLM-L6-v2 exported to ONNX: tokenizers + ORT + mean pooling + L2 norm."""
+
+    def __init__(self, quantized=False):
+        from tokenizers import Tokenizer
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        self.session = get_session("embedder-int8" if quantized else "embedder")
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(os.path.join(EMBEDDING_ONNX_DIR, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=MAX_SEQ_LENGTH)
+        self.tokenizer.enable_padding(pad_id=0, pad_token="[PAD]")
+
+    def encode(self, texts):
+        encodings = self.tokenizer.encode_batch(list(texts))
+        input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+        attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+        feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+        token_embeddings = self.session.run(None, feeds)[0]
+        mask = attention_mask[..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(pooled, axis=1, keepdims=True)
+        return (pooled / np.clip(norms, 1e-12, None)).astype(np.float32)
+
+
+class StubEncoder:
+    """Offline stand-in: hashed bag of words projected to MiniLM's 384 unit-norm dims."""
+
+    name = "stub"
+
+    def encode(self, texts):
+        if EMBEDDING_STUB_LATENCY_MS:
+            time.sleep(EMBEDDING_STUB_LATENCY_MS / 1000.0)
+        vectors = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+        for row, text in zip(vectors, texts):
+            for token in re.findall(r"\w+", text.casefold()):
+                row += np.random.default_rng(zlib.crc32(token.encode())).standard_normal(
+                    EMBEDDING_DIM, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.clip(norms, 1e-12, None)
+
+
+def create_encoder(backend):
+    if backend == "stub":
+        return StubEncoder()
+    if backend == "torch":
+        return TorchEncoder()
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEncoder(quantized=backend == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend '{backend}'")
+
+
+class EmbeddingService:
+    """Query embeddings with a normalised-query LRU cache and cross-request micro-batching."""
+
+    def __init__(self, encoder, cache_size=EMBEDDING_CACHE_SIZE,
+                 max_batch_size=EMBEDDING_MAX_BATCH, max_wait_ms=EMBEDDING_MAX_WAIT_MS):
+        self.encoder = encoder
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._batcher = MicroBatcher(
+            lambda texts: list(self.encoder.encode(texts)),
+            max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, name="embed-batcher",
+        )
+
+    def embed(self, text):
+        """Unit-length float32 embedding of `text`."""
+        key = normalize_query(text)
+        with self._lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+                self._hits += 1
+                return vector
+            self._misses += 1
+
+        vector = self._batcher.run(key)
+        vector.setflags(write=False)
+        with self._lock:
+            self._cache[key] = vector
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return vector
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            data = {
+                "backend": self.encoder.name,
+                "cache_entries": len(self._cache),
+                "cache_size": self.cache_size,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": (self._hits / lookups) if lookups else 0.0,
+            }
+        data["batcher"] = self._batcher.stats()
+        return data
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_embedding_service():
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = EmbeddingService(create_encoder(EMBEDDING_BACKEND))
+                logger.info(f"Embedding service ready (backend: {EMBEDDING_BACKEND})")
+                mark_ready("embedder")
+    return _service
@@ -0,0 +1,405 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from utils.instrumentation import stage
+
+logger = logging.getLogger(__name__)
+
+# "gemini" (default) or "stub" for offline runs and tests
+EXPLANATION_BACKEND = os.getenv("EXPLANATION_BACKEND", "gemini").lower()
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+STUB_LATENCY_MS = float(os.getenv("EXPLANATION_STUB_LATENCY_MS", "0"))
+EXPLANATION_WORKERS = int(os.getenv("EXPLANATION_WORKERS", "4"))
+EXPLANATION_CACHE_TTL = float(os.getenv("EXPLANATION_CACHE_TTL", "86400"))
+# Floors of the confidence buckets each label's explanation is cached under
+CONFIDENCE_BUCKETS = [float(b) for b in os.getenv("EXPLANATION_CONFIDENCE_BUCKETS", "0,0.6,0.85").split(",")]
+# SQLite file shared by every worker on the host; empty keeps the store in memory only
+EXPLANATION_STORE_PATH = os.getenv("EXPLANATION_STORE_PATH", os.path.join("cache", "explanations.sqlite3"))
+JOB_TTL_SECONDS = float(os.getenv("EXPLANATION_JOB_TTL", "600"))
+
+CLASS_LABELS = ['glioma', 'meningioma', 'notumor', 'pituitary']
+
+FALLBACK_MESSAGE = "Unable to retrieve detailed explanation at the moment."
+
+
+def clean_ai_json_response(response: str):
+    try:
+        # Remove ```json, ```, and any wrapping quotes or escape characters
+        cleaned = re.sub(r'```json|```', '', response).strip()
+
+        # Unescape any escape sequences like \n, \", etc.
+        cleaned = bytes(cleaned, "utf-8").decode("unicode_escape")
+
+        # Load and return as JSON
+        return json.loads(cleaned)
+    except Exception as e:
+        print("Error:", e)
+        return None
+
+
+def build_prompt(label, confidence):
+    return (
+        f"The MRI scan is classified as '{label}' with a confidence of {confidence:.2f}. "
+        "Based on this label, return a JSON object in the following format:\n\n"
+        "{\n"
+        '  "header": "Short, patient-friendly title",\n'
+        '  "lists": [\n'
+        '    "Simple explanation of the tumor",\n'
+        '    "Key symptoms",\n'
+        '    "Common causes",\n'
+        '    "Treatment options",\n'
+        '    "Important notes for patients"\n'
+        "  ]\n"
+        "}\n\n"
+        "BUT — if the label is 'notumor', return only:\n"
+        '{\n  "header": "There is no brain tumor detected."\n}\n\n'
+        "Keep the language simple. Do not include any explanation or text outside the JSON object."
+    )
+
+
+class GeminiBackend:
+    name = "gemini"
+
+    def __init__(self):
+        import google.generativeai as genai
+
+        api_key = os.getenv("GEMINI_API_KEY")
+        if not api_key:
+            raise EnvironmentError("Missing GEMINI_API_KEY in .env file")
+        genai.configure(api_key=api_key)
+        self._model = genai.GenerativeModel(GEMINI_MODEL)
+
+    def generate(self, prompt):
+        with stage("upstream", upstream="gemini"):
+            return self._model.generate_content(prompt).text
+
+
+class StubBackend:
+    """Offline stand-in that answers in the same JSON shape as Gemini."""
+
+    name = "stub"
+
+    def generate(self, prompt):
+        if STUB_LATENCY_MS:
+            time.sleep(STUB_LATENCY_MS / 1000.0)
+        label = re.search(r"classified as '([^']+)'", prompt)
+        label = label.group(1) if label else "unknown"
+        if label == "notumor":
+            return json.dumps({"header": "There is no brain tumor detected."})
+        return "```json\n" + json.dumps({
+            "header": f"About {label}",
+            "lists": [
+                f"{label.capitalize()} is a growth of cells in or near the brain.",
+                "Symptoms can include headaches, seizures or vision changes.",
+                "The exact cause is often unknown.",
+                "Treatment may involve surgery, radiation or medication.",
+                "Please discuss these results with your doctor.",
+            ],
+        }) + "\n```"
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = StubBackend() if EXPLANATION_BACKEND == "stub" else GeminiBackend()
+    return _backend
+
+
+class ExplanationStore:
+    """Parsed explanations per (label, confidence bucket), served from memory.
+
+    Entries older than the TTL keep being served while a background refresh
+    replaces them, and concurrent misses for one key share a single LLM call.
+    Entries are persisted to a SQLite file, one row per key, so a cold start
+    does not have to regenerate them and workers sharing the file never
+    overwrite each other's entries with an older copy.
+    """
+
+    def __init__(self, ttl_seconds=EXPLANATION_CACHE_TTL, buckets=CONFIDENCE_BUCKETS,
+                 path=EXPLANATION_STORE_PATH):
+        self.ttl = ttl_seconds
+        self.buckets = sorted(buckets)
+        self.path = path
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._refresher = None
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "errors": 0}
+        self._db = None
+        if path:
+            self._open_db(path)
+            self.load()
+
+    def bucket(self, confidence):
+        """Index of the highest bucket floor <= confidence (0 when below all floors)."""
+        index = 0
+        for i, floor in enumerate(self.buckets):
+            if confidence >= floor:
+                index = i
+        return index
+
+    def representative_confidence(self, bucket):
+        """Midpoint of a bucket, used as the fixed confidence in its prompt."""
+        if not self.buckets:
+            return 0.5
+        upper = self.buckets[bucket + 1] if bucket + 1 < len(self.buckets) else 1.0
+        return (self.buckets[bucket] + upper) / 2
+
+    def key(self, label, confidence):
+        return f"{label}:{self.bucket(confidence)}"
+
+    def get(self, label, confidence):
+        """Hot path: memory only. Stale entries are returned and refreshed in the background."""
+        key = self.key(label, confidence)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            stale = time.time() - entry["generated_at"] > self.ttl
+            self._counters["stale_hits" if stale else "hits"] += 1
+        if stale:
+            self._refresh_async(label, self.bucket(confidence))
+        return entry["message"]
+
+    def fetch(self, label, confidence):
+        """`get`, falling back to a blocking, de-duplicated generation on a miss."""
+        message = self.get(label, confidence)
+        if message is not None:
+            return message
+        return self.refresh(label, self.bucket(confidence))
+
+    def refresh(self, label, bucket):
+        key = f"{label}:{bucket}"
+        with self._lock:
+            pending = self._inflight.get(key)
+            owner = pending is None
+            if owner:
+                pending = self._inflight[key] = {"done": threading.Event(), "message": None}
+        if not owner:
+            pending["done"].wait()
+            return pending["message"]
+
+        try:
+            message = clean_ai_json_response(
+                get_backend().generate(build_prompt(label, self.representative_confidence(bucket)))
+            )
+            if isinstance(message, dict):
+                entry = {"message": message, "generated_at": time.time()}
+                with self._lock:
+                    self._entries[key] = entry
+                    self._counters["refreshes"] += 1
+                self.save(key, entry)
+            pending["message"] = message
+            return message
+        except Exception:
+            with self._lock:
+                self._counters["errors"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+            pending["done"].set()
+
+    def _refresh_async(self, label, bucket):
+        if f"{label}:{bucket}" in self._inflight:
+            return
+
+        def run():
+            try:
+                self.refresh(label, bucket)
+            except Exception as e:
+                logger.error(f"Background explanation refresh for {label} failed: {str(e)}")
+
+        threading.Thread(target=run, name="explanation-refresh", daemon=True).start()
+
+    def warmup(self, labels=CLASS_LABELS, force=False):
+        """Generate every missing or stale (label, bucket) entry. Returns the count generated."""
+        generated = 0
+        for label in labels:
+            for bucket in range(max(len(self.buckets), 1)):
+                with self._lock:
+                    entry = self._entries.get(f"{label}:{bucket}")
+                if not force and entry is not None and time.time() - entry["generated_at"] <= self.ttl:
+                    continue
+                try:
+                    if self.refresh(label, bucket) is not None:
+                        generated += 1
+                except Exception as e:
+                    logger.error(f"Explanation warmup for {label}:{bucket} failed: {str(e)}")
+        return generated
+
+    def start_background_refresh(self, interval_seconds=None):
+        """Warm missing entries, then keep refreshing stale ones on a timer."""
+        if self._refresher is not None:
+            return
+        interval = interval_seconds or max(self.ttl / 4, 1.0)
+
+        def loop():
+            while True:
+                self.warmup()
+                time.sleep(interval)
+
+        self._refresher = threading.Thread(target=loop, name="explanation-warmup", daemon=True)
+        self._refresher.start()
+
+    def _open_db(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS explanations ("
+            "key TEXT PRIMARY KEY, message TEXT NOT NULL, generated_at REAL NOT NULL)"
+        )
+
+    def load(self):
+        """Take every persisted entry newer than the one in memory."""
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                rows = self._db.execute("SELECT key, message, generated_at FROM explanations").fetchall()
+                for key, message, generated_at in rows:
+                    entry = self._entries.get(key)
+                    if entry is None or entry["generated_at"] < generated_at:
+                        self._entries[key] = {"message": json.loads(message), "generated_at": generated_at}
+            logger.info(f"Loaded {len(rows)} explanations from {self.path}")
+        except (sqlite3.Error, ValueError) as e:
+            logger.error(f"Could not load explanation store {self.path}: {str(e)}")
+
+    def save(self, key, entry):
+        """Persist one entry; a newer row written by another worker is kept."""
+        if self._db is None:
+            return
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT INTO explanations (key, message, generated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (key) DO UPDATE SET message = excluded.message, "
+                    "generated_at = excluded.generated_at WHERE excluded.generated_at > explanations.generated_at",
+                    (key, json.dumps(entry["message"]), entry["generated_at"]),
+                )
+        except sqlite3.Error as e:
+            logger.error(f"Could not persist explanation store {self.path}: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+            data.update({"entries": len(self._entries), "ttl_seconds": self.ttl,
+                         "buckets": self.buckets, "path": self.path})
+        return data
+
+
+explanation_store = ExplanationStore()
+
+
+def cached_explanation(label, confidence):
+    return explanation_store.get(label, confidence)
+
+
+def generate_explanation(label, confidence):
+    """Parsed explanation for `label`, from the store or a single shared LLM call.
+
+    Returns None when the backend answer could not be parsed; raises on backend errors.
+    """
+    return explanation_store.fetch(label, confidence)
+
+
+class ExplanationJobs:
+    """Background explanation generation, polled or streamed by job id."""
+
+    def __init__(self, workers=EXPLANATION_WORKERS, ttl_seconds=JOB_TTL_SECONDS):
+        self.ttl = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="explain")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, label, confidence):
+        self._purge()
+        job_id = uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "status": "pending",
+            "label": label,
+            "confidence": confidence,
+            "message": None,
+            "created": time.time(),
+            "done": threading.Event(),
+        }
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(self._run, job)
+        return job_id
+
+    def _run(self, job):
+        message = None
+        try:
+            message = generate_explanation(job["label"], job["confidence"])
+        except Exception as e:
+            logger.error(f"Explanation job {job['id']} failed: {str(e)}")
+        finally:
+            with self._lock:
+                # Already failed by _purge if the backend call outlived the TTL
+                if "finished" not in job:
+                    job["message"] = message if message is not None else FALLBACK_MESSAGE
+                    job["status"] = "done" if message is not None else "failed"
+                    job["finished"] = time.time()
+            job["done"].set()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout=None):
+        job = self.get(job_id)
+        if job is not None:
+            job["done"].wait(timeout)
+        return job
+
+    def _purge(self):
+        now = time.time()
+        cutoff = now - self.ttl
+        with self._lock:
+            for job in self._jobs.values():
+                # Stuck behind a hung backend call: fail it so pollers and streams get an answer,
+                # and it expires like any finished job
+                if "finished" not in job and job["created"] < cutoff:
+                    logger.error(f"Explanation job {job['id']} still pending after {self.ttl:.0f}s; marking failed")
+                    job["message"] = FALLBACK_MESSAGE
+                    job["status"] = "failed"
+                    job["finished"] = now
+                    job["done"].set()
+            expired = [job_id for job_id, job in self._jobs.items() if job.get("finished", now) < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if job["status"] == "pending")
+            return {"jobs": len(self._jobs), "pending": pending}
+
+
+def job_view(job):
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["label"],
+        "confidence": job["confidence"],
+        "message": job["message"],
+    }
+
+
+explanation_jobs = ExplanationJobs()
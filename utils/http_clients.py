@@ -0,0 +1,368 @@
+import asyncio
+import contextlib
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+
+from utils import metrics
+from utils.instrumentation import observe_stage
+
+logger = logging.getLogger(__name__)
+
+# Defaults for every upstream; each can be overridden with UPSTREAM_<NAME>_<SETTING>,
+# e.g. UPSTREAM_GROQ_BASE_URL=http://localhost:9000 to point at a mock server.
+DEFAULTS = {
+    "pool_size": int(os.getenv("HTTP_POOL_SIZE", "50")),
+    "timeout": float(os.getenv("HTTP_TIMEOUT_SECONDS", "30")),
+    "retries": int(os.getenv("HTTP_RETRIES", "2")),
+    "backoff_base": float(os.getenv("HTTP_BACKOFF_BASE", "0.2")),
+    "backoff_max": float(os.getenv("HTTP_BACKOFF_MAX", "5")),
+    "failure_threshold": int(os.getenv("HTTP_BREAKER_FAILURES", "5")),
+    "reset_timeout": float(os.getenv("HTTP_BREAKER_RESET_SECONDS", "30")),
+}
+
+UPSTREAMS = {
+    "groq": {"base_url": "https://api.groq.com"},
+    "huggingface": {"base_url": "https://api-inference.huggingface.co"},
+}
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class UpstreamError(Exception):
+    def __init__(self, message, status_code=None, response=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.response = response
+
+
+class CircuitOpenError(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    """Opens after `failure_threshold` consecutive failures; lets one trial through after `reset_timeout`."""
+
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """True, "trial" when this call is the half-open trial, or False while open."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open" and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return "trial"
+            return False
+
+    def release_trial(self):
+        """Free the trial slot of a call that ended without an upstream verdict (e.g. cancelled)."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    logger.error(f"Circuit opened after {self.failures} consecutive failures")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
+
+def _error_kind(exc):
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    return "connection"
+
+
+class _MetricsTransport(httpx.BaseTransport):
+    """Records per-attempt latency and transport errors for one upstream."""
+
+    def __init__(self, upstream, transport):
+        self.upstream = upstream
+        self.transport = transport
+
+    def handle_request(self, request):
+        start = time.perf_counter()
+        try:
+            response = self.transport.handle_request(request)
+        except httpx.TransportError as e:
+            metrics.counter("upstream_errors_total", upstream=self.upstream, kind=_error_kind(e)).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.histogram("upstream_request_seconds", upstream=self.upstream).observe(elapsed)
+            observe_stage("upstream", elapsed, upstream=self.upstream)
+        if response.status_code >= 400:
+            metrics.counter("upstream_errors_total", upstream=self.upstream,
+                            kind=f"http_{response.status_code}").inc()
+        return response
+
+    def close(self):
+        self.transport.close()
+
+
+class _AsyncMetricsTransport(httpx.AsyncBaseTransport):
+    def __init__(self, upstream, transport):
+        self.upstream = upstream
+        self.transport = transport
+
+    async def handle_async_request(self, request):
+        start = time.perf_counter()
+        try:
+            response = await self.transport.handle_async_request(request)
+        except httpx.TransportError as e:
+            metrics.counter("upstream_errors_total", upstream=self.upstream, kind=_error_kind(e)).inc()
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            metrics.histogram("upstream_request_seconds", upstream=self.upstream).observe(elapsed)
+            observe_stage("upstream", elapsed, upstream=self.upstream)
+        if response.status_code >= 400:
+            metrics.counter("upstream_errors_total", upstream=self.upstream,
+                            kind=f"http_{response.status_code}").inc()
+        return response
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class Upstream:
+    """Pooled keep-alive clients, retries with jittered backoff and a circuit breaker for one host."""
+
+    def __init__(self, name, base_url, pool_size, timeout, retries, backoff_base, backoff_max,
+                 failure_threshold, reset_timeout):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._client = None
+        self._async_client = None
+        self._lock = threading.Lock()
+
+    def _limits(self):
+        return httpx.Limits(max_connections=self.pool_size,
+                            max_keepalive_connections=self.pool_size)
+
+    @property
+    def client(self):
+        """Shared sync httpx.Client; also handed to SDKs that accept one."""
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    transport = _MetricsTransport(self.name, httpx.HTTPTransport(limits=self._limits()))
+                    self._client = httpx.Client(base_url=self.base_url, timeout=self.timeout,
+                                                transport=transport)
+        return self._client
+
+    @property
+    def async_client(self):
+        """Shared httpx.AsyncClient, recreated after `close_async_client`; SDKs holding
+        the old one must compare identities and rebuild (see chat_with_pdf_util.create_llm)."""
+        client = self._async_client
+        if client is None or client.is_closed:
+            with self._lock:
+                if self._async_client is None or self._async_client.is_closed:
+                    transport = _AsyncMetricsTransport(
+                        self.name, httpx.AsyncHTTPTransport(limits=self._limits()))
+                    self._async_client = httpx.AsyncClient(base_url=self.base_url, timeout=self.timeout,
+                                                           transport=transport)
+                client = self._async_client
+        return client
+
+    def _backoff(self, attempt):
+        # "Full jitter": uniform in [0, min(max, base * 2^attempt)]
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _check_breaker(self):
+        allowed = self.breaker.allow()
+        if not allowed:
+            metrics.counter("upstream_errors_total", upstream=self.name, kind="circuit_open").inc()
+            raise CircuitOpenError(f"{self.name}: circuit open, not calling upstream")
+        return allowed == "trial"
+
+    @contextlib.contextmanager
+    def _attempts(self):
+        """Around a call's attempts: a half-open trial that ends in anything but a recorded
+        success or failure (cancellation, a decode error, a bad URL) frees the trial slot,
+        or the breaker would never let another request through."""
+        trial = self._check_breaker()
+        try:
+            yield
+        except BaseException:
+            if trial:
+                self.breaker.release_trial()
+            raise
+
+    def _finish(self, response, raise_for_status):
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        if raise_for_status and response.status_code >= 400:
+            raise UpstreamError(
+                f"{self.name}: HTTP {response.status_code} - {response.text[:200]}",
+                status_code=response.status_code, response=response,
+            )
+        return response
+
+    def request(self, method, url, raise_for_status=True, **kwargs):
+        with self._attempts():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = self.client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if last:
+                        self.breaker.record_failure()
+                        raise UpstreamError(f"{self.name}: {type(e).__name__}: {str(e)}") from e
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        return self._finish(response, raise_for_status)
+                metrics.counter("upstream_retries_total", upstream=self.name).inc()
+                time.sleep(self._backoff(attempt))
+
+    async def arequest(self, method, url, raise_for_status=True, **kwargs):
+        with self._attempts():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    response = await self.async_client.request(method, url, **kwargs)
+                except httpx.TransportError as e:
+                    if last:
+                        self.breaker.record_failure()
+                        raise UpstreamError(f"{self.name}: {type(e).__name__}: {str(e)}") from e
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        return self._finish(response, raise_for_status)
+                metrics.counter("upstream_retries_total", upstream=self.name).inc()
+                await asyncio.sleep(self._backoff(attempt))
+
+    @contextlib.contextmanager
+    def stream(self, method, url, **kwargs):
+        """`request` with the body left unread; retries only cover getting the response headers."""
+        with self._attempts():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    request = self.client.build_request(method, url, **kwargs)
+                    response = self.client.send(request, stream=True)
+                except httpx.TransportError as e:
+                    if last:
+                        self.breaker.record_failure()
+                        raise UpstreamError(f"{self.name}: {type(e).__name__}: {str(e)}") from e
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        try:
+                            if response.status_code >= 400:
+                                response.read()
+                            yield self._finish(response, raise_for_status=True)
+                        finally:
+                            response.close()
+                        return
+                    response.close()
+                metrics.counter("upstream_retries_total", upstream=self.name).inc()
+                time.sleep(self._backoff(attempt))
+
+    @contextlib.asynccontextmanager
+    async def astream(self, method, url, **kwargs):
+        with self._attempts():
+            for attempt in range(self.retries + 1):
+                last = attempt == self.retries
+                try:
+                    request = self.async_client.build_request(method, url, **kwargs)
+                    response = await self.async_client.send(request, stream=True)
+                except httpx.TransportError as e:
+                    if last:
+                        self.breaker.record_failure()
+                        raise UpstreamError(f"{self.name}: {type(e).__name__}: {str(e)}") from e
+                else:
+                    if response.status_code not in RETRY_STATUSES or last:
+                        try:
+                            if response.status_code >= 400:
+                                await response.aread()
+                            yield self._finish(response, raise_for_status=True)
+                        finally:
+                            await response.aclose()
+                        return
+                    await response.aclose()
+                metrics.counter("upstream_retries_total", upstream=self.name).inc()
+                await asyncio.sleep(self._backoff(attempt))
+
+    def stats(self):
+        return {
+            "base_url": self.base_url,
+            "pool_size": self.pool_size,
+            "timeout": self.timeout,
+            "retries": self.retries,
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+        }
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def _setting(name, key, default):
+    value = os.getenv(f"UPSTREAM_{name.upper()}_{key.upper()}")
+    if value is None:
+        return default
+    return type(default)(value)
+
+
+def get_upstream(name):
+    upstream = _upstreams.get(name)
+    if upstream is None:
+        with _upstreams_lock:
+            upstream = _upstreams.get(name)
+            if upstream is None:
+                config = dict(DEFAULTS, **UPSTREAMS.get(name, {}))
+                if "base_url" not in config:
+                    raise KeyError(f"Unknown upstream '{name}'")
+                config = {key: _setting(name, key, value) for key, value in config.items()}
+                upstream = _upstreams[name] = Upstream(name, **config)
+    return upstream
+
+
+def upstream_stats():
+    return {
+        "upstreams": {name: upstream.stats() for name, upstream in _upstreams.items()},
+        "metrics": metrics.snapshot(prefix="upstream_"),
+    }
+
+
+async def close_async_client():
+    """Close every upstream's async client (called on ASGI shutdown)."""
+    for upstream in list(_upstreams.values()):
+        with upstream._lock:
+            client, upstream._async_client = upstream._async_client, None
+        if client is not None and not client.is_closed:
+            await client.aclose()
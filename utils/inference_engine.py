@@ -0,0 +1,126 @@
+import logging
+import os
+import threading
+
+import numpy as np
+
+from utils.batching import MicroBatcher
+from utils.model_registry import classifier_model_name, get_session
+from utils.warmup import mark_ready
+
+logger = logging.getLogger(__name__)
+
+# Batching limits, overridable from the environment
+BATCHING_ENABLED = os.getenv("INFERENCE_BATCHING", "1").lower() in ("1", "true", "yes")
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "8"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5"))
+
+
+class InferenceEngine:
+    """Runs an ONNX session either one request at a time or micro-batched.
+
+    `predict(img)` takes a float32 array of shape (n, H, W, C) and returns the
+    matching (n, classes) output rows, regardless of which mode is active.
+    """
+
+    def __init__(self, session, batching=BATCHING_ENABLED,
+                 max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, name=None):
+        self.session = session
+        self.name = name
+        self.input_details = session.get_inputs()[0]
+        self.input_name = self.input_details.name
+        self._lock = threading.Lock()
+        self._single_runs = 0
+
+        batch_dim = self.input_details.shape[0]
+        if batching and isinstance(batch_dim, int):
+            logger.warning(
+                f"Model has a fixed batch dimension ({batch_dim}); using single-shot inference"
+            )
+            batching = False
+
+        self.batching = batching and max_batch_size > 1
+        self._batcher = None
+        if self.batching:
+            self._batcher = MicroBatcher(
+                self._run_batch,
+                max_batch_size=max_batch_size,
+                max_wait_ms=max_wait_ms,
+                name="onnx-batcher",
+            )
+
+    def predict(self, img):
+        if self._batcher is None:
+            return self._run_single(img)
+        return self._batcher.run(img)
+
+    def predict_batch(self, img):
+        """Run an already-batched input in one session call, bypassing the micro-batcher.
+
+        Models with a fixed batch dimension of 1 are run one row at a time.
+        """
+        if self.input_details.shape[0] == 1 and img.shape[0] > 1:
+            return np.concatenate([self._run_single(img[i:i + 1]) for i in range(img.shape[0])])
+        return self._run_single(img)
+
+    def warmup(self):
+        """Run one zero input so the first request does not pay ORT's first-run allocations."""
+        shape = list(self.input_details.shape)
+        if not isinstance(shape[0], int):
+            shape[0] = 1
+        if all(isinstance(d, int) for d in shape):
+            self.session.run(None, {self.input_name: np.zeros(shape, dtype=np.float32)})
+
+    def stats(self):
+        data = {"model": self.name, "mode": "batched" if self.batching else "single",
+                "single_runs": self._single_runs}
+        if self._batcher is not None:
+            data["batcher"] = self._batcher.stats()
+        return data
+
+    def _run_single(self, img):
+        with self._lock:
+            self._single_runs += 1
+        return self.session.run(None, {self.input_name: img})[0]
+
+    def _run_batch(self, images):
+        if len(images) == 1:
+            return [self.session.run(None, {self.input_name: images[0]})[0]]
+
+        counts = [img.shape[0] for img in images]
+        batch = np.concatenate(images, axis=0)
+        try:
+            output = self.session.run(None, {self.input_name: batch})[0]
+        except Exception as e:
+            # One malformed input must not fail its neighbours: retry individually.
+            logger.error(f"Batched run failed, retrying {len(images)} items singly: {str(e)}")
+            results = []
+            for img in images:
+                try:
+                    results.append(self.session.run(None, {self.input_name: img})[0])
+                except Exception as item_error:
+                    results.append(item_error)
+            return results
+
+        offsets = np.cumsum([0] + counts)
+        return [output[offsets[i]:offsets[i + 1]] for i in range(len(images))]
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(model_name=None):
+    """Shared engine over the registry's session, created on first use (default: the served classifier)."""
+    model_name = model_name or classifier_model_name()
+    engine = _engines.get(model_name)
+    if engine is None:
+        with _engines_lock:
+            engine = _engines.get(model_name)
+            if engine is None:
+                engine = InferenceEngine(get_session(model_name), name=model_name)
+                logger.info(f"Inference mode for '{model_name}': {engine.stats()['mode']}")
+                _engines[model_name] = engine
+                if model_name == classifier_model_name():
+                    mark_ready("classifier")
+    return engine
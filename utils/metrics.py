@@ -0,0 +1,115 @@
+import bisect
+import threading
+
+# Seconds; covers in-process stages through slow LLM calls
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+class Counter:
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def snapshot(self):
+        return {"name": self.name, "labels": dict(self.labels), "value": self.value}
+
+
+class Histogram:
+    def __init__(self, name, labels, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        # First bucket whose upper bound is >= value (the last slot is +Inf)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += value
+
+    def snapshot(self):
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, count in zip(self.buckets, self.counts):
+                running += count
+                cumulative[str(bound)] = running
+            cumulative["+Inf"] = self.count
+            return {"name": self.name, "labels": dict(self.labels), "count": self.count,
+                    "sum": self.sum, "buckets": cumulative}
+
+
+def _get(kind, name, labels, **kwargs):
+    key = (kind.__name__, name, tuple(sorted(labels.items())))
+    metric = _registry.get(key)
+    if metric is None:
+        with _registry_lock:
+            metric = _registry.get(key)
+            if metric is None:
+                metric = _registry[key] = kind(name, dict(labels), **kwargs)
+    return metric
+
+
+def counter(name, **labels):
+    return _get(Counter, name, labels)
+
+
+def histogram(name, buckets=DEFAULT_BUCKETS, **labels):
+    return _get(Histogram, name, labels, buckets=buckets)
+
+
+def snapshot(prefix=None):
+    """All registered metrics (optionally only those whose name starts with `prefix`)."""
+    metrics = [m for m in list(_registry.values()) if prefix is None or m.name.startswith(prefix)]
+    return {
+        "counters": [m.snapshot() for m in metrics if isinstance(m, Counter)],
+        "histograms": [m.snapshot() for m in metrics if isinstance(m, Histogram)],
+    }
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels, extra=None):
+    items = list(labels.items()) + (list(extra.items()) if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+def render_prometheus():
+    """Every registered metric in the Prometheus text exposition format (0.0.4)."""
+    families = {}
+    for metric in list(_registry.values()):
+        families.setdefault(metric.name, []).append(metric)
+
+    lines = []
+    for name in sorted(families):
+        metrics = families[name]
+        if isinstance(metrics[0], Counter):
+            lines.append(f"# TYPE {name} counter")
+            for m in metrics:
+                lines.append(f"{name}{_format_labels(m.labels)} {m.value}")
+            continue
+        lines.append(f"# TYPE {name} histogram")
+        for m in metrics:
+            data = m.snapshot()
+            for bound, count in data["buckets"].items():
+                lines.append(f"{name}_bucket{_format_labels(m.labels, {'le': bound})} {count}")
+            lines.append(f"{name}_sum{_format_labels(m.labels)} {data['sum']}")
+            lines.append(f"{name}_count{_format_labels(m.labels)} {data['count']}")
+    return "\n".join(lines) + "\n"
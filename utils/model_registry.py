@@ -0,0 +1,301 @@
+import hashlib
+import json
+import logging
+import os
+import platform
+import threading
+import time
+
+import psutil
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = "models"
+
+# Session tuning, overridable from the environment. 0 lets ORT pick.
+INTRA_OP_THREADS = int(os.getenv("ORT_INTRA_OP_THREADS", "0"))
+INTER_OP_THREADS = int(os.getenv("ORT_INTER_OP_THREADS", "0"))
+EXECUTION_MODE = os.getenv("ORT_EXECUTION_MODE", "sequential")
+GRAPH_OPT_LEVEL = os.getenv("ORT_GRAPH_OPT_LEVEL", "all")
+OPTIMIZED_MODEL_DIR = os.getenv("ORT_OPTIMIZED_MODEL_DIR", os.path.join(MODEL_DIR, "optimized"))
+OPTIMIZED_CACHE_ENABLED = os.getenv("ORT_OPTIMIZED_CACHE", "1").lower() in ("1", "true", "yes")
+# Reduced-precision classifier built by scripts.quantize_classifier: fp32, int8-dynamic, int8-static or fp16
+CLASSIFIER_VARIANTS = ("fp32", "int8-dynamic", "int8-static", "fp16")
+CLASSIFIER_VARIANT = os.getenv("CLASSIFIER_VARIANT", "fp32").lower()
+# A variant is only served once its parity report against fp32 has passed; 0 skips the check
+CLASSIFIER_VARIANT_GATE = os.getenv("CLASSIFIER_VARIANT_GATE", "1").lower() in ("1", "true", "yes")
+
+_models = {}
+_sessions = {}
+_info = {}
+_lock = threading.Lock()
+_model_locks = {}
+
+
+def register_model(name, path, url=None):
+    """Declare a model. Nothing is read from disk until `get_session(name)`."""
+    with _lock:
+        _models[name] = {"path": path, "url": url}
+        _model_locks.setdefault(name, threading.Lock())
+
+
+CLASSIFIER_PATH = os.getenv("CLASSIFIER_MODEL_PATH", os.path.join(MODEL_DIR, "brain_tumor_classifier.onnx"))
+
+register_model(
+    "classifier",
+    CLASSIFIER_PATH,
+    url="https://huggingface.co/shuvsut/efficientv2Lonnx/resolve/main/brain_tumor_classifier.onnx",
+)
+
+
+def variant_path(path, variant):
+    """models/x.onnx -> models/x.int8-static.onnx; fp32 is the file itself."""
+    if variant == "fp32":
+        return path
+    base, ext = os.path.splitext(path)
+    return f"{base}.{variant}{ext}"
+
+
+def parity_report_path(path):
+    return os.path.splitext(path)[0] + ".parity.json"
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stale_parity(parity, path):
+    """Why a parity report does not cover the variant and fp32 files on disk now, or None."""
+    if not os.path.exists(CLASSIFIER_PATH):
+        return f"fp32 model '{CLASSIFIER_PATH}' is not on disk to verify against"
+    for key, file in (("sha256", path), ("fp32_sha256", CLASSIFIER_PATH)):
+        if not parity.get(key):
+            return f"report has no {key} (re-run scripts.quantize_classifier)"
+        if parity[key] != file_sha256(file):
+            return f"'{file}' changed since the report was written"
+    return None
+
+
+for _variant in CLASSIFIER_VARIANTS[1:]:
+    register_model(f"classifier-{_variant}", variant_path(CLASSIFIER_PATH, _variant))
+
+_classifier_name = None
+
+
+def classifier_model_name():
+    """Registry name of the classifier to serve, per CLASSIFIER_VARIANT (resolved once).
+
+    Falls back to fp32, with an error logged, when the variant file is
+    missing or its parity report (scripts.quantize_classifier) is missing,
+    failed, or was written for different variant or fp32 file contents.
+    """
+    global _classifier_name
+    if _classifier_name is not None:
+        return _classifier_name
+
+    name = "classifier"
+    if CLASSIFIER_VARIANT not in CLASSIFIER_VARIANTS:
+        logger.error(f"Unknown CLASSIFIER_VARIANT '{CLASSIFIER_VARIANT}'; serving fp32")
+    elif CLASSIFIER_VARIANT != "fp32":
+        path = _models[f"classifier-{CLASSIFIER_VARIANT}"]["path"]
+        report = parity_report_path(path)
+        if not os.path.exists(path):
+            logger.error(f"Classifier variant file '{path}' not found; serving fp32")
+        elif not CLASSIFIER_VARIANT_GATE:
+            name = f"classifier-{CLASSIFIER_VARIANT}"
+        elif not os.path.exists(report):
+            logger.error(f"No parity report for '{path}' (run scripts.quantize_classifier); serving fp32")
+        else:
+            with open(report) as f:
+                parity = json.load(f)
+            stale = parity.get("passed") and _stale_parity(parity, path)
+            if not parity.get("passed"):
+                logger.error(f"Classifier variant '{CLASSIFIER_VARIANT}' failed its parity gate; serving fp32")
+            elif stale:
+                logger.error(f"Parity report for '{path}' is stale: {stale}; serving fp32")
+            else:
+                name = f"classifier-{CLASSIFIER_VARIANT}"
+    _classifier_name = name
+    logger.info(f"Serving classifier '{name}'")
+    return name
+
+
+def ensure_model_file(path, url=None):
+    if os.path.exists(path):
+        return path
+    if not url:
+        raise FileNotFoundError(f"Model file '{path}' not found!")
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    import requests
+
+    logger.info(f"Downloading ONNX model from {url} ...")
+    # Per-process name: workers booting together each download and atomically replace
+    tmp_path = f"{path}.{os.getpid()}.part"
+    try:
+        with requests.get(url, stream=True, timeout=60) as response:
+            if response.status_code != 200:
+                logger.error(f"Failed to download model. HTTP {response.status_code}")
+                raise RuntimeError(f"Could not download model from {url}")
+            with open(tmp_path, "wb") as f:
+                for chunk in response.iter_content(chunk_size=1 << 20):
+                    f.write(chunk)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    logger.info("Model downloaded successfully.")
+    return path
+
+
+def build_session_options():
+    import onnxruntime as ort
+
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = INTRA_OP_THREADS
+    options.inter_op_num_threads = INTER_OP_THREADS
+    options.execution_mode = {
+        "sequential": ort.ExecutionMode.ORT_SEQUENTIAL,
+        "parallel": ort.ExecutionMode.ORT_PARALLEL,
+    }[EXECUTION_MODE.lower()]
+    options.graph_optimization_level = {
+        "disable": ort.GraphOptimizationLevel.ORT_DISABLE_ALL,
+        "basic": ort.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+        "extended": ort.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+        "all": ort.GraphOptimizationLevel.ORT_ENABLE_ALL,
+    }[GRAPH_OPT_LEVEL.lower()]
+    return options
+
+
+def _optimized_cache_path(path):
+    """Cache file name tied to the source model, ORT version and opt level."""
+    import onnxruntime as ort
+
+    stat = os.stat(path)
+    key = "|".join([
+        os.path.abspath(path), str(stat.st_size), str(int(stat.st_mtime)),
+        ort.__version__, GRAPH_OPT_LEVEL.lower(), platform.machine(),
+    ])
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+    base = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(OPTIMIZED_MODEL_DIR, f"{base}.{digest}.opt.onnx")
+
+
+def _create_session(path, rebuild=False):
+    import onnxruntime as ort
+
+    options = build_session_options()
+    source = path
+    cache_hit = False
+    cached = tmp_path = None
+
+    if OPTIMIZED_CACHE_ENABLED and GRAPH_OPT_LEVEL.lower() != "disable":
+        cached = _optimized_cache_path(path)
+        if os.path.exists(cached) and not rebuild:
+            # Already optimised on a previous boot: skip the optimisation passes.
+            source = cached
+            cache_hit = True
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_DISABLE_ALL
+        else:
+            os.makedirs(OPTIMIZED_MODEL_DIR, exist_ok=True)
+            # Written under a per-process name and moved into place once complete, so other
+            # workers never load a half-written file
+            tmp_path = f"{cached[:-len('.onnx')]}.{os.getpid()}.tmp.onnx"
+            options.optimized_model_filepath = tmp_path
+
+    try:
+        session = ort.InferenceSession(source, sess_options=options,
+                                       providers=["CPUExecutionProvider"])
+    except Exception as e:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if not cache_hit:
+            raise
+        # Left in place: other workers may have it loaded; the rebuild replaces it atomically
+        logger.error(f"Optimized model cache unusable ({str(e)}); rebuilding from {path}")
+        return _create_session(path, rebuild=True)
+    if tmp_path and os.path.exists(tmp_path):
+        os.replace(tmp_path, cached)
+    return session, source, cache_hit
+
+
+def get_session(name="classifier"):
+    """Return the shared InferenceSession for `name`, loading it on first use."""
+    session = _sessions.get(name)
+    if session is not None:
+        return session
+
+    if name not in _models:
+        raise KeyError(f"Unknown model '{name}'")
+
+    with _model_locks[name]:
+        session = _sessions.get(name)
+        if session is not None:
+            return session
+
+        spec = _models[name]
+        path = ensure_model_file(spec["path"], spec["url"])
+
+        process = psutil.Process()
+        rss_before = process.memory_info().rss
+        start = time.perf_counter()
+        session, source, cache_hit = _create_session(path)
+        load_seconds = time.perf_counter() - start
+        rss_after = process.memory_info().rss
+
+        inputs = session.get_inputs()
+        stat = os.stat(path)
+        _info[name] = {
+            "name": name,
+            "path": path,
+            "identity": hashlib.sha1(
+                f"{os.path.basename(path)}|{stat.st_size}|{int(stat.st_mtime)}".encode("utf-8")
+            ).hexdigest()[:16],
+            "loaded_from": source,
+            "optimized_cache_hit": cache_hit,
+            "load_seconds": round(load_seconds, 4),
+            "session_rss_bytes": max(rss_after - rss_before, 0),
+            "file_bytes": os.path.getsize(path),
+            "inputs": [{"name": i.name, "shape": i.shape, "type": i.type} for i in inputs],
+            "outputs": [{"name": o.name, "shape": o.shape, "type": o.type}
+                        for o in session.get_outputs()],
+            "providers": session.get_providers(),
+        }
+        logger.info(
+            f"Loaded model '{name}' from {source} in {load_seconds:.2f}s "
+            f"(cache hit: {cache_hit}, input shape: {inputs[0].shape})"
+        )
+        _sessions[name] = session
+        return session
+
+
+def model_identity(name=None):
+    """Stable id of the loaded model file, for keying cached predictions."""
+    name = name or classifier_model_name()
+    get_session(name)
+    return f"{name}:{_info[name]['identity']}"
+
+
+def model_info():
+    """Load state, timings and memory for every registered model."""
+    models = []
+    for name, spec in _models.items():
+        entry = {"name": name, "path": spec["path"], "loaded": name in _sessions}
+        entry.update(_info.get(name, {}))
+        models.append(entry)
+    return {
+        "models": models,
+        "classifier": {"variant": CLASSIFIER_VARIANT, "serving": _classifier_name, "gate": CLASSIFIER_VARIANT_GATE},
+        "session_options": {
+            "intra_op_threads": INTRA_OP_THREADS,
+            "inter_op_threads": INTER_OP_THREADS,
+            "execution_mode": EXECUTION_MODE,
+            "graph_optimization_level": GRAPH_OPT_LEVEL,
+            "optimized_model_dir": OPTIMIZED_MODEL_DIR if OPTIMIZED_CACHE_ENABLED else None,
+        },
+        "process_rss_bytes": psutil.Process().memory_info().rss,
+    }
@@ -0,0 +1,160 @@
+import logging
+import math
+import os
+import re
+from collections import Counter
+
+from utils.pdf_raster import rasterize_pdf, rasterize_regions
+from utils.token_budget import annotate_costs
+
+logger = logging.getLogger(__name__)
+
+# "hybrid" (text layer + images of figures/scans, default) or "image" (every page rasterized)
+PDF_EXTRACT_MODE = os.getenv("PDF_EXTRACT_MODE", "hybrid").lower()
+# Pages with less extractable text than this are treated as scans and rasterized whole
+TEXT_MIN_CHARS = int(os.getenv("PDF_TEXT_MIN_CHARS", "50"))
+# Embedded images smaller than this fraction of the page (logos, bullets) are ignored
+IMAGE_MIN_AREA = float(os.getenv("PDF_IMAGE_MIN_AREA", "0.02"))
+# Above this fraction of image coverage a page is rendered whole rather than clipped
+IMAGE_FULL_PAGE_AREA = 0.5
+CHUNK_WORDS = int(os.getenv("PDF_CHUNK_WORDS", "200"))
+TOP_CHUNKS = int(os.getenv("PDF_CONTEXT_CHUNKS", "6"))
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text.lower())
+
+
+def chunk_text(text, page_number, chunk_words=CHUNK_WORDS):
+    """Split one page's text into paragraph-aligned chunks of about `chunk_words` words."""
+    chunks, current, words = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        count = len(paragraph.split())
+        if current and words + count > chunk_words:
+            chunks.append({"page": page_number, "text": "\n".join(current)})
+            current, words = [], 0
+        current.append(paragraph)
+        words += count
+    if current:
+        chunks.append({"page": page_number, "text": "\n".join(current)})
+    return chunks
+
+
+def _image_regions(page):
+    """Clip rects worth rasterizing on a text page, or None to render the page whole."""
+    import fitz
+
+    page_area = abs(page.rect)
+    rects = [fitz.Rect(info["bbox"]) & page.rect for info in page.get_image_info()]
+    rects = [r for r in rects if not r.is_empty and abs(r) >= IMAGE_MIN_AREA * page_area]
+    if sum(abs(r) for r in rects) >= IMAGE_FULL_PAGE_AREA * page_area:
+        return None
+    return [tuple(r) for r in rects]
+
+
+def extract_pdf(path, **raster_options):
+    """Text-first context: text chunks for every page with a text layer, plus
+    images of scanned pages and of the figures embedded in text pages."""
+    import fitz
+
+    chunks, regions = [], []
+    with fitz.open(path) as document:
+        page_count = document.page_count
+        for page_number in range(page_count):
+            page = document.load_page(page_number)
+            text = page.get_text("text")
+            if len(text.strip()) < TEXT_MIN_CHARS:
+                regions.append((page_number, None))
+                continue
+            chunks.extend(chunk_text(text, page_number))
+            clips = _image_regions(page)
+            if clips is None:
+                regions.append((page_number, None))
+            else:
+                regions.extend((page_number, clip) for clip in clips)
+
+    pages = list(rasterize_regions(path, regions, **raster_options)) if regions else []
+    logger.info(f"Extracted {path}: {page_count} pages, {len(chunks)} text chunks, {len(pages)} images")
+    return annotate_costs({"mode": "hybrid", "page_count": page_count, "chunks": chunks, "pages": pages,
+                           "bm25": Bm25Index.build(chunks)})
+
+
+def extract_pdf_images(path, **raster_options):
+    """Every page as an image (the original behaviour)."""
+    pages = list(rasterize_pdf(path, **raster_options))
+    return annotate_costs({"mode": "image", "page_count": len(pages), "chunks": [], "pages": pages})
+
+
+class Bm25Index:
+    """Okapi BM25 over a context's text chunks.
+
+    `state` is the output of `build`, computed once at upload and kept with
+    the session, so a question only scores instead of re-tokenizing the PDF.
+    """
+
+    def __init__(self, chunks, state=None):
+        state = state or self.build(chunks)
+        self.chunks = chunks
+        self.term_freqs = state["term_freqs"]
+        self.lengths = state["lengths"]
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.idf = state["idf"]
+
+    @staticmethod
+    def build(chunks):
+        """Term statistics of `chunks` as plain (JSON-serializable) data."""
+        term_freqs = [dict(Counter(tokenize(chunk["text"]))) for chunk in chunks]
+        doc_freq = Counter(term for tf in term_freqs for term in tf)
+        n = len(chunks)
+        return {
+            "term_freqs": term_freqs,
+            "lengths": [sum(tf.values()) for tf in term_freqs],
+            "idf": {term: math.log(1 + (n - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()},
+        }
+
+    def scores(self, query):
+        terms = [t for t in set(tokenize(query)) if t in self.idf]
+        scores = []
+        for tf, length in zip(self.term_freqs, self.lengths):
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (self.avg_length or 1.0))
+            scores.append(sum(
+                self.idf[t] * tf[t] * (BM25_K1 + 1) / (tf[t] + norm) for t in terms if t in tf
+            ))
+        return scores
+
+    def top(self, query, k):
+        scores = self.scores(query)
+        ranked = sorted((i for i, s in enumerate(scores) if s > 0), key=lambda i: -scores[i])
+        return ranked[:k]
+
+
+def select_context(context, user_query, top_chunks=TOP_CHUNKS):
+    """Candidates worth sending for one question, most important first.
+
+    Image-only contexts offer every page in order. Otherwise the best BM25
+    chunks (the first chunks when nothing matches, e.g. a greeting) come
+    first, then the images of their pages by rank, then every scanned page.
+    utils.token_budget decides how much of this fits in the request.
+    """
+    chunks = context.get("chunks") or []
+    if not chunks:
+        return {"chunks": [], "pages": list(context["pages"])}
+
+    # Sessions stored before the index was kept with them build it here
+    index = Bm25Index(chunks, context.get("bm25"))
+    ranked = index.top(user_query, top_chunks) or list(range(min(top_chunks, len(chunks))))
+    text_pages = {chunk["page"] for chunk in chunks}
+    page_order = list(dict.fromkeys(chunks[i]["page"] for i in ranked))
+    images = {}
+    for page in context["pages"]:
+        images.setdefault(page["page"], []).append(page)
+    pages = [page for number in page_order for page in images.get(number, [])]
+    pages += [page for page in context["pages"] if page["page"] not in text_pages]
+    return {"chunks": [chunks[i] for i in ranked], "pages": pages}
@@ -50,10 +50,28 @@
 #     pdf.output(output_path)
 
 
-from fpdf import FPDF
-from PIL import Image
+import io
+import logging
+import multiprocessing
 import os
-from utils.segment_util import segment_tumor_image 
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+from utils.instrumentation import stage
+from utils.segment_util import SEGMENTATION_ERRORS, segment_image, segment_images, to_jpeg
+from utils.warmup import mark_ready
+
+logger = logging.getLogger(__name__)
+
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Reports per pool task; batches no larger than this are rendered in-process
+REPORT_CHUNK_SIZE = int(os.getenv("REPORT_CHUNK_SIZE", "8"))
+REPORT_BATCH_MAX = int(os.getenv("REPORT_BATCH_MAX", "100"))
+REPORT_IMAGE_QUALITY = int(os.getenv("REPORT_IMAGE_QUALITY", "90"))
+# Core font ("Arial" is an alias of it): metrics are built into fpdf2, nothing to load or embed
+REPORT_FONT = "Helvetica"
 
 TUMOR_NAME_MAP = {
     "notumor": "No Tumor",
@@ -62,42 +80,135 @@ TUMOR_NAME_MAP = {
     "pituitary": "Pituitary Tumor"
 }
 
+NO_TUMOR_TEXT = "No signs of tumor detected.\nMaintain a healthy lifestyle and go for regular check-ups."
+TUMOR_TEXT = "Tumor detected.\nPlease consult a neurologist for further evaluation and treatment options."
+
 def format_tumor_name(raw_name):
     return TUMOR_NAME_MAP.get(raw_name.lower(), raw_name.capitalize())
 
-def generate_report(image_path, tumor_type, confidence, output_path):
+@lru_cache(maxsize=64)
+def _layout(tumor_type):
+    """Label-dependent text of a report, computed once per label."""
+    advice = NO_TUMOR_TEXT if tumor_type.lower() == "notumor" else TUMOR_TEXT
+    return f"Tumor Type: {format_tumor_name(tumor_type)}", advice
+
+def _line(pdf, text, **kwargs):
+    from fpdf.enums import XPos, YPos
+
+    pdf.cell(200, 10, text=text, new_x=XPos.LMARGIN, new_y=YPos.NEXT, **kwargs)
+
+def render_report(tumor_type, confidence, image_jpeg=None, image_error=None):
+    """Build the PDF report in memory and return its bytes.
+
+    `image_jpeg` is embedded as-is (fpdf2 copies JPEG data without decoding
+    it); `image_error` is shown in its place when there is no image.
+    """
+    # fpdf2 takes ~0.3 s to import, so it is loaded with the first report
+    from fpdf import FPDF
+    from fpdf.enums import XPos, YPos
+
+    mark_ready("report_renderer")
+    tumor_line, advice = _layout(tumor_type)
     pdf = FPDF()
     pdf.add_page()
 
-    pdf.set_font("Arial", size=16)
-    pdf.cell(200, 10, txt="Brain Tumor Classification Report", ln=True, align="C")
+    pdf.set_font(REPORT_FONT, size=16)
+    _line(pdf, "Brain Tumor Classification Report", align="C")
 
-    formatted_tumor = format_tumor_name(tumor_type)
-
-    pdf.set_font("Arial", size=12)
+    pdf.set_font(REPORT_FONT, size=12)
     pdf.ln(10)
-    pdf.cell(200, 10, txt=f"Tumor Type: {formatted_tumor}", ln=True)
-    pdf.cell(200, 10, txt=f"Confidence: {confidence:.2f}%", ln=True)
+    _line(pdf, tumor_line)
+    _line(pdf, f"Confidence: {confidence:.2f}%")
 
     pdf.ln(10)
-    if tumor_type.lower() == "notumor":
-        pdf.multi_cell(0, 10, txt="No signs of tumor detected.\nMaintain a healthy lifestyle and go for regular check-ups.")
-    else:
-        pdf.multi_cell(0, 10, txt="Tumor detected.\nPlease consult a neurologist for further evaluation and treatment options.")
+    pdf.multi_cell(0, 10, text=advice, new_x=XPos.LMARGIN, new_y=YPos.NEXT)
 
     pdf.ln(10)
-    pdf.cell(200, 10, txt="Segmented Tumor Image:", ln=True)
+    _line(pdf, "Segmented Tumor Image:")
 
     try:
-        segmented_path = segment_tumor_image(image_path)
-
-        with Image.open(segmented_path) as img:
-            rgb_img = img.convert('RGB')
-            temp_path = "temp_img_for_report.jpg"
-            rgb_img.save(temp_path, format="JPEG")
-            pdf.image(temp_path, x=10, y=pdf.get_y(), w=100)
-            os.remove(temp_path)
+        if image_jpeg is None:
+            raise ValueError(str(image_error) if image_error is not None else "no image")
+        pdf.image(io.BytesIO(image_jpeg), x=10, y=pdf.get_y(), w=100)
     except Exception as e:
-        pdf.cell(200, 10, txt=f"(Image could not be embedded: {str(e)})", ln=True)
-
-    pdf.output(output_path)
+        _line(pdf, f"(Image could not be embedded: {str(e)})")
+
+    return bytes(pdf.output())
+
+def generate_report(image_path, tumor_type, confidence, output_path=None, overlay_jpeg=None,
+                    segmentation_error=None):
+    """Segment the image and build the PDF report; returns the PDF bytes.
+
+    Callers that segmented the image themselves pass `overlay_jpeg`, or the
+    exception they hit as `segmentation_error`. `output_path` is optional.
+    """
+    if overlay_jpeg is None and segmentation_error is None:
+        try:
+            overlay_jpeg = to_jpeg(segment_image(image_path), quality=REPORT_IMAGE_QUALITY)
+        except Exception as e:
+            segmentation_error = e
+
+    with stage("report_build"):
+        pdf_bytes = render_report(tumor_type, confidence, overlay_jpeg, segmentation_error)
+    if output_path:
+        with open(output_path, "wb") as f:
+            f.write(pdf_bytes)
+    return pdf_bytes
+
+def _segment_overlays(image_paths):
+    """(overlay JPEG, error) per image; one batched call, per image on failure."""
+    try:
+        return [(to_jpeg(result, quality=REPORT_IMAGE_QUALITY), None)
+                for result in segment_images(image_paths)]
+    except SEGMENTATION_ERRORS as e:
+        logger.warning(f"Batched segmentation of {len(image_paths)} images failed, "
+                       f"retrying one by one: {type(e).__name__}: {str(e)}")
+    overlays = []
+    for path in image_paths:
+        try:
+            overlays.append((to_jpeg(segment_image(path), quality=REPORT_IMAGE_QUALITY), None))
+        except Exception as e:
+            overlays.append((None, str(e)))
+    return overlays
+
+def _render_batch(jobs):
+    """Render (tumor_type, confidence, image_jpeg, image_error) jobs (runs in pool workers)."""
+    return [render_report(*job) for job in jobs]
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool():
+    """Process pool for batch rendering; spawned workers so no server threads are forked."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=REPORT_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def render_reports(jobs, parallel=True, chunk_size=None):
+    """Render many reports; large batches are split across the process pool."""
+    chunk_size = chunk_size or REPORT_CHUNK_SIZE
+    if not parallel or len(jobs) <= chunk_size:
+        return _render_batch(jobs)
+    chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+    return [pdf for rendered in get_pool().map(_render_batch, chunks) for pdf in rendered]
+
+def generate_reports(items, parallel=True):
+    """Reports for [(image_path, tumor_type, confidence)]: segmentation is batched
+    in this process, PDF rendering goes to the pool."""
+    overlays = _segment_overlays([image_path for image_path, _, _ in items])
+    jobs = [(tumor_type, confidence, jpeg, error)
+            for (_, tumor_type, confidence), (jpeg, error) in zip(items, overlays)]
+    with stage("report_build", batch="1"):
+        return render_reports(jobs, parallel=parallel)
+
+def zip_reports(pdfs, prefix="report"):
+    buffer = io.BytesIO()
+    # PDF streams are already compressed
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        for i, pdf_bytes in enumerate(pdfs, 1):
+            archive.writestr(f"{prefix}_{i}.pdf", pdf_bytes)
+    return buffer.getvalue()
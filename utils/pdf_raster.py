@@ -0,0 +1,132 @@
+import io
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# 72 dpi RGB PNG matches the original `page.get_pixmap()` + PIL output
+RASTER_DPI = int(os.getenv("PDF_RASTER_DPI", "72"))
+RASTER_COLORSPACE = os.getenv("PDF_RASTER_COLORSPACE", "rgb").lower()
+RASTER_FORMAT = os.getenv("PDF_RASTER_FORMAT", "png").lower()
+RASTER_QUALITY = int(os.getenv("PDF_RASTER_QUALITY", "80"))
+RASTER_WORKERS = int(os.getenv("PDF_RASTER_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages per pool task; documents shorter than this are rendered in-process
+RASTER_CHUNK_PAGES = int(os.getenv("PDF_RASTER_CHUNK_PAGES", "4"))
+
+FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+# fitz colorspace attribute per option; fitz itself is imported on first use
+COLORSPACES = {"rgb": "csRGB", "gray": "csGRAY"}
+
+
+def raster_options(dpi=None, colorspace=None, fmt=None, quality=None):
+    options = {
+        "dpi": dpi or RASTER_DPI,
+        "colorspace": (colorspace or RASTER_COLORSPACE).lower(),
+        "format": (fmt or RASTER_FORMAT).lower(),
+        "quality": quality or RASTER_QUALITY,
+    }
+    if options["format"] not in FORMATS:
+        raise ValueError(f"Unsupported raster format '{options['format']}'")
+    if options["colorspace"] not in COLORSPACES:
+        raise ValueError(f"Unsupported colorspace '{options['colorspace']}'")
+    return options
+
+
+def _encode(pix, options):
+    fmt = options["format"]
+    if fmt == "png":
+        return pix.tobytes("png")
+    if fmt == "jpeg":
+        return pix.tobytes("jpeg", jpg_quality=options["quality"])
+    # MuPDF has no WebP writer, so only this format goes through PIL
+    from PIL import Image
+
+    mode = "L" if pix.n == 1 else "RGB"
+    buffer = io.BytesIO()
+    Image.frombytes(mode, (pix.width, pix.height), pix.samples).save(
+        buffer, format="WEBP", quality=options["quality"])
+    return buffer.getvalue()
+
+
+def _iter_pages(path, regions, options):
+    """Render (page_number, clip) regions; clip is an (x0, y0, x1, y1) rect or None for the whole page."""
+    import fitz
+
+    colorspace = getattr(fitz, COLORSPACES[options["colorspace"]])
+    with fitz.open(path) as document:
+        for page_number, clip in regions:
+            pix = document.load_page(page_number).get_pixmap(
+                dpi=options["dpi"], colorspace=colorspace, alpha=False,
+                clip=fitz.Rect(clip) if clip else None)
+            page = {
+                "page": page_number,
+                "mime": FORMATS[options["format"]],
+                "data": _encode(pix, options),
+                "width": pix.width,
+                "height": pix.height,
+            }
+            if clip:
+                page["clip"] = list(clip)
+            yield page
+
+
+def _render_pages(path, regions, options):
+    """Render `regions` of the PDF at `path` (runs in pool workers)."""
+    return list(_iter_pages(path, regions, options))
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Process pool shared by all uploads; spawned workers so no server threads are forked."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(max_workers=RASTER_WORKERS,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def rasterize_pdf(path, parallel=True, chunk_pages=None, **options):
+    """Yield page dicts (page, mime, data, width, height) in page order.
+
+    Pages are rendered in chunks on the process pool, and each chunk is
+    yielded as soon as it and every earlier chunk are done, so callers can
+    start on the first pages while later ones are still rendering.
+    """
+    import fitz
+
+    with fitz.open(path) as document:
+        page_count = document.page_count
+    yield from rasterize_regions(path, [(n, None) for n in range(page_count)],
+                                 parallel=parallel, chunk_pages=chunk_pages, **options)
+
+
+def rasterize_regions(path, regions, parallel=True, chunk_pages=None, **options):
+    """`rasterize_pdf` for an explicit list of (page_number, clip) regions."""
+    options = raster_options(**options)
+    chunk_pages = chunk_pages or RASTER_CHUNK_PAGES
+    regions = list(regions)
+
+    if not parallel or RASTER_WORKERS <= 1 or len(regions) <= chunk_pages:
+        yield from _iter_pages(path, regions, options)
+        return
+
+    pool = get_pool()
+    futures = [
+        pool.submit(_render_pages, path, regions[start:start + chunk_pages], options)
+        for start in range(0, len(regions), chunk_pages)
+    ]
+    try:
+        for future in futures:
+            yield from future.result()
+    finally:
+        # Consumer stopped early (or a chunk failed): drop what has not started yet
+        for future in futures:
+            future.cancel()
@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+CACHE_ENABLED = os.getenv("PREDICTION_CACHE", "1").lower() in ("1", "true", "yes")
+CACHE_MAX_ENTRIES = int(os.getenv("PREDICTION_CACHE_SIZE", "1024"))
+CACHE_TTL_SECONDS = float(os.getenv("PREDICTION_CACHE_TTL", "86400"))
+# Optional on-disk tier that survives restarts, e.g. "cache/predictions.sqlite3"
+CACHE_DB_PATH = os.getenv("PREDICTION_CACHE_DB") or None
+
+
+def image_cache_key(image, model_id):
+    """Content hash of decoded pixels plus the model that produced the prediction."""
+    digest = hashlib.sha256()
+    digest.update(f"{model_id}|{image.mode}|{image.size[0]}x{image.size[1]}|".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class PredictionCache:
+    """LRU + TTL cache of prediction results with an optional SQLite tier."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS,
+                 db_path=CACHE_DB_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl_seconds
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._counters = {"hits": 0, "disk_hits": 0, "misses": 0,
+                          "evictions": 0, "expirations": 0, "sets": 0}
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM predictions WHERE expires_at < ?", (time.time(),))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return value
+                del self._entries[key]
+                self._counters["expirations"] += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM predictions WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None and row[1] >= now:
+                    value = json.loads(row[0])
+                    self._store(key, value, row[1])
+                    self._counters["disk_hits"] += 1
+                    return value
+
+            self._counters["misses"] += 1
+            return None
+
+    def set(self, key, value):
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._store(key, value, expires_at)
+            self._counters["sets"] += 1
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO predictions (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires_at),
+                    )
+                except sqlite3.Error as e:
+                    logger.error(f"Prediction cache disk write failed: {str(e)}")
+
+    def _store(self, key, value, expires_at):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM predictions")
+
+    def stats(self):
+        with self._lock:
+            data = dict(self._counters)
+            data.update({
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "disk_path": self.db_path,
+            })
+            if self._db is not None:
+                data["disk_entries"] = self._db.execute(
+                    "SELECT COUNT(*) FROM predictions"
+                ).fetchone()[0]
+        lookups = data["hits"] + data["disk_hits"] + data["misses"]
+        data["hit_rate"] = ((data["hits"] + data["disk_hits"]) / lookups) if lookups else 0.0
+        return data
+
+
+prediction_cache = PredictionCache() if CACHE_ENABLED else None
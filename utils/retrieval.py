@@ -0,0 +1,192 @@
+import json
+import logging
+import os
+import threading
+
+import numpy as np
+
+from utils.instrumentation import stage
+from utils.warmup import mark_ready
+
+logger = logging.getLogger(__name__)
+
+# "pinecone" (remote, default) or "local" (in-process index exported from Pinecone)
+RETRIEVAL_BACKEND = os.getenv("RETRIEVAL_BACKEND", "pinecone").lower()
+PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "brain-tumor")
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("data", "kb_index"))
+# Optional approximate search for large corpora: "none", "ivf" or "hnsw" (needs hnswlib)
+LOCAL_ANN = os.getenv("LOCAL_INDEX_ANN", "none").lower()
+IVF_NPROBE = int(os.getenv("LOCAL_INDEX_IVF_NPROBE", "8"))
+HNSW_EF = int(os.getenv("LOCAL_INDEX_HNSW_EF", "64"))
+
+EMBEDDINGS_FILE = "embeddings.npy"
+METADATA_FILE = "metadata.jsonl"
+IVF_FILE = "ivf.npz"
+IVF_VECTORS_FILE = "ivf_vectors.npy"
+HNSW_FILE = "hnsw.bin"
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class PineconeBackend:
+    name = "pinecone"
+
+    def __init__(self, index_name=PINECONE_INDEX_NAME, api_key=None):
+        from pinecone import Pinecone
+
+        api_key = api_key or os.getenv("PINECONE_API_KEY")
+        if not api_key:
+            raise EnvironmentError("Missing PINECONE_API_KEY for the pinecone retrieval backend")
+        self.index = Pinecone(api_key=api_key).Index(index_name)
+
+    def query(self, vector, top_k=3):
+        with stage("upstream", upstream="pinecone"):
+            results = self.index.query(vector=list(map(float, vector)), top_k=top_k, include_metadata=True)
+        return [
+            {"id": match["id"], "score": float(match["score"]), "metadata": match.get("metadata") or {}}
+            for match in results.get("matches", [])
+        ]
+
+
+class LocalBackend:
+    """Memory-mapped float32 embedding matrix with exact cosine top-k in NumPy.
+
+    Rows are stored L2-normalised, so a single matrix-vector product gives the
+    cosine scores Pinecone's "cosine" metric returns. For large corpora an IVF
+    (k-means buckets, pure NumPy) or HNSW (hnswlib) index can be built next to
+    the matrix and is used when LOCAL_INDEX_ANN selects it.
+    """
+
+    name = "local"
+
+    def __init__(self, directory=LOCAL_INDEX_DIR, ann=LOCAL_ANN):
+        self.directory = directory
+        self.embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode="r")
+        self.ids = []
+        self.metadata = []
+        with open(os.path.join(directory, METADATA_FILE), "r", encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                self.ids.append(record["id"])
+                self.metadata.append(record.get("metadata") or {})
+        if len(self.ids) != self.embeddings.shape[0]:
+            raise ValueError(f"{directory}: {len(self.ids)} metadata rows for "
+                             f"{self.embeddings.shape[0]} embeddings")
+
+        self.ann = ann
+        self._ivf = None
+        self._hnsw = None
+        if ann == "ivf":
+            self._ivf = dict(np.load(os.path.join(directory, IVF_FILE)))
+            self._ivf_vectors = np.load(os.path.join(directory, IVF_VECTORS_FILE), mmap_mode="r")
+        elif ann == "hnsw":
+            import hnswlib
+
+            self._hnsw = hnswlib.Index(space="ip", dim=self.embeddings.shape[1])
+            self._hnsw.load_index(os.path.join(directory, HNSW_FILE))
+            self._hnsw.set_ef(HNSW_EF)
+        logger.info(f"Loaded local index {directory}: {len(self.ids)} vectors (ann: {ann})")
+
+    def _exact(self, query, top_k):
+        scores = self.embeddings @ query
+        k = min(top_k, scores.shape[0])
+        if k == 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return top, scores[top]
+
+    def _search_ivf(self, query, top_k):
+        probe = np.argsort(-(self._ivf["centroids"] @ query))[:IVF_NPROBE]
+        offsets, order = self._ivf["offsets"], self._ivf["order"]
+        # Vectors are stored grouped by list, so each probed list is one contiguous slice
+        rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+        scores = np.concatenate([self._ivf_vectors[offsets[c]:offsets[c + 1]] @ query for c in probe])
+        k = min(top_k, scores.shape[0])
+        if k == 0:
+            return [], []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return rows[top], scores[top]
+
+    def query(self, vector, top_k=3):
+        query = _normalize(np.asarray(vector, dtype=np.float32))
+        if self._hnsw is not None:
+            labels, distances = self._hnsw.knn_query(query, k=min(top_k, len(self.ids)))
+            positions, scores = labels[0], 1.0 - distances[0]
+        elif self._ivf is not None:
+            positions, scores = self._search_ivf(query, top_k)
+        else:
+            positions, scores = self._exact(query, top_k)
+        return [
+            {"id": self.ids[p], "score": float(s), "metadata": self.metadata[p]}
+            for p, s in zip(positions, scores)
+        ]
+
+    @staticmethod
+    def write(directory, ids, embeddings, metadatas):
+        """Persist a corpus in the layout `LocalBackend` memory-maps."""
+        os.makedirs(directory, exist_ok=True)
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        np.save(os.path.join(directory, EMBEDDINGS_FILE), embeddings)
+        with open(os.path.join(directory, METADATA_FILE), "w", encoding="utf-8") as f:
+            for record_id, metadata in zip(ids, metadatas):
+                f.write(json.dumps({"id": record_id, "metadata": metadata}) + "\n")
+
+    @staticmethod
+    def build_ivf(directory, nlist=None, iterations=10, seed=0):
+        """Spherical k-means lists over the stored matrix (ivf.npz + list-ordered vectors)."""
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE))
+        n = embeddings.shape[0]
+        nlist = nlist or max(1, int(np.sqrt(n)))
+        rng = np.random.default_rng(seed)
+        centroids = embeddings[rng.choice(n, size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(embeddings @ centroids.T, axis=1)
+            for c in range(nlist):
+                members = embeddings[assignment == c]
+                if len(members):
+                    centroids[c] = members.mean(axis=0)
+            centroids = _normalize(centroids)
+        assignment = np.argmax(embeddings @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=nlist))])
+        np.savez(os.path.join(directory, IVF_FILE), centroids=centroids, order=order, offsets=offsets)
+        np.save(os.path.join(directory, IVF_VECTORS_FILE), embeddings[order])
+
+    @staticmethod
+    def build_hnsw(directory, m=16, ef_construction=200):
+        import hnswlib
+
+        embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE))
+        index = hnswlib.Index(space="ip", dim=embeddings.shape[1])
+        index.init_index(max_elements=embeddings.shape[0], M=m, ef_construction=ef_construction)
+        index.add_items(embeddings, np.arange(embeddings.shape[0]))
+        index.save_index(os.path.join(directory, HNSW_FILE))
+
+
+_retriever = None
+_retriever_lock = threading.Lock()
+
+
+def create_backend(name):
+    if name == "local":
+        return LocalBackend()
+    if name == "pinecone":
+        return PineconeBackend()
+    raise ValueError(f"Unknown retrieval backend '{name}'")
+
+
+def get_retriever():
+    """The configured retrieval backend, created on first use."""
+    global _retriever
+    if _retriever is None:
+        with _retriever_lock:
+            if _retriever is None:
+                _retriever = create_backend(RETRIEVAL_BACKEND)
+                mark_ready("retriever")
+    return _retriever
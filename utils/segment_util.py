@@ -1,23 +1,223 @@
-import requests
+import asyncio
+import io
 import os
+import threading
+
+import numpy as np
 from dotenv import load_dotenv
+from PIL import Image
 
-load_dotenv()
+from utils.http_clients import UpstreamError, get_upstream
+from utils.instrumentation import stage
+from utils.model_registry import MODEL_DIR, get_session, register_model
+from utils.preprocessing import load_image
+from utils.warmup import mark_ready
 
+load_dotenv()
 
+# "remote" (Hugging Face inference API, default) or "local" (ONNX Runtime in-process)
+SEGMENTATION_BACKEND = os.getenv("SEGMENTATION_BACKEND", "remote").lower()
+SEGMENTATION_MODEL_PATH = os.getenv("SEGMENTATION_MODEL_PATH",
+                                    os.path.join(MODEL_DIR, "brain_tumor_segmentation.onnx"))
+SEGMENTATION_MODEL_URL = os.getenv("SEGMENTATION_MODEL_URL") or None
+# Used when the model's spatial input dims are dynamic
+SEGMENTATION_INPUT_SIZE = int(os.getenv("SEGMENTATION_INPUT_SIZE", "256"))
+SEGMENTATION_THRESHOLD = float(os.getenv("SEGMENTATION_THRESHOLD", "0.5"))
+OVERLAY_COLOR = (255, 0, 0)
+OVERLAY_ALPHA = 0.45
 
-HUGGINGFACE_API_URL = "https://api-inference.huggingface.co/models/khoongwei/brain-tumor-segmentation"
-API_TOKEN = os.getenv("HUGGING_FACE_API_KEY") 
+HUGGINGFACE_MODEL_PATH = "/models/khoongwei/brain-tumor-segmentation"
+API_TOKEN = os.getenv("HUGGING_FACE_API_KEY")
 HEADERS = {"Authorization": f"Bearer {API_TOKEN}"}
 
-def segment_tumor_image(image_path):
-    with open(image_path, "rb") as f:
-        response = requests.post(HUGGINGFACE_API_URL, headers=HEADERS, files={"file": f})
-
-    if response.status_code == 200:
-        output_path = "segmented_output.jpg"
-        with open(output_path, "wb") as out:
-            out.write(response.content)
-        return output_path
-    else:
-        raise Exception(f"Segmentation failed: {response.status_code} - {response.text}")
+register_model("segmenter", SEGMENTATION_MODEL_PATH, url=SEGMENTATION_MODEL_URL)
+
+
+class SegmentationError(Exception):
+    pass
+
+
+# What a segmentation call raises when an image, the model or the upstream is bad,
+# as opposed to a bug: unreadable images (OSError/ValueError), model and Hugging Face errors
+SEGMENTATION_ERRORS = (SegmentationError, UpstreamError, OSError, ValueError)
+
+
+def render_overlay(image, mask, color=OVERLAY_COLOR, alpha=OVERLAY_ALPHA):
+    """Blend `mask` (H, W bool) over an RGB uint8 array and outline it, in NumPy."""
+    out = image.copy()
+    if not mask.any():
+        return out
+    tint = np.asarray(color, dtype=np.float32)
+    out[mask] = (image[mask] * (1.0 - alpha) + tint * alpha).astype(np.uint8)
+    # Boundary = mask pixels with at least one 4-neighbour outside the mask
+    padded = np.pad(mask, 1, constant_values=False)
+    interior = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+    out[mask & ~interior] = color
+    return out
+
+
+def _result(overlay, mask, backend):
+    return {"backend": backend, "mask": mask, "overlay": overlay}
+
+
+def to_jpeg(result, quality=90):
+    buffer = io.BytesIO()
+    result["overlay"].save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
+
+
+class LocalSegmenter:
+    """ONNX segmentation model through the shared model registry.
+
+    Handles NCHW or NHWC inputs and single-channel probability/logit or
+    multi-class outputs; masks come back at the source image size.
+    """
+
+    name = "local"
+
+    def __init__(self, model_name="segmenter", threshold=SEGMENTATION_THRESHOLD):
+        self.session = get_session(model_name)
+        self.threshold = threshold
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        shape = model_input.shape
+        self.channels_first = shape[1] in (1, 3)
+        channels, height, width = (shape[1], shape[2], shape[3]) if self.channels_first else \
+            (shape[3], shape[1], shape[2])
+        self.channels = channels if isinstance(channels, int) else 3
+        self.size = (width if isinstance(width, int) else SEGMENTATION_INPUT_SIZE,
+                     height if isinstance(height, int) else SEGMENTATION_INPUT_SIZE)
+        self.fixed_batch = shape[0] if isinstance(shape[0], int) else None
+
+    def _preprocess(self, images):
+        batch = np.empty((len(images), self.size[1], self.size[0], self.channels), dtype=np.float32)
+        for i, image in enumerate(images):
+            resized = image.resize(self.size, Image.BILINEAR)
+            if self.channels == 1:
+                resized = resized.convert("L")
+            np.copyto(batch[i], np.asarray(resized).reshape(batch.shape[1:]), casting="unsafe")
+        batch *= 1.0 / 255.0
+        return batch.transpose(0, 3, 1, 2).copy() if self.channels_first else batch
+
+    def _masks(self, output):
+        output = np.asarray(output, dtype=np.float32)
+        if output.ndim == 4:
+            channel_axis = 1 if self.channels_first else 3
+            if output.shape[channel_axis] > 1:
+                # Multi-class: anything that is not background (class 0)
+                return np.argmax(output, axis=channel_axis) > 0
+            output = np.squeeze(output, axis=channel_axis)
+        if output.min() < 0.0 or output.max() > 1.0:
+            output = 1.0 / (1.0 + np.exp(-output))
+        return output >= self.threshold
+
+    def _run(self, batch):
+        with stage("onnx_run", model="segmenter"):
+            return self._run_session(batch)
+
+    def _run_session(self, batch):
+        if self.fixed_batch in (None, batch.shape[0]):
+            return self._masks(self._session_run(batch))
+        return np.concatenate([self._masks(self._session_run(batch[i:i + 1])) for i in range(batch.shape[0])])
+
+    def _session_run(self, batch):
+        try:
+            return self.session.run(None, {self.input_name: batch})[0]
+        except Exception as e:
+            # ONNX Runtime's exception types only exist once it is imported
+            raise SegmentationError(f"Segmentation model failed: {str(e)}") from e
+
+    def segment_batch(self, sources):
+        images = [load_image(source) for source in sources]
+        masks = self._run(self._preprocess(images))
+        results = []
+        for image, mask in zip(images, masks):
+            if mask.shape[::-1] != image.size:
+                mask = np.asarray(Image.fromarray(mask.astype(np.uint8) * 255).resize(
+                    image.size, Image.NEAREST)) > 0
+            overlay = Image.fromarray(render_overlay(np.asarray(image), mask))
+            results.append(_result(overlay, mask, self.name))
+        return results
+
+    def segment(self, source):
+        return self.segment_batch([source])[0]
+
+    async def asegment(self, source):
+        return await asyncio.get_running_loop().run_in_executor(None, self.segment, source)
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source), "image.jpg"
+    if isinstance(source, Image.Image):
+        buffer = io.BytesIO()
+        source.convert("RGB").save(buffer, format="JPEG", quality=95)
+        return buffer.getvalue(), "image.jpg"
+    with open(source, "rb") as f:
+        return f.read(), os.path.basename(source)
+
+
+def _remote_result(response):
+    if response.status_code != 200:
+        raise SegmentationError(f"Segmentation failed: {response.status_code} - {response.text}")
+    return _result(Image.open(io.BytesIO(response.content)).convert("RGB"), None, "remote")
+
+
+class RemoteSegmenter:
+    """Hugging Face inference API; returns the rendered image, no mask."""
+
+    name = "remote"
+
+    def segment(self, source):
+        data, filename = _read_bytes(source)
+        response = get_upstream("huggingface").request(
+            "POST", HUGGINGFACE_MODEL_PATH, raise_for_status=False, headers=HEADERS,
+            files={"file": (filename, data)}
+        )
+        return _remote_result(response)
+
+    def segment_batch(self, sources):
+        return [self.segment(source) for source in sources]
+
+    async def asegment(self, source):
+        data, filename = _read_bytes(source)
+        response = await get_upstream("huggingface").arequest(
+            "POST", HUGGINGFACE_MODEL_PATH, raise_for_status=False, headers=HEADERS,
+            files={"file": (filename, data)}
+        )
+        return _remote_result(response)
+
+
+_segmenter = None
+_segmenter_lock = threading.Lock()
+
+
+def create_segmenter(name):
+    if name == "local":
+        return LocalSegmenter()
+    if name == "remote":
+        return RemoteSegmenter()
+    raise ValueError(f"Unknown segmentation backend '{name}'")
+
+
+def get_segmenter():
+    global _segmenter
+    if _segmenter is None:
+        with _segmenter_lock:
+            if _segmenter is None:
+                _segmenter = create_segmenter(SEGMENTATION_BACKEND)
+                mark_ready("segmenter")
+    return _segmenter
+
+
+def segment_image(source):
+    """Segment one image (path, bytes or PIL image): {"backend", "mask", "overlay"}."""
+    segmenter = get_segmenter()
+    with stage("segmentation", backend=segmenter.name):
+        return segmenter.segment(source)
+
+
+def segment_images(sources):
+    segmenter = get_segmenter()
+    with stage("segmentation", backend=segmenter.name):
+        return segmenter.segment_batch(sources)
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# "memory" (per process, default) or "sqlite" (shared by every worker on the host)
+SESSION_BACKEND = os.getenv("PDF_SESSION_BACKEND", "memory").lower()
+SESSION_MAX_BYTES = int(os.getenv("PDF_SESSION_MAX_BYTES", str(512 * 1024 * 1024)))
+SESSION_IDLE_TTL = float(os.getenv("PDF_SESSION_TTL", "3600"))
+SESSION_DB_PATH = os.getenv("PDF_SESSION_DB", os.path.join("cache", "pdf_sessions.sqlite3"))
+
+# Fixed per-session/per-page/per-chunk bookkeeping added to the payload sizes
+SESSION_OVERHEAD_BYTES = 1024
+PAGE_OVERHEAD_BYTES = 256
+CHUNK_OVERHEAD_BYTES = 128
+BM25_TERM_OVERHEAD_BYTES = 64
+
+
+def _bm25_size(index):
+    # One dict entry per distinct term of each chunk, plus the shared idf table
+    terms = [term for tf in index["term_freqs"] for term in tf] + list(index["idf"])
+    return sum(len(term) + BM25_TERM_OVERHEAD_BYTES for term in terms)
+
+
+def context_size(context):
+    """Approximate resident size of a PDF context: page payloads, chunk text, the BM25 index and bookkeeping."""
+    return (
+        SESSION_OVERHEAD_BYTES
+        + sum(len(page["data"]) + PAGE_OVERHEAD_BYTES for page in context["pages"])
+        # str objects hold up to 4 bytes per character; UTF-8 length is a close lower bound
+        + sum(len(chunk["text"].encode("utf-8")) + CHUNK_OVERHEAD_BYTES for chunk in context.get("chunks") or [])
+        + (_bm25_size(context["bm25"]) if context.get("bm25") else 0)
+    )
+
+
+class MemorySessionStore:
+    """Per-process LRU of PDF contexts bounded by total bytes, with an idle TTL."""
+
+    name = "memory"
+
+    def __init__(self, max_bytes=SESSION_MAX_BYTES, idle_ttl=SESSION_IDLE_TTL):
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._sessions = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+
+    def _drop(self, session_id):
+        _, size, _ = self._sessions.pop(session_id)
+        self._bytes -= size
+
+    def _purge_expired(self, now):
+        # Oldest access first, so stop at the first live session
+        while self._sessions:
+            session_id, (_, _, last_access) = next(iter(self._sessions.items()))
+            if now - last_access <= self.idle_ttl:
+                break
+            self._drop(session_id)
+            self._counters["expirations"] += 1
+
+    def put(self, session_id, context):
+        size = context_size(context)
+        with self._lock:
+            if size > self.max_bytes:
+                self._counters["rejected"] += 1
+                raise ValueError(f"PDF context of {size} bytes exceeds the session store limit")
+            now = time.time()
+            self._purge_expired(now)
+            if session_id in self._sessions:
+                self._drop(session_id)
+            while self._sessions and self._bytes + size > self.max_bytes:
+                self._drop(next(iter(self._sessions)))
+                self._counters["evictions"] += 1
+            self._sessions[session_id] = (context, size, now)
+            self._bytes += size
+
+    def get(self, session_id):
+        with self._lock:
+            now = time.time()
+            self._purge_expired(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            context, size, _ = entry
+            self._sessions[session_id] = (context, size, now)
+            self._sessions.move_to_end(session_id)
+            self._counters["hits"] += 1
+            return context
+
+    def delete(self, session_id):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+                return True
+            return False
+
+    def stats(self):
+        with self._lock:
+            self._purge_expired(time.time())
+            return {
+                "backend": self.name,
+                "sessions": len(self._sessions),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                **self._counters,
+            }
+
+
+class SqliteSessionStore:
+    """PDF contexts in a SQLite (WAL) file shared by all workers on the host.
+
+    Page images are stored as raw BLOBs, everything else as JSON. The byte
+    budget and idle TTL apply across all processes using the file.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=SESSION_DB_PATH, max_bytes=SESSION_MAX_BYTES, idle_ttl=SESSION_IDLE_TTL):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "rejected": 0}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA foreign_keys=ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, meta TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS pages ("
+            "session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE, "
+            "idx INTEGER NOT NULL, info TEXT NOT NULL, data BLOB NOT NULL, "
+            "PRIMARY KEY (session_id, idx))"
+        )
+
+    def _purge_expired(self, now):
+        cursor = self._db.execute("DELETE FROM sessions WHERE last_access < ?", (now - self.idle_ttl,))
+        self._counters["expirations"] += max(cursor.rowcount, 0)
+
+    def put(self, session_id, context):
+        size = context_size(context)
+        if size > self.max_bytes:
+            self._counters["rejected"] += 1
+            raise ValueError(f"PDF context of {size} bytes exceeds the session store limit")
+        meta = {key: value for key, value in context.items() if key != "pages"}
+        pages = [
+            (session_id, idx, json.dumps({k: v for k, v in page.items() if k != "data"}), page["data"])
+            for idx, page in enumerate(context["pages"])
+        ]
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._purge_expired(now)
+                self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+                used = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM sessions").fetchone()[0]
+                if used + size > self.max_bytes:
+                    # Least recently used sessions until the new one fits
+                    evict, freed = [], 0
+                    for old_id, old_size in self._db.execute(
+                        "SELECT id, size FROM sessions ORDER BY last_access"
+                    ).fetchall():
+                        if used - freed + size <= self.max_bytes:
+                            break
+                        evict.append((old_id,))
+                        freed += old_size
+                    self._db.executemany("DELETE FROM sessions WHERE id = ?", evict)
+                    self._counters["evictions"] += len(evict)
+                self._db.execute(
+                    "INSERT INTO sessions (id, meta, size, last_access) VALUES (?, ?, ?, ?)",
+                    (session_id, json.dumps(meta), size, now),
+                )
+                self._db.executemany(
+                    "INSERT INTO pages (session_id, idx, info, data) VALUES (?, ?, ?, ?)", pages
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get(self, session_id):
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE sessions SET last_access = ? WHERE id = ? AND last_access >= ?",
+                (now, session_id, now - self.idle_ttl),
+            )
+            if cursor.rowcount != 1:
+                self._counters["misses"] += 1
+                return None
+            meta = self._db.execute("SELECT meta FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            rows = self._db.execute(
+                "SELECT info, data FROM pages WHERE session_id = ? ORDER BY idx", (session_id,)
+            ).fetchall()
+            self._counters["hits"] += 1
+        if meta is None:
+            return None
+        context = json.loads(meta[0])
+        context["pages"] = [dict(json.loads(info), data=bytes(data)) for info, data in rows]
+        return context
+
+    def delete(self, session_id):
+        with self._lock:
+            return self._db.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount == 1
+
+    def stats(self):
+        with self._lock:
+            self._purge_expired(time.time())
+            sessions, used = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM sessions"
+            ).fetchone()
+            return {
+                "backend": self.name,
+                "path": self.path,
+                "sessions": sessions,
+                "bytes": used,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                **self._counters,
+            }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def create_session_store(name):
+    if name == "memory":
+        return MemorySessionStore()
+    if name == "sqlite":
+        return SqliteSessionStore()
+    raise ValueError(f"Unknown PDF session backend '{name}'")
+
+
+def get_session_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_session_store(SESSION_BACKEND)
+    return _store
@@ -0,0 +1,177 @@
+import json
+import logging
+import time
+
+from utils import metrics
+
+logger = logging.getLogger(__name__)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+def wants_stream(stream_arg, accept_header):
+    """True for ?stream=1 or an `Accept: text/event-stream` request."""
+    if (stream_arg or "").lower() in ("1", "true", "yes"):
+        return True
+    return "text/event-stream" in (accept_header or "")
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_stream(events):
+    """Format (event, data) pairs as SSE; a failure mid-stream becomes an error event."""
+    try:
+        for event, data in events:
+            yield sse_event(event, data)
+    except Exception as e:
+        logger.error(f"Stream failed: {str(e)}", exc_info=True)
+        yield sse_event("error", {"success": False, "message": str(e)})
+
+
+async def asse_stream(events):
+    try:
+        async for event, data in events:
+            yield sse_event(event, data)
+    except Exception as e:
+        logger.error(f"Stream failed: {str(e)}", exc_info=True)
+        yield sse_event("error", {"success": False, "message": str(e)})
+
+
+def _sse_payload(line):
+    """The decoded JSON of one `data:` line of an OpenAI-style stream, None otherwise."""
+    if not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if not data or data == "[DONE]":
+        return None
+    return json.loads(data)
+
+
+def _delta_text(chunk):
+    choices = chunk.get("choices") or []
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+def iter_completion_tokens(response):
+    """Content deltas of a streamed (stream=true) chat-completions response."""
+    for line in response.iter_lines():
+        chunk = _sse_payload(line)
+        if chunk is not None:
+            text = _delta_text(chunk)
+            if text:
+                yield text
+
+
+async def aiter_completion_tokens(response):
+    async for line in response.aiter_lines():
+        chunk = _sse_payload(line)
+        if chunk is not None:
+            text = _delta_text(chunk)
+            if text:
+                yield text
+
+
+class FirstTokenTimer:
+    """Observes upstream_time_to_first_token_seconds once, on the first token."""
+
+    def __init__(self, upstream, endpoint):
+        self.start = time.perf_counter()
+        self.histogram = metrics.histogram("upstream_time_to_first_token_seconds",
+                                           upstream=upstream, endpoint=endpoint)
+        self.seen = False
+
+    def token(self):
+        if not self.seen:
+            self.seen = True
+            self.histogram.observe(time.perf_counter() - self.start)
+
+
+class AnswerAssembler:
+    """Incremental parser for the {"message", "description", "lists"} answer JSON.
+
+    `feed` returns what a chunk made available: ("delta", field, text) for the
+    string fields as they grow and ("item", "lists", text) for each completed
+    list entry. `finish` parses the whole document and validates its shape.
+    """
+
+    STRING_FIELDS = ("message", "description")
+
+    def __init__(self):
+        self.parts = []
+        self._depth = 0
+        self._after = None
+        self._in_string = False
+        self._is_key = False
+        self._escape = None
+        self._chars = []
+        self._key = None
+
+    def _streaming_field(self):
+        if self._depth == 1 and not self._is_key and self._key in self.STRING_FIELDS:
+            return self._key
+        return None
+
+    def feed(self, chunk):
+        self.parts.append(chunk)
+        events = []
+        field = self._streaming_field() if self._in_string else None
+        delta = []
+
+        def flush():
+            if field and delta:
+                events.append(("delta", field, "".join(delta)))
+            delta.clear()
+
+        for ch in chunk:
+            if self._in_string:
+                if self._escape is not None:
+                    self._escape += ch
+                    if len(self._escape) == 2 and ch != "u" or len(self._escape) == 6:
+                        decoded = json.loads(f'"{self._escape}"')
+                        self._escape = None
+                        self._chars.append(decoded)
+                        delta.append(decoded)
+                elif ch == "\\":
+                    self._escape = ch
+                elif ch == '"':
+                    flush()
+                    self._in_string = False
+                    text = "".join(self._chars)
+                    if self._is_key:
+                        self._key = text
+                    elif self._depth == 2 and self._key == "lists":
+                        events.append(("item", "lists", text))
+                    field = None
+                else:
+                    self._chars.append(ch)
+                    delta.append(ch)
+            elif ch == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._after in ("{", ",")
+                self._chars = []
+                field = self._streaming_field()
+            elif ch in "{[":
+                self._depth += 1
+                self._after = ch
+            elif ch in "}]":
+                self._depth -= 1
+            elif ch in ",:":
+                self._after = ch
+        flush()
+        return events
+
+    def finish(self):
+        answer = json.loads("".join(self.parts))
+        if not isinstance(answer, dict):
+            raise ValueError("Answer is not a JSON object")
+        for key in self.STRING_FIELDS:
+            if not isinstance(answer.get(key), str):
+                raise ValueError(f"Answer field '{key}' is missing or not a string")
+        lists = answer.get("lists")
+        if lists is not None and not (isinstance(lists, list) and all(isinstance(i, str) for i in lists)):
+            raise ValueError("Answer field 'lists' must be a list of strings")
+        return answer
@@ -0,0 +1,199 @@
+import io
+import logging
+import math
+import os
+import threading
+
+from utils.model_registry import MODEL_DIR, ensure_model_file
+from utils.warmup import mark_ready
+
+logger = logging.getLogger(__name__)
+
+# tokenizer.json path or Hugging Face hub id of the chat model's tokenizer. Requests never
+# download it: provision the file, or warm the "pdf_tokenizer" subsystem (WARMUP_SUBSYSTEMS),
+# which fetches it from PDF_TOKENIZER_URL. Until it loads, tokens are estimated as words * 1.333
+TOKENIZER_NAME = os.getenv("PDF_TOKENIZER", os.path.join(MODEL_DIR, "llama4_scout_tokenizer.json"))
+TOKENIZER_URL = os.getenv(
+    "PDF_TOKENIZER_URL",
+    "https://huggingface.co/unsloth/Llama-4-Scout-17B-16E-Instruct/resolve/main/tokenizer.json",
+)
+# Llama 4 vision tiling: 336px tiles, 14px patches with a 2x2 pixel shuffle -> 144 tokens
+# per tile, at most 16 tiles, plus one global thumbnail tile when an image spans several
+IMAGE_TILE_SIZE = 336
+IMAGE_TOKENS_PER_TILE = 144
+IMAGE_MAX_TILES = 16
+IMAGE_TOKEN_OVERHEAD = 8
+# Groq accepts at most 5 images per Llama 4 request
+MAX_IMAGES = int(os.getenv("PDF_MAX_IMAGES", "5"))
+# Longest side of the downscaled fallback of a page (a 2x2 tile canvas)
+DOWNSCALE_MAX_SIDE = int(os.getenv("PDF_DOWNSCALE_MAX_SIDE", "672"))
+# Kept free for the system prompt and the answer
+PROMPT_RESERVE_TOKENS = 512
+RESPONSE_RESERVE_TOKENS = int(os.getenv("PDF_RESPONSE_TOKENS", "2048"))
+
+_tokenizer = None
+_tokenizer_loaded = False
+_tokenizer_lock = threading.Lock()
+
+
+def _load_tokenizer(download):
+    from tokenizers import Tokenizer
+
+    if TOKENIZER_NAME.endswith(".json") and download:
+        ensure_model_file(TOKENIZER_NAME, TOKENIZER_URL)
+    if os.path.exists(TOKENIZER_NAME):
+        return Tokenizer.from_file(TOKENIZER_NAME)
+    if TOKENIZER_NAME.endswith(".json"):
+        raise FileNotFoundError(f"'{TOKENIZER_NAME}' is not provisioned")
+    if not download:
+        raise FileNotFoundError(f"hub tokenizer '{TOKENIZER_NAME}' is only fetched by the warmup")
+    return Tokenizer.from_pretrained(TOKENIZER_NAME)
+
+
+def get_tokenizer(download=False):
+    """The chat model's `tokenizers.Tokenizer`, or None to use the word estimate.
+
+    Tried once per process; a missing or unreadable tokenizer logs one warning.
+    Only `download=True` (the warmup) fetches it, and retries after a failure.
+    """
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded or (download and _tokenizer is None):
+        with _tokenizer_lock:
+            if not _tokenizer_loaded or (download and _tokenizer is None):
+                try:
+                    _tokenizer = _load_tokenizer(download)
+                    mark_ready("pdf_tokenizer")
+                except Exception as e:
+                    logger.warning(f"Tokenizer '{TOKENIZER_NAME}' unavailable, estimating tokens from words: "
+                                   f"{type(e).__name__}: {str(e)}")
+                _tokenizer_loaded = True
+    return _tokenizer
+
+
+def warm_tokenizer():
+    """Fetch and load the tokenizer (the "pdf_tokenizer" warmup subsystem); raises while unavailable."""
+    if get_tokenizer(download=True) is None:
+        raise RuntimeError(f"Tokenizer '{TOKENIZER_NAME}' unavailable")
+
+
+def count_text_tokens(texts):
+    """Token counts for a list of strings."""
+    tokenizer = get_tokenizer()
+    if tokenizer is None:
+        return [int(len(text.split()) * 1.333) for text in texts]
+    return [len(encoding.ids) for encoding in tokenizer.encode_batch(list(texts), add_special_tokens=False)]
+
+
+def image_tiles(width, height, max_tiles=IMAGE_MAX_TILES):
+    """Tiles the vision encoder spends on a `width` x `height` image."""
+    scale = 1.0
+    while True:
+        tiles = (math.ceil(width * scale / IMAGE_TILE_SIZE) *
+                 math.ceil(height * scale / IMAGE_TILE_SIZE))
+        if tiles <= max_tiles:
+            break
+        # The processor shrinks images that would need more tiles than allowed
+        scale *= 0.9
+    return tiles + 1 if tiles > 1 else tiles
+
+
+def image_tokens(width, height):
+    return image_tiles(width, height) * IMAGE_TOKENS_PER_TILE + IMAGE_TOKEN_OVERHEAD
+
+
+def reduced_size(width, height, max_side=DOWNSCALE_MAX_SIDE):
+    scale = min(1.0, max_side / max(width, height))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def annotate_costs(context):
+    """Store token costs on every chunk and page (done once, at upload)."""
+    chunks = context.get("chunks") or []
+    for chunk, tokens in zip(chunks, count_text_tokens([c["text"] for c in chunks])):
+        chunk["tokens"] = tokens
+    for page in context["pages"]:
+        page["tokens"] = image_tokens(page["width"], page["height"])
+        width, height = reduced_size(page["width"], page["height"])
+        page["reduced_tokens"] = image_tokens(width, height)
+    return context
+
+
+def _chunk_tokens(chunk):
+    if "tokens" not in chunk:
+        chunk["tokens"] = count_text_tokens([chunk["text"]])[0]
+    return chunk["tokens"]
+
+
+def _page_tokens(page):
+    return page.get("tokens") or image_tokens(page["width"], page["height"])
+
+
+def context_tokens(context, user_query):
+    """Tokens of the user part of a request built from `context`."""
+    return (count_text_tokens([user_query])[0]
+            + sum(_chunk_tokens(c) for c in context.get("chunks", []))
+            + sum(_page_tokens(p) for p in context["pages"]))
+
+
+def downscale_page(page):
+    """A copy of `page` re-encoded at `reduced_size` (only for pages picked in reduced form)."""
+    from PIL import Image
+
+    from utils.pdf_raster import RASTER_QUALITY
+
+    width, height = reduced_size(page["width"], page["height"])
+    fmt = {"image/png": "PNG", "image/jpeg": "JPEG", "image/webp": "WEBP"}[page["mime"]]
+    image = Image.open(io.BytesIO(page["data"]))
+    image = image.resize((width, height), Image.BILINEAR)
+    buffer = io.BytesIO()
+    image.save(buffer, format=fmt, **({"quality": RASTER_QUALITY} if fmt != "PNG" else {}))
+    return dict(page, data=buffer.getvalue(), width=width, height=height,
+                tokens=page.get("reduced_tokens") or image_tokens(width, height), downscaled=True)
+
+
+def fit_to_budget(selection, user_query, max_tokens, max_images=MAX_IMAGES):
+    """Greedily keep the highest-priority chunks, then pages, within `max_tokens`.
+
+    `selection` lists chunks and pages in priority order. A page that does not
+    fit at full resolution is taken downscaled if that fits; anything else is
+    dropped, so an oversized PDF yields a smaller request instead of an error.
+    The numbers of the pages whose images were dropped are returned as
+    `omitted_pages`, so callers can tell the user what the answer did not see.
+    """
+    budget = max_tokens - PROMPT_RESERVE_TOKENS - RESPONSE_RESERVE_TOKENS
+    budget -= count_text_tokens([user_query])[0]
+
+    chunks = []
+    for chunk in selection["chunks"]:
+        cost = _chunk_tokens(chunk)
+        if cost <= budget:
+            chunks.append(chunk)
+            budget -= cost
+
+    pages, downscaled, dropped, over_cap = [], 0, [], []
+    for page in selection["pages"]:
+        if len(pages) >= max_images:
+            over_cap.append(page["page"])
+            continue
+        cost = _page_tokens(page)
+        if cost <= budget:
+            pages.append(page)
+            budget -= cost
+            continue
+        reduced = page.get("reduced_tokens") or image_tokens(*reduced_size(page["width"], page["height"]))
+        if reduced <= budget:
+            pages.append(downscale_page(page))
+            budget -= reduced
+            downscaled += 1
+        else:
+            dropped.append(page["page"])
+
+    if over_cap:
+        logger.warning(f"Image limit: only {max_images} page images per request (PDF_MAX_IMAGES), "
+                       f"pages {', '.join(str(p + 1) for p in over_cap)} left out")
+    dropped_chunks = len(selection["chunks"]) - len(chunks)
+    if downscaled or dropped or dropped_chunks:
+        logger.info(f"Token budget: {downscaled} images downscaled, {len(dropped)} images and "
+                    f"{dropped_chunks} chunks dropped")
+    return {"chunks": sorted(chunks, key=lambda c: c["page"]), "pages": pages,
+            "omitted_pages": sorted(over_cap + dropped)}
@@ -0,0 +1,52 @@
+import io
+import tempfile
+
+from flask import Request
+from werkzeug.exceptions import RequestEntityTooLarge
+
+READ_CHUNK_SIZE = 64 * 1024
+
+
+class InMemoryRequest(Request):
+    """Request that lets a view buffer its multipart file parts in memory.
+
+    Werkzeug normally moves parts larger than 500KB into a temporary file,
+    and that stays the default for every route. A view that decodes uploads
+    straight from memory (/predict) sets `buffer_in_memory` and its own
+    `max_content_length` before touching `request.files`; werkzeug enforces
+    the limit while streaming the body, so the buffer is bounded and
+    oversized payloads are rejected before they are fully read.
+
+    Views that accept large uploads (volumes) set `spool_threshold` instead;
+    parts past that many bytes then go to a temporary file.
+    """
+
+    buffer_in_memory = False
+    spool_threshold = None
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None,
+                         content_length=None):
+        if self.spool_threshold is not None:
+            return tempfile.SpooledTemporaryFile(max_size=self.spool_threshold)
+        if self.buffer_in_memory:
+            return io.BytesIO()
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+
+def read_upload(file_storage, max_bytes):
+    """Return the bytes of an uploaded file, raising RequestEntityTooLarge past `max_bytes`."""
+    stream = file_storage.stream
+    if isinstance(stream, io.BytesIO):
+        if stream.getbuffer().nbytes > max_bytes:
+            raise RequestEntityTooLarge()
+        return stream.getvalue()
+
+    buffer = io.BytesIO()
+    while True:
+        chunk = stream.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        buffer.write(chunk)
+        if buffer.tell() > max_bytes:
+            raise RequestEntityTooLarge()
+    return buffer.getvalue()
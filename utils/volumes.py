@@ -0,0 +1,329 @@
+import gzip
+import logging
+import math
+import os
+import tarfile
+import zipfile
+from collections import Counter
+from collections.abc import Sequence
+
+import numpy as np
+
+from utils.explanations import CLASS_LABELS
+from utils.inference_engine import get_engine
+from utils.instrumentation import stage
+from utils.preprocessing import buffer_pool, preprocess_async, preprocess_gray_into
+
+logger = logging.getLogger(__name__)
+
+# Slices per classifier call
+VOLUME_BATCH_SIZE = int(os.getenv("VOLUME_BATCH_SIZE", "32"))
+# Without an explicit stride, axial slices are strided down to at most this many
+VOLUME_MAX_SLICES = int(os.getenv("VOLUME_MAX_SLICES", "64"))
+# Slices with less than this fraction of non-background pixels after windowing are skipped (0 keeps all)
+VOLUME_MIN_FOREGROUND = float(os.getenv("VOLUME_MIN_FOREGROUND", "0.02"))
+# Percentiles used for the intensity window when the request and the file give none
+VOLUME_WINDOW_PERCENTILES = [float(p) for p in os.getenv("VOLUME_WINDOW_PERCENTILES", "0.5,99.5").split(",")]
+# Study label: "topk" scores each tumor class by the mean of its top-k slice probabilities; "mean" averages all slices
+AGGREGATE_METHODS = ("topk", "mean")
+VOLUME_AGGREGATE = os.getenv("VOLUME_AGGREGATE", "topk").lower()
+if VOLUME_AGGREGATE not in AGGREGATE_METHODS:
+    logger.error(f"Unknown VOLUME_AGGREGATE '{VOLUME_AGGREGATE}' (expected {', '.join(AGGREGATE_METHODS)}); using topk")
+    VOLUME_AGGREGATE = "topk"
+VOLUME_TOP_K = int(os.getenv("VOLUME_TOP_K", "3"))
+VOLUME_TUMOR_THRESHOLD = float(os.getenv("VOLUME_TUMOR_THRESHOLD", "0.5"))
+
+# A .nii.gz upload is inflated to disk; stop past this many bytes (a 256^3 float32 volume is 64MB)
+VOLUME_MAX_INFLATED_BYTES = int(os.getenv("VOLUME_MAX_INFLATED_BYTES", str(4 * 1024 * 1024 * 1024)))
+
+NO_TUMOR = "notumor"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+
+class VolumeError(ValueError):
+    """The upload is not a readable volume or series."""
+
+
+def sniff_format(path):
+    """'nifti', 'zip', 'tar', 'gzip' or 'dicom' from the file's magic bytes."""
+    with open(path, "rb") as f:
+        head = f.read(544)
+    if head[:2] == b"\x1f\x8b":
+        return "gzip"
+    if head[:4] == b"PK\x03\x04":
+        return "zip"
+    if head[257:262] == b"ustar":
+        return "tar"
+    if head[344:348] in (b"n+1\x00", b"ni1\x00") or head[4:8] == b"n+2\x00":
+        return "nifti"
+    if head[128:132] == b"DICM":
+        return "dicom"
+    return None
+
+
+def open_volume(path, workdir):
+    """A NiftiVolume or DicomSeries for the upload at `path`; temporary files go in `workdir`."""
+    kind = sniff_format(path)
+    if kind == "gzip":
+        # Decompressed to disk once so the volume can be memory-mapped rather than inflated in RAM
+        inflated = os.path.join(workdir, "inflated")
+        try:
+            with gzip.open(path, "rb") as src, open(inflated, "wb") as dst:
+                written = 0
+                while True:
+                    chunk = src.read(COPY_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > VOLUME_MAX_INFLATED_BYTES:
+                        raise VolumeError(f"Volume inflates to more than {VOLUME_MAX_INFLATED_BYTES} bytes")
+                    dst.write(chunk)
+        except (OSError, EOFError) as e:
+            raise VolumeError(f"Invalid gzip file: {str(e)}")
+        os.remove(path)
+        path, kind = inflated, sniff_format(inflated)
+    if kind == "nifti":
+        # nibabel picks its reader from the extension
+        os.rename(path, path + ".nii")
+        return NiftiVolume(path + ".nii")
+    if kind in ("zip", "tar"):
+        return DicomSeries(path, kind)
+    if kind == "dicom":
+        raise VolumeError("Upload a DICOM series as a zip or tar archive of its slices")
+    raise VolumeError("Unrecognised volume format (expected NIfTI, or a zip/tar DICOM series)")
+
+
+class NiftiVolume:
+    """Axial slices of a NIfTI-1/2 file, read through nibabel's memory-mapped array proxy.
+
+    Only the requested slices are read from disk; the volume is never loaded whole.
+    """
+
+    format = "nifti"
+    default_window = None
+
+    def __init__(self, path):
+        import nibabel as nib
+
+        try:
+            image = nib.load(path, mmap=True)
+        except Exception as e:
+            raise VolumeError(f"Invalid NIfTI file: {str(e)}")
+        if len(image.shape) < 3:
+            raise VolumeError(f"Expected a 3D volume, got shape {image.shape}")
+        self.proxy = image.dataobj
+        self.shape = tuple(int(d) for d in image.shape)
+        codes = nib.aff2axcodes(image.affine)
+        # The superior-inferior voxel axis; acquisitions without a usable affine fall back to the last one
+        self.axis = next((i for i, code in enumerate(codes[:3]) if code in ("S", "I")), 2)
+        self.depth = self.shape[self.axis]
+
+    def read(self, indices):
+        """(n, H, W) float32 slices for a `range` of axial indices, in display orientation."""
+        index = [slice(None)] * 3 + [0] * (len(self.shape) - 3)  # first volume of a 4D series
+        index[self.axis] = slice(indices.start, indices.stop, indices.step)
+        data = np.asarray(self.proxy[tuple(index)], dtype=np.float32)
+        return np.rot90(np.moveaxis(data, self.axis, 0), axes=(1, 2))
+
+    def close(self):
+        self.proxy = None
+
+
+class DicomSeries:
+    """One DICOM series from a zip or tar archive, ordered along the slice normal.
+
+    Headers are read once (without pixel data) to order the slices; pixel
+    data is read only for the slices requested.
+    """
+
+    format = "dicom"
+
+    def __init__(self, path, kind):
+        import pydicom
+
+        self._pydicom = pydicom
+        try:
+            self.archive = zipfile.ZipFile(path) if kind == "zip" else tarfile.open(path, "r:*")
+        except (zipfile.BadZipFile, tarfile.TarError) as e:
+            raise VolumeError(f"Invalid {kind} archive: {str(e)}")
+        names = self.archive.namelist() if kind == "zip" else [m.name for m in self.archive.getmembers() if m.isfile()]
+
+        headers = []
+        for name in names:
+            if name.endswith("/") or os.path.basename(name).startswith("."):
+                continue
+            try:
+                with self._open(name) as f:
+                    header = pydicom.dcmread(f, stop_before_pixels=True)
+            except pydicom.errors.InvalidDicomError:
+                continue
+            if "Rows" in header:
+                headers.append((name, header))
+        if not headers:
+            raise VolumeError("No DICOM images found in archive")
+
+        # Largest series wins when an archive holds several (e.g. a localiser)
+        series, _ = Counter(h.get("SeriesInstanceUID") for _, h in headers).most_common(1)[0]
+        headers = [(name, h) for name, h in headers if h.get("SeriesInstanceUID") == series]
+        headers.sort(key=lambda item: _slice_position(item[1]))
+        self.names = [name for name, _ in headers]
+        first = headers[0][1]
+        self.shape = (len(self.names), int(first.Rows), int(first.Columns))
+        self.axis = 0
+        self.depth = len(self.names)
+        self.default_window = _dicom_window(first)
+
+    def _open(self, name):
+        if isinstance(self.archive, zipfile.ZipFile):
+            return self.archive.open(name)
+        return self.archive.extractfile(name)
+
+    def read(self, indices):
+        slices = []
+        for k in indices:
+            with self._open(self.names[k]) as f:
+                dataset = self._pydicom.dcmread(f)
+            try:
+                pixels = dataset.pixel_array.astype(np.float32)
+            except Exception as e:
+                raise VolumeError(f"Could not decode DICOM pixel data in {self.names[k]}: {str(e)}")
+            if pixels.shape != self.shape[1:]:
+                raise VolumeError(f"Slice {self.names[k]} is {pixels.shape}, expected {self.shape[1:]}")
+            slope, intercept = float(dataset.get("RescaleSlope", 1)), float(dataset.get("RescaleIntercept", 0))
+            if slope != 1 or intercept != 0:
+                pixels = pixels * slope + intercept
+            slices.append(pixels)
+        return np.stack(slices)
+
+    def close(self):
+        self.archive.close()
+
+
+def _slice_position(header):
+    # Distance along the slice normal, the only reliable order; InstanceNumber otherwise
+    position, orientation = header.get("ImagePositionPatient"), header.get("ImageOrientationPatient")
+    if position is not None and orientation is not None:
+        normal = np.cross(np.asarray(orientation[:3], dtype=float), np.asarray(orientation[3:], dtype=float))
+        return float(np.dot(normal, np.asarray(position, dtype=float)))
+    return float(header.get("InstanceNumber", 0))
+
+
+def _dicom_window(header):
+    center, width = header.get("WindowCenter"), header.get("WindowWidth")
+    if center is None or width is None:
+        return None
+    center, width = _first(center), _first(width)
+    return center - width / 2, center + width / 2
+
+
+def _first(value):
+    # Multi-valued when the modality suggests several windows; the first is the default
+    return float(value[0] if isinstance(value, Sequence) and not isinstance(value, str) else value)
+
+
+def select_slices(depth, start=None, stop=None, stride=None, max_slices=VOLUME_MAX_SLICES):
+    """The axial indices to classify, as a range; the stride defaults to fitting `max_slices`."""
+    selected = range(depth)[slice(start, stop)]
+    if stride is None:
+        stride = max(1, math.ceil(len(selected) / max_slices))
+    if stride < 1:
+        raise VolumeError("stride must be >= 1")
+    return selected[::stride]
+
+
+def window_bounds(volume, selected, window=None):
+    """(low, high) intensities mapped to 0..255: explicit, from the file, or from percentiles."""
+    if window is not None:
+        center, width = window
+        return center - width / 2, center + width / 2
+    if volume.default_window is not None:
+        return volume.default_window
+    # Percentiles over a sparse sample of the selected slices rather than the whole volume
+    sample = volume.read(selected[::max(1, len(selected) // 8)])[:, ::4, ::4]
+    low, high = np.percentile(sample, VOLUME_WINDOW_PERCENTILES)
+    return float(low), float(max(high, low + 1e-6))
+
+
+def apply_window(slices, low, high):
+    """Map a (n, H, W) float32 stack (modified in place) to uint8 over the whole batch at once."""
+    slices -= low
+    slices *= 255.0 / (high - low)
+    np.clip(slices, 0, 255, out=slices)
+    return slices.astype(np.uint8)
+
+
+def aggregate(probabilities, method=VOLUME_AGGREGATE, top_k=VOLUME_TOP_K, threshold=VOLUME_TUMOR_THRESHOLD):
+    """Study-level label from (n, classes) slice probabilities.
+
+    "topk" scores each class by the mean of its k highest slice
+    probabilities, so a tumor visible on a few slices is not outvoted by the
+    many slices that do not show it; the study is `notumor` unless a tumor
+    class scores at least `threshold`. "mean" is the plain average.
+    """
+    if method not in AGGREGATE_METHODS:
+        raise ValueError(f"Unknown aggregate method '{method}'")
+    votes = Counter(CLASS_LABELS[i] for i in probabilities.argmax(axis=1))
+    if method == "mean":
+        scores = probabilities.mean(axis=0)
+        class_index = int(scores.argmax())
+    else:
+        k = min(top_k, len(probabilities))
+        scores = np.sort(probabilities, axis=0)[-k:].mean(axis=0)
+        tumor = [i for i, label in enumerate(CLASS_LABELS) if label != NO_TUMOR]
+        class_index = max(tumor, key=lambda i: scores[i])
+        if scores[class_index] < threshold:
+            class_index = CLASS_LABELS.index(NO_TUMOR)
+    return {
+        "result": CLASS_LABELS[class_index],
+        "confidence": float(scores[class_index]),
+        "method": method,
+        "scores": {label: float(score) for label, score in zip(CLASS_LABELS, scores)},
+        "slice_votes": dict(votes),
+    }
+
+
+def predict_volume(volume, selected, window=None, batch_size=None, aggregate_method=None):
+    """Classify the `selected` axial slices of `volume` in batches.
+
+    Each batch is read (only those slices), windowed as one array, resized
+    on the preprocessing pool into a pooled input tensor and run in one
+    classifier call. Returns (per-slice results, study result, window).
+    """
+    batch_size = batch_size or VOLUME_BATCH_SIZE
+    engine = get_engine()
+    low, high = window_bounds(volume, selected, window)
+
+    slices, kept = [], []
+    for offset in range(0, len(selected), batch_size):
+        indices = selected[offset:offset + batch_size]
+        with stage("volume_read"):
+            stack = volume.read(indices)
+        with stage("window"):
+            pixels = apply_window(stack, low, high)
+            foreground = (pixels > 0).mean(axis=(1, 2))
+        keep = [i for i in range(len(indices)) if foreground[i] >= VOLUME_MIN_FOREGROUND]
+        for i in range(len(indices)):
+            if foreground[i] < VOLUME_MIN_FOREGROUND:
+                slices.append({"slice": indices[i], "skipped": True})
+        if not keep:
+            continue
+
+        with buffer_pool.borrow(batch_size) as buffer:
+            with stage("preprocess"):
+                for future in preprocess_async([pixels[i] for i in keep], buffer, preprocess_gray_into):
+                    future.result()
+            with stage("onnx_run", model="classifier"):
+                probabilities = engine.predict_batch(buffer[:len(keep)])
+        for i, row in zip(keep, probabilities):
+            class_index = int(np.argmax(row))
+            slices.append({
+                "slice": indices[i],
+                "result": CLASS_LABELS[class_index],
+                "confidence": float(row[class_index]),
+                "probabilities": {label: float(p) for label, p in zip(CLASS_LABELS, row)},
+            })
+            kept.append(row)
+
+    slices.sort(key=lambda s: s["slice"])
+    study = aggregate(np.stack(kept), aggregate_method or VOLUME_AGGREGATE) if kept else None
+    return slices, study, (low, high)
@@ -0,0 +1,134 @@
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# "background" (warm subsystems in a daemon thread once the app is built, default),
+# "eager" (warm them before the app module finishes importing) or "off" (first use only)
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "background").lower()
+# Subsystems that must be warm before /readyz reports ready
+READY_SUBSYSTEMS = [s.strip() for s in os.getenv("READY_SUBSYSTEMS", "classifier").split(",") if s.strip()]
+# Subsystems to warm at startup: only the required ones unless operators list more (or "all")
+WARMUP_SUBSYSTEMS = os.getenv("WARMUP_SUBSYSTEMS", ",".join(READY_SUBSYSTEMS))
+# Failed required subsystems are retried this often by the warmup thread
+WARMUP_RETRY_SECONDS = float(os.getenv("WARMUP_RETRY_SECONDS", "30"))
+
+
+class Subsystem:
+    """A heavy dependency with an idempotent loader and its warmup state."""
+
+    def __init__(self, name, loader):
+        self.name = name
+        self.loader = loader
+        self.state = "cold"
+        self.error = None
+        self.seconds = None
+        self._lock = threading.Lock()
+
+    def warm(self):
+        """Run the loader once; returns True when the subsystem is ready."""
+        if self.state == "ready":
+            return True
+        with self._lock:
+            if self.state == "ready":
+                return True
+            self.state = "warming"
+            start = time.perf_counter()
+            try:
+                self.loader()
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                logger.warning(f"Warmup of '{self.name}' failed: {str(e)}")
+                return False
+            self.state, self.error = "ready", None
+            self.seconds = round(time.perf_counter() - start, 3)
+            logger.info(f"Subsystem '{self.name}' warm in {self.seconds:.2f}s")
+            return True
+
+    def mark_ready(self):
+        """Loaded by its first use rather than by `warm()`."""
+        if self.state != "ready":
+            self.state, self.error = "ready", None
+
+    def view(self):
+        return {"state": self.state, "seconds": self.seconds, "error": self.error}
+
+
+_subsystems = {}
+_warmup_thread = None
+_warmup_lock = threading.Lock()
+_started_at = time.time()
+
+
+def register_subsystem(name, loader):
+    """Declare a lazily loaded dependency; `loader` must be safe to call repeatedly."""
+    _subsystems[name] = Subsystem(name, loader)
+
+
+def warm(name):
+    return _subsystems[name].warm()
+
+
+def mark_ready(name):
+    """Called by the lazy getters once they have loaded, so /readyz shows subsystems
+    warmed by traffic (e.g. with STARTUP_WARMUP=off) as ready. Unknown names are ignored."""
+    subsystem = _subsystems.get(name)
+    if subsystem is not None:
+        subsystem.mark_ready()
+
+
+def _selected():
+    if WARMUP_SUBSYSTEMS.strip().lower() == "all":
+        names = list(_subsystems)
+    else:
+        names = [n.strip() for n in WARMUP_SUBSYSTEMS.split(",") if n.strip() in _subsystems]
+    # Required subsystems first so readiness is reached as early as possible
+    required = [n for n in READY_SUBSYSTEMS if n in _subsystems]
+    return required + [n for n in names if n not in required]
+
+
+def warm_all():
+    for name in _selected():
+        warm(name)
+
+
+def _warmup_loop():
+    warm_all()
+    while True:
+        failed = [n for n in READY_SUBSYSTEMS if n in _subsystems and _subsystems[n].state == "failed"]
+        if not failed:
+            return
+        time.sleep(WARMUP_RETRY_SECONDS)
+        for name in failed:
+            warm(name)
+
+
+def start_warmup(mode=None):
+    """Warm the selected subsystems according to STARTUP_WARMUP (once per process)."""
+    global _warmup_thread
+    mode = (mode or STARTUP_WARMUP).lower()
+    if mode == "off":
+        return
+    if mode == "eager":
+        warm_all()
+        return
+    with _warmup_lock:
+        if _warmup_thread is None:
+            _warmup_thread = threading.Thread(target=_warmup_loop, name="subsystem-warmup", daemon=True)
+            _warmup_thread.start()
+
+
+def readiness():
+    """(ready, per-subsystem state). With warmup off everything loads on first use,
+    so readiness does not wait for any subsystem; each one still turns "ready"
+    once traffic has loaded it (see `mark_ready`)."""
+    subsystems = {name: s.view() for name, s in _subsystems.items()}
+    required = [n for n in READY_SUBSYSTEMS if n in _subsystems]
+    ready = STARTUP_WARMUP == "off" or all(_subsystems[n].state == "ready" for n in required)
+    return ready, {"ready": ready, "required": required, "subsystems": subsystems}
+
+
+def liveness():
+    return {"status": "ok", "uptime_seconds": round(time.time() - _started_at, 1)}